@@ -0,0 +1,396 @@
+import os
+import json
+import time
+import uuid
+import queue
+import random
+import socket
+import logging
+import threading
+import collections
+import redis
+from django.conf import settings
+from django.db import close_old_connections
+from .alert_notifier import build_alert_deliveries, post_webhook
+from .webhook_client import webhook_client, CircuitOpenError
+
+logger = logging.getLogger('log')
+
+# 把到期的重试任务移回告警流，多个进程同时执行时每个任务只会被移动一次
+_MOVE_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[3], '*', 'job', job)
+end
+return #due
+"""
+
+# 记录一次告警触发：窗口内第一次触发的任务成为窗口的首个告警，返回 1；之后的触发只计数并保留部分命令示例，返回 0
+# 首个告警的任务重试时仍返回 1
+_OPEN_WINDOW_SCRIPT = """
+local leader = redis.call('HGET', KEYS[1], 'leader')
+if not leader then
+    redis.call('HSET', KEYS[1], 'leader', ARGV[1], 'count', 1, 'last', ARGV[5])
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if leader == ARGV[1] then
+    return 1
+end
+redis.call('HINCRBY', KEYS[1], 'count', 1)
+redis.call('HSET', KEYS[1], 'last', ARGV[5])
+if redis.call('LLEN', KEYS[2]) < tonumber(ARGV[4]) then
+    redis.call('RPUSH', KEYS[2], ARGV[3])
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+end
+return 0
+"""
+
+# 关闭聚合窗口，返回窗口内的触发次数、告警历史ID、最后触发时间和命令示例
+_CLOSE_WINDOW_SCRIPT = """
+local values = redis.call('HMGET', KEYS[1], 'count', 'history', 'last')
+local samples = redis.call('LRANGE', KEYS[2], 0, -1)
+redis.call('DEL', KEYS[1], KEYS[2])
+return {values[1], values[2], values[3], samples}
+"""
+
+
+class AlertDispatcher:
+    """
+    告警分发队列
+
+    1. 检查到告警时只把任务放入进程内队列，由转发线程批量写入 Redis 流，终端会话不等待通知发送
+    2. 各进程的分发线程以消费组方式读取 Redis 流：告警任务记录告警历史，并为每个联系人生成一条通知任务；
+       通知任务发送 Webhook，各联系人的通知相互独立地发送和重试
+    3. 失败的任务按指数退避放入重试集合，到期后移回 Redis 流；达到最大次数后写入死信流
+    4. 分发线程退出时未确认的任务，空闲超时后由其他分发线程接管
+    5. 统计入队、发送成功、失败、重试和死信数量，以及从入队到发送成功的延迟
+    6. Webhook 请求复用进程内的连接池，熔断的 Webhook 不发送请求，任务推迟到冷却结束后重试
+    7. 规则设置了聚合窗口时，同一规则、用户和主机在窗口内的重复触发只在 Redis 中计数：
+       第一次触发立即通知并记录告警历史，窗口结束时更新该条告警历史的触发次数和命令示例，并发送一条汇总通知
+    8. 告警任务记录告警历史和生成通知后把进度保存在 Redis 中，按任务ID区分，
+       任务重试或被其他分发线程接管时复用已记录的告警历史，已生成的通知不再重复生成
+    """
+
+    def __init__(self, config):
+        self.stream = config['STREAM']                  # 待处理任务的 Redis 流
+        self.group = config['GROUP']                    # 分发线程的消费组
+        self.retry_key = config['RETRY_KEY']            # 等待重试的任务，按到期时间排序
+        self.dead_letter = config['DEAD_LETTER_STREAM'] # 最终失败的任务
+        self.workers = config['WORKERS']
+        self.max_attempts = config['MAX_ATTEMPTS']
+        self.backoff_base = config['BACKOFF_BASE']
+        self.backoff_max = config['BACKOFF_MAX']
+        self.claim_idle = config['CLAIM_IDLE']
+        self.stream_maxlen = config['STREAM_MAXLEN']
+        self.dead_letter_maxlen = config['DEAD_LETTER_MAXLEN']
+        self.timeout = config['TIMEOUT']
+        self.local_max = config['LOCAL_MAX']
+        self.aggregate_prefix = config['AGGREGATE_PREFIX']  # 聚合窗口计数的 Redis 键前缀
+        self.aggregate_samples = config['AGGREGATE_SAMPLES']
+        self.job_state_prefix = config['JOB_STATE_PREFIX']  # 告警任务执行进度的 Redis 键前缀
+        self.job_state_ttl = config['JOB_STATE_TTL']
+
+        self._local = queue.SimpleQueue()   # 尚未写入 Redis 的任务
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._redis = None
+        self._consumer_prefix = f'{socket.gethostname()}-{os.getpid()}'
+
+        # 统计信息
+        self._stats_lock = threading.Lock()
+        self.counters = collections.Counter()
+        self.latencies = collections.deque(maxlen=1000)  # 最近发送成功的通知从入队到送达的耗时(秒)
+
+    def enqueue(self, command_alert_id, command, username, host_id, hostname=None, window=0):
+        """
+        提交告警任务（不阻塞，不访问网络和数据库）
+
+        Args:
+            command_alert_id: 触发的告警规则ID
+            command: 命令
+            username: 用户名
+            host_id: 主机ID
+            hostname: 主机名，为空时由分发线程查询
+            window: 规则的聚合窗口(秒)，0 表示不聚合
+        """
+        if not self._started:
+            self.start()
+        self._local.put({
+            'id': uuid.uuid4().hex,
+            'kind': 'alert',
+            'attempt': 0,
+            'created': time.time(),
+            'data': {
+                'command_alert_id': command_alert_id,
+                'command': command,
+                'username': username,
+                'host_id': str(host_id),
+                'hostname': hostname,
+                'window': window,
+            },
+        })
+        self._count('enqueued')
+
+    def start(self):
+        """启动转发、分发和调度线程"""
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._forward_loop, name='alert-forward', daemon=True).start()
+        for index in range(self.workers):
+            threading.Thread(target=self._worker_loop, args=(index,), name=f'alert-dispatch-{index}', daemon=True).start()
+        threading.Thread(target=self._schedule_loop, name='alert-schedule', daemon=True).start()
+
+    def _get_redis(self):
+        if self._redis is None:
+            self._redis = redis.StrictRedis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
+                db=settings.REDIS_DB,
+                decode_responses=True
+            )
+        return self._redis
+
+    def _count(self, name, value=1):
+        with self._stats_lock:
+            self.counters[name] += value
+
+    def _add_jobs(self, client, jobs):
+        pipe = client.pipeline(transaction=False)
+        for job in jobs:
+            pipe.xadd(self.stream, {'job': json.dumps(job)}, maxlen=self.stream_maxlen, approximate=True)
+        pipe.execute()
+
+    def _forward_loop(self):
+        """把进程内队列中的任务批量写入 Redis 流，Redis 不可用时保留在内存中重试"""
+        pending = []
+        while True:
+            if not pending:
+                pending.append(self._local.get())
+            while len(pending) < 500:
+                try:
+                    pending.append(self._local.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._add_jobs(self._get_redis(), pending)
+                pending = []
+            except redis.RedisError as e:
+                if len(pending) > self.local_max:
+                    dropped = len(pending) - self.local_max
+                    pending = pending[dropped:]
+                    self._count('dropped', dropped)
+                    logger.error(f"Redis 不可用，丢弃 {dropped} 条最早的告警任务")
+                logger.warning(f"告警任务写入 Redis 失败，稍后重试: {str(e)}")
+                time.sleep(1)
+
+    def _ensure_group(self, client):
+        try:
+            client.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def _worker_loop(self, index):
+        consumer = f'{self._consumer_prefix}-{index}'
+        while True:
+            try:
+                client = self._get_redis()
+                self._ensure_group(client)
+                while True:
+                    # 每次只取一个任务，取到的任务不会因排在慢任务之后而空闲超时被其他线程接管
+                    response = client.xreadgroup(self.group, consumer, {self.stream: '>'}, count=1, block=1000)
+                    for _, messages in response or []:
+                        for message_id, fields in messages:
+                            self._process(client, message_id, fields)
+            except Exception as e:
+                logger.warning(f"读取告警任务失败，稍后重试: {str(e)}")
+                time.sleep(1)
+
+    def _schedule_loop(self):
+        """把到期的重试任务移回告警流，并接管空闲超时的未确认任务"""
+        consumer = f'{self._consumer_prefix}-schedule'
+        next_claim = 0
+        while True:
+            try:
+                client = self._get_redis()
+                move_due = client.register_script(_MOVE_DUE_SCRIPT)
+                self._ensure_group(client)
+                while True:
+                    move_due(keys=[self.retry_key, self.stream], args=[time.time(), 100, self.stream_maxlen])
+                    if time.monotonic() >= next_claim:
+                        next_claim = time.monotonic() + self.claim_idle / 2
+                        self._claim_idle(client, consumer)
+                    time.sleep(0.2)
+            except Exception as e:
+                logger.warning(f"调度告警重试任务失败，稍后重试: {str(e)}")
+                time.sleep(1)
+
+    def _claim_idle(self, client, consumer):
+        start_id = '0-0'
+        while True:
+            response = client.xautoclaim(self.stream, self.group, consumer,
+                                         min_idle_time=int(self.claim_idle * 1000), start_id=start_id, count=100)
+            start_id, messages = response[0], response[1]
+            for message_id, fields in messages:
+                if fields:
+                    logger.warning(f"接管空闲超时的告警任务: {message_id}")
+                    self._process(client, message_id, fields)
+            if start_id == '0-0':
+                return
+
+    def _process(self, client, message_id, fields):
+        """执行一个任务，成功、重试或进入死信后都从告警流中确认并删除"""
+        try:
+            job = json.loads(fields['job'])
+        except (KeyError, ValueError):
+            logger.error(f"无效的告警任务: {message_id} {fields}")
+            job = None
+        if job is not None:
+            try:
+                self._run(client, job)
+            except Exception as e:
+                self._fail(client, job, e)
+        pipe = client.pipeline(transaction=False)
+        pipe.xack(self.stream, self.group, message_id)
+        pipe.xdel(self.stream, message_id)
+        pipe.execute()
+
+    def _run(self, client, job):
+        if job['kind'] == 'alert':
+            data = job['data']
+            window = data.get('window') or 0
+            if window:
+                keys = self._window_keys(data)
+                opened = client.register_script(_OPEN_WINDOW_SCRIPT)(
+                    keys=keys, args=[job['id'], window + 60, data['command'], self.aggregate_samples, time.time()])
+                if not opened:
+                    self._count('suppressed')
+                    return
+            # 任务 ID 在重试移回告警流、被其他分发线程接管时都不变，按它记录执行进度
+            state_key = f"{self.job_state_prefix}:{job['id']}"
+            state = client.hgetall(state_key)
+            close_old_connections()
+            history_id, deliveries = build_alert_deliveries(
+                data['command_alert_id'], data['command'], data['username'], data['host_id'], data['hostname'],
+                history_id=state.get('history') and int(state['history']))
+            if history_id is not None and 'history' not in state:
+                pipe = client.pipeline(transaction=False)
+                pipe.hset(state_key, 'history', history_id)
+                pipe.expire(state_key, self.job_state_ttl)
+                pipe.execute()
+            if 'queued' not in state:
+                self._add_deliveries(client, job, deliveries)
+                client.hset(state_key, 'queued', 1)
+            if window:
+                # 窗口结束时汇总，任务放入重试集合，到期后由调度线程移回告警流
+                client.hset(keys[0], 'history', history_id)
+                summary = {
+                    'id': f"{job['id']}-aggregate",
+                    'kind': 'aggregate',
+                    'attempt': 0,
+                    'created': job['created'] + window,
+                    'data': data,
+                }
+                client.zadd(self.retry_key, {json.dumps(summary): job['created'] + window})
+            self._count('alerts')
+        elif job['kind'] == 'aggregate':
+            data = job['data']
+            if 'count' not in data:
+                # 关闭窗口后结果保存在任务中，任务重试时不再读取 Redis
+                count, history_id, last_time, samples = client.register_script(_CLOSE_WINDOW_SCRIPT)(
+                    keys=self._window_keys(data))
+                data.update(count=int(count or 0), history_id=history_id and int(history_id),
+                            last_time=last_time and float(last_time), samples=samples)
+            if data['count'] > 1 and data['history_id']:
+                close_old_connections()
+                _, deliveries = build_alert_deliveries(
+                    data['command_alert_id'], data['command'], data['username'], data['host_id'], data['hostname'],
+                    data['count'], data['samples'], data['last_time'], data['history_id'])
+                self._add_deliveries(client, job, deliveries)
+                self._count('aggregated')
+        elif job['kind'] == 'webhook':
+            delivery = job['data']
+            post_webhook(delivery['notify_type'], delivery['webhook'], delivery['payload'], self.timeout)
+            self.latencies.append(time.time() - job['created'])
+            self._count('delivered')
+
+    def _window_keys(self, data):
+        """聚合窗口的计数和命令示例的 Redis 键，按规则、用户和主机区分"""
+        key = f"{self.aggregate_prefix}:{data['command_alert_id']}:{data['username']}:{data['host_id']}"
+        return [key, f'{key}:samples']
+
+    def _add_deliveries(self, client, job, deliveries):
+        """为每个联系人的通知生成一条 Webhook 任务"""
+        if deliveries:
+            self._add_jobs(client, [{
+                'id': f"{job['id']}-{index}",
+                'kind': 'webhook',
+                'attempt': 0,
+                'created': job['created'],
+                'data': delivery,
+            } for index, delivery in enumerate(deliveries)])
+
+    def _fail(self, client, job, error):
+        """任务失败：按指数退避重试，达到最大次数后写入死信流"""
+        self._count('failed')
+        job['attempt'] += 1
+        job['error'] = str(error)
+        target = job['data'].get('contact') or job['data'].get('command_alert_id')
+        if job['attempt'] >= self.max_attempts:
+            client.xadd(self.dead_letter, {'job': json.dumps(job), 'failed_at': time.time()},
+                        maxlen=self.dead_letter_maxlen, approximate=True)
+            self._count('dead_lettered')
+            logger.error(f"告警任务失败 {job['attempt']} 次，已写入死信: {target}, 错误: {str(error)}")
+            return
+        delay = min(self.backoff_base * 2 ** (job['attempt'] - 1), self.backoff_max) * random.uniform(0.8, 1.2)
+        if isinstance(error, CircuitOpenError):
+            # Webhook 熔断期间不发送请求，等到冷却结束后再尝试
+            self._count('short_circuited')
+            delay = max(delay, error.retry_after * random.uniform(1, 1.2))
+        client.zadd(self.retry_key, {json.dumps(job): time.time() + delay})
+        self._count('retried')
+        logger.warning(f"告警任务失败，{delay:.1f} 秒后第 {job['attempt'] + 1} 次尝试: {target}, 错误: {str(error)}")
+
+    def get_stats(self):
+        """
+        获取分发统计信息
+
+        Returns:
+            dict: enqueued、alerts、delivered、failed、retried、dead_lettered 等分发计数，计数为 0 时不列出；
+                  latency 送达延迟(秒)的 count/avg/p50/p95/p99/max，local_queue 本地队列长度，
+                  webhooks 熔断器状态，stream 待分发任务数，retrying 等待重试数，dead_letter 死信数，
+                  Redis 不可用时 error 为错误信息
+        """
+        with self._stats_lock:
+            stats = dict(self.counters)
+        latencies = sorted(self.latencies)
+        if latencies:
+            stats['latency'] = {
+                'count': len(latencies),
+                'avg': round(sum(latencies) / len(latencies), 4),
+                'p50': round(latencies[len(latencies) // 2], 4),
+                'p95': round(latencies[int(len(latencies) * 0.95)], 4),
+                'p99': round(latencies[int(len(latencies) * 0.99)], 4),
+                'max': round(latencies[-1], 4),
+            }
+        stats['local_queue'] = self._local.qsize()
+        stats['webhooks'] = webhook_client.get_stats()
+        try:
+            client = self._get_redis()
+            pipe = client.pipeline(transaction=False)
+            pipe.xlen(self.stream)
+            pipe.zcard(self.retry_key)
+            pipe.xlen(self.dead_letter)
+            stats['stream'], stats['retrying'], stats['dead_letter'] = pipe.execute()
+        except redis.RedisError as e:
+            stats['error'] = str(e)
+        return stats
+
+
+# 进程内共享的告警分发队列
+alert_dispatcher = AlertDispatcher(settings.ALERT_DISPATCH)
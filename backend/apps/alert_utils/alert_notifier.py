@@ -1,12 +1,13 @@
 import requests
 import logging
 import json
+from datetime import datetime
 from apps.models import AlertContact, CommandAlert, Host, AlertHistoryLog
-from asgiref.sync import sync_to_async
+from .webhook_client import webhook_client, AlertDeliveryError, redact_url, parse_platform_error
 
 logger = logging.getLogger('log')
 
-def get_dingtalk_message(username, hostname, host_ip, command, command_alert):
+def get_dingtalk_message(username, hostname, host_ip, command, command_alert, repeat=''):
     """钉钉消息模板"""
     return f"""## 🚨 命令告警通知
 ---
@@ -17,7 +18,7 @@ def get_dingtalk_message(username, hostname, host_ip, command, command_alert):
 - 🖥️ 执行主机：**{hostname}** (IP: {host_ip})
 - 🔍 匹配类型：**{'精准匹配' if command_alert.match_type == 'exact' else '模糊匹配'}**
 - 🛠️ 执行命令：`{command}`
-- 🚫 是否告警：**{'是' if command_alert.is_active else '否'}**
+{repeat}- 🚫 是否告警：**{'是' if command_alert.is_active else '否'}**
 - ⚠️ 触发规则：**{command_alert.name}**
   - 规则详情：`{command_alert.command_rule}`
 
@@ -26,7 +27,7 @@ def get_dingtalk_message(username, hostname, host_ip, command, command_alert):
 *此为自动告警，请勿回复。*
 """
 
-def get_wecom_message(username, hostname, host_ip, command, command_alert):
+def get_wecom_message(username, hostname, host_ip, command, command_alert, repeat=''):
     """企业微信消息模板"""
     return f"""## 🚨 命令告警通知
 检测到潜在的敏感操作，请及时关注！
@@ -35,7 +36,7 @@ def get_wecom_message(username, hostname, host_ip, command, command_alert):
 > 🖥️ 执行主机：<font color="">{hostname}</font> (IP: {host_ip})
 > 🔍 匹配类型：<font color="">{'精准匹配' if command_alert.match_type == 'exact' else '模糊匹配'}</font>
 > 🛠️ 执行命令：<font color="info">{command}</font>
-> 🚫 是否告警：{'是' if command_alert.is_active else '否'}
+{repeat}> 🚫 是否告警：{'是' if command_alert.is_active else '否'}
 > ⚠️ 触发规则：<font color="">{command_alert.name}</font>
     > 规则详情：<font color="">{command_alert.command_rule}</font>
 
@@ -44,7 +45,7 @@ def get_wecom_message(username, hostname, host_ip, command, command_alert):
 *此为自动告警，请勿回复。*
 """
 
-def get_feishu_message(username, hostname, host_ip, command, command_alert):
+def get_feishu_message(username, hostname, host_ip, command, command_alert, repeat=''):
     """飞书消息模板"""
     return f"""**检测到潜在的敏感操作，请及时关注！**
 ---
@@ -53,7 +54,7 @@ def get_feishu_message(username, hostname, host_ip, command, command_alert):
 - 🖥️ 执行主机：<font color=''>{hostname}</font> (IP: {host_ip})
 - 🔍 匹配类型：<font color=''>{'精准匹配' if command_alert.match_type == 'exact' else '模糊匹配'}</font>
 - 🛠️ 执行命令：<font color='red'>{command}</font>
-- 🚫 是否告警：{'是' if command_alert.is_active else '否'}
+{repeat}- 🚫 是否告警：{'是' if command_alert.is_active else '否'}
 - ⚠️ 触发规则：<font color=''>{command_alert.name}</font>
     - 规则详情：{command_alert.command_rule}
     
@@ -61,99 +62,144 @@ def get_feishu_message(username, hostname, host_ip, command, command_alert):
 *此为自动告警，请勿回复。*
 """
 
-@sync_to_async
-def send_alert_notification(command_alert_id, command, username, hostname):
+def get_repeat_line(prefix, count, samples, window):
+    """聚合窗口内重复触发的说明，插入在执行命令之后"""
+    if count <= 1:
+        return ''
+    line = f"{prefix}🔁 重复触发：{window} 秒内共 {count} 次"
+    if samples:
+        line += "，命令示例：" + "、".join(f"`{sample}`" for sample in samples)
+    return line + "\n"
+
+
+def build_alert_deliveries(command_alert_id, command, username, host_id, hostname,
+                           count=1, samples=(), last_time=None, history_id=None):
+    """
+    记录告警历史，并生成发给各告警联系人的通知（阻塞调用，在告警分发线程中执行）
+
+    聚合窗口结束时传入窗口开始时记录的告警历史ID、窗口内的触发次数和命令示例，
+    更新该条告警历史，生成的通知为窗口内重复触发的汇总；告警任务重试时传入已记录的告警历史ID，不再新建
+
+    Args:
+        count: 触发次数
+        samples: 重复触发的命令示例
+        last_time: 最后触发的时间戳
+        history_id: 已记录的告警历史ID，为空时新建，触发次数大于 1 时更新
+
+    Returns:
+        tuple: (告警历史ID, 通知列表)，每个联系人一条通知 {'contact', 'notify_type', 'webhook', 'payload'}
+    """
     try:
         command_alert = CommandAlert.objects.get(id=command_alert_id)
-        host = Host.objects.get(name=hostname)
-        alert_contact_ids = command_alert.alert_contacts.split(',')
-        alert_contacts = AlertContact.objects.filter(id__in=alert_contact_ids)
-
-        # 记录告警历史
-        AlertHistoryLog.objects.create(
+    except CommandAlert.DoesNotExist:
+        logger.error(f"未找到ID为 {command_alert_id} 的命令告警规则")
+        return history_id, []
+    host = Host.objects.filter(id=host_id).first()
+    host_ip = host.network if host else ''
+    if hostname is None:
+        hostname = host.name if host else ''
+    alert_contact_ids = [contact_id for contact_id in (command_alert.alert_contacts or '').split(',') if contact_id]
+    alert_contacts = AlertContact.objects.filter(id__in=alert_contact_ids)
+
+    # 记录告警历史，聚合窗口结束时更新窗口开始时的记录
+    if history_id is None:
+        history_id = AlertHistoryLog.objects.create(
             username=username,
             hostname=hostname,
             match_type='精准匹配' if command_alert.match_type == 'exact' else '模糊匹配',
             command=command,
             alert_rule=command_alert.name,
+        ).id
+    elif count > 1:
+        AlertHistoryLog.objects.filter(id=history_id).update(
+            count=count,
+            sample_commands=json.dumps(list(samples), ensure_ascii=False),
+            last_time=datetime.fromtimestamp(last_time) if last_time else None,
         )
-        
-        for contact in alert_contacts:
-            webhook_url = contact.webhook
-            notify_type = contact.notify_type
-
-            logger.info(f"准备发送告警通知到 {notify_type}")
-            logger.debug(f"Webhook URL: {webhook_url}")
-
-            try:
-                if notify_type == '钉钉':
-                    message = get_dingtalk_message(username, hostname, host.network, command, command_alert)
-                    payload = {
-                        "msgtype": "markdown",
-                        "markdown": {
-                            "title": "🚨 命令告警通知",
-                            "text": message
+
+    deliveries = []
+    for contact in alert_contacts:
+        notify_type = contact.notify_type
+        if notify_type == '钉钉':
+            message = get_dingtalk_message(username, hostname, host_ip, command, command_alert,
+                                           get_repeat_line('- ', count, samples, command_alert.suppress_window))
+            payload = {
+                "msgtype": "markdown",
+                "markdown": {
+                    "title": "🚨 命令告警通知",
+                    "text": message
+                },
+                "at": {
+                    "isAtAll": True
+                }
+            }
+        elif notify_type == '企微':
+            message = get_wecom_message(username, hostname, host_ip, command, command_alert,
+                                        get_repeat_line('> ', count, samples, command_alert.suppress_window))
+            payload = {
+                "msgtype": "markdown",
+                "markdown": {
+                    "content": message
+                }
+            }
+        elif notify_type == '飞书':
+            message = get_feishu_message(username, hostname, host_ip, command, command_alert,
+                                         get_repeat_line('- ', count, samples, command_alert.suppress_window))
+            payload = {
+                "msg_type": "interactive",
+                "card": {
+                    "elements": [{
+                        "tag": "markdown",
+                        "content": message
+                    }],
+                    "header": {
+                        "title": {
+                            "content": "🚨 命令告警通知",
+                            "tag": "plain_text"
                         },
-                        "at": {
-                            "isAtAll": True
-                        }
-                    }
-                elif notify_type == '企微':
-                    message = get_wecom_message(username, hostname, host.network, command, command_alert)
-                    payload = {
-                        "msgtype": "markdown",
-                        "markdown": {
-                            "content": message
-                        }
+                        "template": "red"
                     }
-                elif notify_type == '飞书':
-                    message = get_feishu_message(username, hostname, host.network, command, command_alert)
-                    payload = {
-                        "msg_type": "interactive",
-                        "card": {
-                            "elements": [{
-                                "tag": "markdown",
-                                "content": message
-                            }],
-                            "header": {
-                                "title": {
-                                    "content": "🚨 命令告警通知",
-                                    "tag": "plain_text"
-                                },
-                                "template": "red"
-                            }
-                        }
-                    }
-
-                logger.debug(f"请求载荷: {json.dumps(payload, ensure_ascii=False, indent=2)}")
-                response = requests.post(webhook_url, json=payload, timeout=10)
-                logger.debug(f"响应状态码: {response.status_code}")
-                logger.debug(f"响应内容: {response.text}")
-
-                if response.status_code == 200:
-                    response_json = response.json()
-                    logger.info(f"成功发送告警通知到 {notify_type}")
-                    logger.debug(f"响应详情: {json.dumps(response_json, ensure_ascii=False, indent=2)}")
-                    
-                    if notify_type == '企微':
-                        if response_json.get('errcode') == 0:
-                            logger.info("企业微信通知发送成功")
-                        else:
-                            logger.error(f"企业微信通知发送失败: {response_json.get('errmsg', '未知错误')}")
-                else:
-                    logger.error(f"发送告警通知到 {notify_type} 失败: HTTP {response.status_code}")
-                    logger.error(f"错误响应: {response.text}")
-
-            except requests.exceptions.Timeout:
-                logger.error(f"发送告警通知到 {notify_type} 超时")
-            except requests.exceptions.RequestException as e:
-                logger.error(f"发送告警通知到 {notify_type} 时发生网络错误: {str(e)}")
-            except json.JSONDecodeError:
-                logger.error(f"解析 {notify_type} 响应JSON失败: {response.text}")
+                }
+            }
+        else:
+            logger.warning(f"不支持的通知类型: {notify_type}，联系人: {contact.name}")
+            continue
+        deliveries.append({
+            'contact': contact.name,
+            'notify_type': notify_type,
+            'webhook': contact.webhook,
+            'payload': payload,
+        })
+    return history_id, deliveries
+
+
+def post_webhook(notify_type, webhook_url, payload, timeout=10):
+    """
+    发送一条告警通知（阻塞调用）
+
+    Raises:
+        AlertDeliveryError: 网络错误、超时、HTTP 状态码非 200，或平台返回错误码
+        CircuitOpenError: Webhook 已熔断，未发送请求
+    """
+    logger.info(f"准备发送告警通知到 {notify_type}")
+    logger.debug(f"Webhook URL: {redact_url(webhook_url)}")
+    logger.debug(f"请求载荷: {json.dumps(payload, ensure_ascii=False, indent=2)}")
 
-    except CommandAlert.DoesNotExist:
-        logger.error(f"未找到ID为 {command_alert_id} 的命令告警规则")
-    except Host.DoesNotExist:
-        logger.error(f"未找到主机名为 {hostname} 的主机")
-    except Exception as e:
-        logger.error(f"发送告警通知时发生错误: {str(e)}")
+    try:
+        response = webhook_client.post(webhook_url, payload, timeout)
+    except requests.exceptions.Timeout:
+        raise AlertDeliveryError(f"发送告警通知到 {notify_type} 超时")
+    except requests.exceptions.RequestException as e:
+        raise AlertDeliveryError(f"发送告警通知到 {notify_type} 时发生网络错误: {str(e)}")
+
+    logger.debug(f"响应状态码: {response.status_code}")
+    logger.debug(f"响应内容: {response.text}")
+    if response.status_code != 200:
+        raise AlertDeliveryError(f"发送告警通知到 {notify_type} 失败: HTTP {response.status_code} {response.text[:200]}")
+
+    error_code, error_message = parse_platform_error(response)
+    if error_code is None:
+        raise AlertDeliveryError(f"解析 {notify_type} 响应JSON失败: {error_message}")
+    if error_code:
+        raise AlertDeliveryError(f"{notify_type}通知发送失败: {error_code} {error_message}")
+    logger.info(f"成功发送告警通知到 {notify_type}")
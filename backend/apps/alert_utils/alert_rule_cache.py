@@ -0,0 +1,273 @@
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from apps.models import CommandAlert, Host, Node
+from apps.utils import get_node_children, get_node_subtree
+from .rule_matcher import RuleMatcher, EMPTY_MATCHER, required_literals, check_pattern
+from .regex_sandbox import RegexSandbox
+
+logger = logging.getLogger('log')
+
+
+class CompiledRule:
+    """预先解析和编译的告警规则"""
+
+    __slots__ = ('id', 'name', 'match_type', 'suppress_window', 'action', 'commands', 'patterns', 'literals')
+
+    def __init__(self, alert):
+        self.id = alert.id
+        self.name = alert.name
+        self.match_type = alert.match_type
+        self.suppress_window = alert.suppress_window  # 告警聚合窗口(秒)
+        self.action = alert.action                    # 触发动作: alert 仅告警, block 阻断执行
+        self.commands = frozenset()  # 精确匹配的命令
+        self.patterns = ()           # 模糊匹配的正则表达式
+        self.literals = ()           # 每个正则必然出现的字面量，见 required_literals
+
+        try:
+            command_rules = json.loads(alert.command_rule) if alert.command_rule else []
+        except json.JSONDecodeError:
+            logger.error(f"解析命令规则失败: {alert.command_rule}")
+            command_rules = []
+        if not isinstance(command_rules, list):
+            command_rules = [command_rules]
+
+        if alert.match_type == 'exact':
+            self.commands = frozenset(rule for rule in command_rules if isinstance(rule, str))
+        elif alert.match_type == 'fuzzy':
+            patterns = []
+            for rule in command_rules:
+                try:
+                    patterns.append(re.compile(str(rule).strip()))
+                except re.error as e:
+                    logger.error(f"告警规则 {alert.name} 的正则表达式无效: {rule}, 错误: {str(e)}")
+                    continue
+                # 校验前保存的规则仍然加载，执行超时由 RegexSandbox 降级
+                risk = check_pattern(str(rule).strip())
+                if risk:
+                    logger.warning(f"告警规则 {alert.name} 的正则表达式 {rule}: {risk}")
+            self.patterns = tuple(patterns)
+            self.literals = tuple(required_literals(pattern) for pattern in patterns)
+
+
+class AlertRuleCache:
+    """
+    进程内命令告警规则缓存
+
+    1. 启用的规则一次性加载，按主机ID建立规则匹配器，规则在加载时解析和编译，检查命令时不访问数据库；
+       模糊匹配的正则在 RegexSandbox 的子进程中执行
+    2. 规则变更后由模型信号在本进程内重新加载，并通过 Redis 发布通知，其他进程收到后重新加载
+    3. 重新加载在后台线程中完成后整体替换索引，加载期间检查命令继续使用旧的索引
+    4. Redis 不可用时按刷新间隔定期重新加载，保证规则最终生效
+    5. 阻断执行的规则另外按主机建立匹配器，终端回车时只检查这些规则
+    """
+
+    def __init__(self, channel, refresh_interval):
+        self.channel = channel                      # 规则变更通知的 Redis 频道
+        self.refresh_interval = refresh_interval    # 定期重新加载的间隔(秒)
+        self.instance_id = uuid.uuid4().hex         # 本进程的标识，忽略自己发布的通知
+
+        self._by_host = {}                # 主机ID -> 该主机的规则匹配器
+        self._blocking_by_host = {}       # 主机ID -> 该主机阻断执行规则的匹配器，没有阻断规则的主机不在其中
+        self._loaded = False
+        self._stale = threading.Event()   # 规则已变更，等待重新加载
+        self._lock = threading.Lock()
+        self._started = False
+        self._redis = None
+
+        # 统计信息
+        self.reloads = 0
+        self.last_reload = None
+        self.rule_count = 0
+
+    def get_matcher(self, host_id):
+        """获取主机的规则匹配器（不访问数据库）"""
+        return self._by_host.get(str(host_id), EMPTY_MATCHER)
+
+    def get_blocking_matcher(self, host_id):
+        """获取主机阻断执行规则的匹配器（不访问数据库），没有阻断规则时为 None"""
+        return self._blocking_by_host.get(str(host_id))
+
+    async def ensure_loaded(self):
+        """首次使用时加载规则并启动后台线程，之后不再访问数据库"""
+        if not self._loaded:
+            await sync_to_async(self.load)()
+        self.start()
+
+    def load(self):
+        """从数据库加载启用的规则并替换索引（阻塞调用）"""
+        with self._lock:
+            rules = {alert.id: CompiledRule(alert)
+                     for alert in CommandAlert.objects.filter(is_active=True).order_by('id')}
+
+            # 主机ID -> 规则ID集合，关联表按规则批量读取，不逐条查询
+            rule_ids = {}
+            host_links = CommandAlert.hosts.through.objects.filter(commandalert__is_active=True)
+            for rule_id, host_id in host_links.values_list('commandalert_id', 'host_id'):
+                rule_ids.setdefault(str(host_id), set()).add(rule_id)
+
+            # 关联节点的规则作用于节点子树下的所有主机
+            node_links = CommandAlert.nodes.through.objects.filter(commandalert__is_active=True)
+            node_rules = {}
+            for rule_id, node_id in node_links.values_list('commandalert_id', 'node_id'):
+                node_rules.setdefault(node_id, set()).add(rule_id)
+            if node_rules:
+                children = get_node_children()
+                subtree_rules = {}
+                for node_id, node_rule_ids in node_rules.items():
+                    for subtree_node_id in get_node_subtree([node_id], children):
+                        subtree_rules.setdefault(subtree_node_id, set()).update(node_rule_ids)
+                hosts = Host.objects.filter(node_id__in=subtree_rules).values_list('id', 'node_id')
+                for host_id, node_id in hosts:
+                    rule_ids.setdefault(str(host_id), set()).update(subtree_rules[node_id])
+
+            # 规则相同的主机共用一个匹配器，规则按ID排序
+            by_host, blocking_by_host, matchers = {}, {}, {}
+            for host_id, ids in rule_ids.items():
+                key = tuple(sorted(ids))
+                blocking_key = tuple(rule_id for rule_id in key if rules[rule_id].action == 'block')
+                for matcher_key in (key, blocking_key):
+                    if matcher_key not in matchers:
+                        matchers[matcher_key] = RuleMatcher(
+                            [rules[rule_id] for rule_id in matcher_key], regex_sandbox.search, regex_sandbox.search_async)
+                by_host[host_id] = matchers[key]
+                if blocking_key:
+                    blocking_by_host[host_id] = matchers[blocking_key]
+            self._by_host = by_host
+            self._blocking_by_host = blocking_by_host
+            self._loaded = True
+            self.rule_count = len(rules)
+            self.reloads += 1
+            self.last_reload = time.time()
+        if any(rule.patterns for rule in rules.values()):
+            regex_sandbox.start()
+        logger.debug(f"已加载 {self.rule_count} 条命令告警规则")
+
+    def start(self):
+        """启动重新加载和订阅通知的后台线程"""
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._refresh_loop, name='alert-rule-refresh', daemon=True).start()
+        threading.Thread(target=self._subscribe_loop, name='alert-rule-subscribe', daemon=True).start()
+
+    def invalidate(self):
+        """标记规则已变更，由后台线程重新加载"""
+        self._stale.set()
+        if not self._started:
+            # 本进程尚未使用过规则，下次使用时直接加载
+            self._loaded = False
+
+    def notify_changed(self):
+        """规则已变更：本进程重新加载，并通知其他进程"""
+        self.invalidate()
+        try:
+            self._get_redis().publish(self.channel, self.instance_id)
+        except redis.RedisError as e:
+            logger.warning(f"发布告警规则变更通知失败: {str(e)}")
+
+    def _get_redis(self):
+        if self._redis is None:
+            self._redis = redis.StrictRedis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
+                db=settings.REDIS_DB
+            )
+        return self._redis
+
+    def _refresh_loop(self):
+        while True:
+            self._stale.wait(self.refresh_interval)
+            self._stale.clear()
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"重新加载命令告警规则失败: {str(e)}")
+                time.sleep(1)
+
+    def _subscribe_loop(self):
+        while True:
+            try:
+                pubsub = self._get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # 订阅中断期间可能错过通知，重新订阅后重新加载一次
+                self._stale.set()
+                for message in pubsub.listen():
+                    if message.get('data') != self.instance_id.encode():
+                        self._stale.set()
+            except Exception as e:
+                logger.warning(f"订阅告警规则变更通知失败，稍后重试: {str(e)}")
+            time.sleep(5)
+
+    def get_stats(self):
+        """
+        获取缓存统计信息
+
+        Returns:
+            dict: rules 启用的规则数，hosts 有规则的主机数，blocking_hosts 有阻断规则的主机数，
+                  reloads 加载次数，last_reload 最近加载时间(时间戳)，patterns 正则执行统计，见 RegexSandbox.get_stats
+        """
+        return {
+            'rules': self.rule_count,
+            'hosts': len(self._by_host),
+            'blocking_hosts': len(self._blocking_by_host),
+            'reloads': self.reloads,
+            'last_reload': self.last_reload,
+            'patterns': regex_sandbox.get_stats(),
+        }
+
+
+# 进程内共享的模糊匹配正则执行进程
+regex_sandbox = RegexSandbox(settings.COMMAND_ALERT['PATTERN_TIMEOUT'], settings.COMMAND_ALERT['PATTERN_DEGRADE_SECONDS'])
+
+# 进程内共享的告警规则缓存
+alert_rule_cache = AlertRuleCache(
+    settings.COMMAND_ALERT['RULE_CHANNEL'],
+    settings.COMMAND_ALERT['RULE_REFRESH_INTERVAL'],
+)
+
+
+# 规则变更提交后通知所有进程重新加载
+@receiver([post_save, post_delete], sender=CommandAlert)
+def _invalidate_alert_rules(sender, instance, **kwargs):
+    transaction.on_commit(alert_rule_cache.notify_changed)
+
+
+# 规则关联的主机或节点变更
+@receiver(m2m_changed, sender=CommandAlert.hosts.through)
+@receiver(m2m_changed, sender=CommandAlert.nodes.through)
+def _invalidate_alert_links(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(alert_rule_cache.notify_changed)
+
+
+# 节点树变化会改变关联节点的规则作用的主机
+@receiver([post_save, post_delete], sender=Node)
+def _invalidate_node_tree(sender, instance, **kwargs):
+    transaction.on_commit(alert_rule_cache.notify_changed)
+
+
+@receiver(post_init, sender=Host)
+def _remember_host_node(sender, instance, **kwargs):
+    instance._loaded_node_id = instance.node_id
+
+
+# 只有新增主机或主机移动节点时需要重新加载，主机状态等字段的更新不影响规则；已删除主机的规则不会再被使用
+@receiver(post_save, sender=Host)
+def _invalidate_host_node(sender, instance, created, **kwargs):
+    if created or instance.node_id != instance._loaded_node_id:
+        instance._loaded_node_id = instance.node_id
+        transaction.on_commit(alert_rule_cache.notify_changed)
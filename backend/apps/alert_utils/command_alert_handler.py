@@ -1,51 +1,41 @@
-from apps.models import CommandAlert, Host
-from asgiref.sync import sync_to_async
-from .alert_notifier import send_alert_notification
-import re
+from .alert_dispatcher import alert_dispatcher
+from .alert_rule_cache import alert_rule_cache
 import logging
-import json
 
 # 获取日志记录器实例
 logger = logging.getLogger('log')
 
-async def check_command_alert(host_id, command, username):
-    try:
-        logger.debug(f"开始检查命令告警: 主机ID={host_id}, 命令={command}")
-        host = await sync_to_async(Host.objects.get)(id=host_id)
-        logger.debug(f"获取到主机: {host.name}")
-        
-        alerts = await sync_to_async(list)(CommandAlert.objects.filter(hosts__contains=str(host.id), is_active=True))
-        logger.debug(f"找到 {len(alerts)} 个相关的告警规则")
-        
-        for alert in alerts:
-            logger.debug(f"检查告警规则: {alert.name}, 匹配类型: {alert.match_type}")
-            try:
-                command_rules = json.loads(alert.command_rule)
-            except json.JSONDecodeError:
-                logger.error(f"解析命令规则失败: {alert.command_rule}")
-                continue
+async def check_command_alert(host_id, command, username, hostname=None):
+    """
+    检查命令是否触发告警，触发时发送告警通知
 
-            if not isinstance(command_rules, list):
-                command_rules = [command_rules]
+    规则来自进程内缓存，告警通知只入队，不访问数据库和网络。
 
-            logger.debug(f"解析后的命令规则: {command_rules}")
+    Args:
+        host_id: 主机ID
+        command: 命令
+        username: 用户名
+        hostname: 主机名，为空时由分发队列查询
 
-            if alert.match_type == 'exact':
-                logger.debug(f"精确匹配规则: {command_rules}")
-                if command in command_rules:
-                    logger.warning(f"命令 '{command}' 触发了精确匹配告警: {alert.name}")
-                    await send_alert_notification(alert.id, command, username, host.name)
-                    return True
-            elif alert.match_type == 'fuzzy':
-                logger.debug(f"模糊匹配规则: {command_rules}")
-                for pattern in command_rules:
-                    if re.search(pattern.strip(), command):
-                        logger.warning(f"命令 '{command}' 触发了模糊匹配告警: {alert.name}")
-                        await send_alert_notification(alert.id, command, username, host.name)
-                        return True
-        
-        logger.debug(f"命令 '{command}' 未触发任何告警")
-        return False
+    Returns:
+        bool: 是否触发告警
+    """
+    try:
+        await alert_rule_cache.ensure_loaded()
+        matched, undetermined = await alert_rule_cache.get_matcher(host_id).match_async(command)
+        if undetermined:
+            names = ', '.join(rule.name for rule in undetermined)
+            logger.warning(f"命令 '{command}' 是否触发告警规则无法确定（正则执行超时或已降级）: {names}")
+        if not matched:
+            return False
+
+        # 多条规则匹配时按规则顺序取第一条告警
+        rule = matched[0]
+        match_name = '精确匹配' if rule.match_type == 'exact' else '模糊匹配'
+        logger.warning(f"命令 '{command}' 触发了{match_name}告警: {rule.name}")
+        # 告警通知由分发队列在后台聚合和发送，这里只入队
+        alert_dispatcher.enqueue(rule.id, command, username, host_id, hostname, rule.suppress_window)
+        return True
     except Exception as e:
         logger.error(f"检查命令告警时发生错误: {str(e)}")
         return False
@@ -0,0 +1,249 @@
+import re
+import time
+import asyncio
+import logging
+import threading
+import collections
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('log')
+
+
+# 等待子进程启动的时间(秒)，启动时间不计入正则的时间预算
+STARTUP_TIMEOUT = 10
+
+
+def _serve(conn, progress):
+    """
+    子进程：依次执行正则，每匹配一个立即发送其序号，全部执行完后发送 None；
+    执行前记录序号，超时后父进程据此找出超时的正则，之前发送的结果仍然有效
+    """
+    compiled = {}
+    conn.send(None)  # 已就绪
+    while True:
+        try:
+            command, patterns = conn.recv()
+        except EOFError:
+            return
+        for index, key in enumerate(patterns):
+            progress.value = index
+            pattern = compiled.get(key)
+            if pattern is None:
+                pattern = compiled[key] = re.compile(*key)
+            if pattern.search(command):
+                conn.send(index)
+        conn.send(None)
+
+
+class RegexSandbox:
+    """
+    在子进程中执行模糊匹配的正则，每次执行有硬性的时间预算
+
+    1. CPython 的正则匹配不释放 GIL，也不能被中断，一个灾难性回溯的正则会卡住整个事件循环；
+       正则在子进程中执行，超时后结束子进程
+    2. 超时前已执行的正则结果保留，超时的正则结果为无法确定，之后的正则在新的子进程中继续执行，
+       调用方据此区分"未匹配"和"无法确定"（阻断规则无法确定时拒绝执行）
+    3. 超时的正则降级 degrade_seconds 秒，期间不再执行，结果为无法确定；到期后重新执行，
+       降级的正则记录在统计信息中
+    4. 异步调用 search_async 时在专用线程中等待子进程，不阻塞事件循环
+    5. 子进程由 forkserver 创建，结束后立即在后台重新创建；无法创建子进程时在当前线程执行
+    """
+
+    def __init__(self, timeout, degrade_seconds=600):
+        self.timeout = timeout                  # 子进程每次执行的时间预算(秒)
+        self.degrade_seconds = degrade_seconds  # 超时的正则降级的时间(秒)
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context('forkserver')
+            # forkserver 预先导入本模块，之后创建子进程只需 fork
+            self._context.set_forkserver_preload([__name__])
+        else:
+            self._context = multiprocessing.get_context('spawn')
+        self._process = None
+        self._conn = None
+        self._progress = None       # 子进程正在执行的正则序号
+        self._ready = False         # 子进程是否已就绪
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='alert-regex')
+
+        self.degraded = {}          # (正则, 标志) -> 降级时间
+        self.counters = collections.Counter()
+        self.latencies = collections.deque(maxlen=1000)  # 最近执行的耗时(秒)
+
+    def start(self):
+        """在后台提前创建子进程，避免第一次检查命令时等待"""
+        self._executor.submit(self._start)
+
+    def _start(self):
+        with self._lock:
+            try:
+                self._ensure_process()
+            except Exception as e:
+                logger.error(f"创建正则执行进程失败: {str(e)}")
+
+    def _spawn(self):
+        """创建子进程，不等待就绪"""
+        parent_conn, child_conn = self._context.Pipe()
+        progress = self._context.Value('i', -1, lock=False)
+        process = self._context.Process(target=_serve, args=(child_conn, progress), name='alert-regex', daemon=True)
+        process.start()
+        child_conn.close()
+        self._process, self._conn, self._progress = process, parent_conn, progress
+        self._ready = False
+        self.counters['processes'] += 1
+
+    def _ensure_process(self):
+        """确保子进程已就绪，等待启动的时间不计入正则的时间预算"""
+        if self._process is not None and not self._process.is_alive():
+            self._stop_process()
+        if self._process is None:
+            self._spawn()
+        if self._ready:
+            return
+        if not self._conn.poll(STARTUP_TIMEOUT):
+            self._stop_process()
+            raise OSError("正则执行进程启动超时")
+        self._conn.recv()
+        self._ready = True
+
+    def _stop_process(self):
+        self._process.kill()
+        self._process.join()
+        self._conn.close()
+        self._process = self._conn = self._progress = None
+        self._ready = False
+
+    def _restart_process(self):
+        """结束超时的子进程并立即创建新的子进程，新进程在下一次执行前启动完成"""
+        self._stop_process()
+        try:
+            self._spawn()
+        except Exception as e:
+            logger.error(f"创建正则执行进程失败: {str(e)}")
+
+    async def search_async(self, command, patterns):
+        """在专用线程中执行 search，事件循环不等待子进程"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.search, command, patterns)
+
+    def search(self, command, patterns):
+        """
+        执行正则，跳过已降级的正则（阻塞调用，事件循环中使用 search_async）
+
+        Args:
+            command: 命令
+            patterns: 已编译的正则列表
+
+        Returns:
+            tuple: (匹配的正则序号, 无法确定是否匹配的正则序号)，超时和降级的正则无法确定
+        """
+        now = time.time()
+        candidates, undetermined = [], []
+        for index, pattern in enumerate(patterns):
+            key = (pattern.pattern, pattern.flags)
+            since = self.degraded.get(key)
+            if since is not None and now - since < self.degrade_seconds:
+                undetermined.append(index)
+                continue
+            if since is not None:
+                # 降级到期，重新执行
+                self.degraded.pop(key, None)
+            candidates.append((index, pattern))
+        matched = []
+        if candidates:
+            start = time.perf_counter()
+            with self._lock:
+                found, timed_out = self._search(command, candidates)
+            self.latencies.append(time.perf_counter() - start)
+            self.counters['searches'] += 1
+            matched += found
+            undetermined += timed_out
+        if undetermined:
+            self.counters['undetermined'] += 1
+        return matched, sorted(undetermined)
+
+    def _search(self, command, candidates):
+        """
+        在子进程中执行正则，超时后在新的子进程中继续执行超时的正则之后的正则
+
+        Returns:
+            tuple: (匹配的正则序号, 超时的正则序号)
+        """
+        matched, timed_out = [], []
+        while candidates:
+            try:
+                self._ensure_process()
+                self._progress.value = -1
+                self._conn.send((command, [(pattern.pattern, pattern.flags) for _, pattern in candidates]))
+                found, position = self._collect()
+            except (OSError, EOFError) as e:
+                logger.error(f"正则执行进程不可用，在当前线程执行: {str(e)}")
+                self.counters['inline'] += 1
+                if self._process is not None:
+                    self._stop_process()
+                matched += [index for index, pattern in candidates if pattern.search(command)]
+                break
+            matched += [candidates[found_position][0] for found_position in found]
+            if position is None:
+                break
+
+            # 超时：正在执行的正则未匹配时无法确定，降级；之后的正则在新的子进程中继续执行
+            index, pattern = candidates[position]
+            if position not in found:
+                timed_out.append(index)
+                self.degraded[(pattern.pattern, pattern.flags)] = time.time()
+                self.counters['timeouts'] += 1
+                logger.error(f"正则表达式执行超过 {self.timeout} 秒，降级 {self.degrade_seconds} 秒: "
+                             f"{pattern.pattern}, 命令: {command[:200]}")
+            candidates = candidates[position + 1:]
+        return matched, timed_out
+
+    def _collect(self):
+        """
+        接收子进程的执行结果，超时后结束子进程并创建新的子进程
+
+        Returns:
+            tuple: (匹配的位置列表, 超时时正在执行的位置，全部执行完成时为 None)
+        """
+        found = []
+        deadline = time.perf_counter() + self.timeout
+        while self._conn.poll(max(deadline - time.perf_counter(), 0)):
+            position = self._conn.recv()
+            if position is None:
+                return found, None
+            found.append(position)
+
+        position = max(self._progress.value, 0)
+        self._process.kill()
+        self._process.join()
+        # 结束前已发送的结果仍在管道中
+        try:
+            while self._conn.poll(0):
+                message = self._conn.recv()
+                if message is None:
+                    self._restart_process()
+                    return found, None
+                found.append(message)
+        except (OSError, EOFError):
+            pass
+        self._restart_process()
+        return found, position
+
+    def get_stats(self):
+        """
+        获取执行统计信息
+
+        Returns:
+            dict: processes 启动子进程次数，searches 检查命令次数，timeouts 超时次数，
+                  undetermined 有正则无法确定的命令数，inline 在当前线程执行的次数，计数为 0 时不列出；
+                  latency_ms 最近执行耗时的 avg/p99/max(毫秒)，degraded 已降级的正则
+        """
+        stats = dict(self.counters)
+        latencies = sorted(self.latencies)
+        if latencies:
+            stats['latency_ms'] = {
+                'avg': round(sum(latencies) / len(latencies) * 1000, 3),
+                'p99': round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+                'max': round(latencies[-1] * 1000, 3),
+            }
+        stats['degraded'] = [{'pattern': pattern, 'since': since} for (pattern, _), since in self.degraded.items()]
+        return stats
@@ -0,0 +1,461 @@
+import re
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# 不同字面量数量不超过该值时逐个做子串查找，超过后使用 Aho-Corasick 自动机
+AUTOMATON_THRESHOLD = 64
+
+# 模糊匹配规则的最大长度
+MAX_PATTERN_LENGTH = 1000
+
+# 重复次数（含外层量词次数的乘积）超过该值的量词按无上限处理
+LARGE_REPEAT = 10
+
+# 判断两个量词能否匹配相同字符时检查的字符: ASCII 以及常见的非 ASCII 字母和空白
+_PROBE_CHARS = [chr(code) for code in range(128)] + ['\u00a0', '\u00e9', '\u2028', '\u3000', '\u4e2d']
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+
+_CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT: str.isdigit,
+    sre_parse.CATEGORY_NOT_DIGIT: lambda char: not char.isdigit(),
+    sre_parse.CATEGORY_SPACE: str.isspace,
+    sre_parse.CATEGORY_NOT_SPACE: lambda char: not char.isspace(),
+    sre_parse.CATEGORY_WORD: lambda char: char.isalnum() or char == '_',
+    sre_parse.CATEGORY_NOT_WORD: lambda char: not (char.isalnum() or char == '_'),
+}
+
+
+def check_pattern(rule):
+    """
+    检查模糊匹配规则能否安全执行（保存规则时调用）
+
+    拒绝可能发生灾难性回溯的写法：
+    1. 量词内嵌套次数可变的量词，总重复次数（内外层次数的乘积）很大，且每次重复之间没有内层量词不能匹配的字面字符
+       （如 (a+)+、(\w+\s?)*、(.*,)*、(a{1,10}){1,10}，而 ( -\w+)* 是安全的）
+    2. 相邻的无上限量词可以匹配相同的字符（如 \s*\s*$、\d+\w+x），位于规则末尾时不会回溯，不拒绝
+    3. 无上限量词内可以匹配相同开头的分支（如 (a|ab)*），以及无上限量词内的反向引用
+    检查是保守的，少数不会回溯的写法也会被拒绝，需要改写
+
+    Args:
+        rule: 正则表达式字符串
+
+    Returns:
+        str: 不能保存的原因，可以保存时为 None
+    """
+    if len(rule) > MAX_PATTERN_LENGTH:
+        return f"正则表达式长度超过 {MAX_PATTERN_LENGTH} 个字符"
+    try:
+        parsed = sre_parse.parse(rule)
+    except re.error as e:
+        return f"正则表达式无效: {str(e)}"
+    return _backtracking_risk(list(parsed), 1, top=True)
+
+
+def _backtracking_risk(items, multiplier, top=False):
+    """
+    在语法树中查找可能灾难性回溯的结构，返回说明
+
+    Args:
+        items: 语法树序列
+        multiplier: 外层量词重复次数的乘积
+        top: 是否为整个规则的顶层序列
+    """
+    in_repeat = multiplier > LARGE_REPEAT
+    risk = _adjacent_risk(items, top)
+    if risk:
+        return risk
+    for op, av in items:
+        if op in _REPEATS:
+            sub = list(av[2])
+            if av[1] > 1:
+                count = multiplier * av[1]
+                for inner, total in _variable_repeats(sub, count):
+                    if total > LARGE_REPEAT and not _separated(sub, inner):
+                        return "量词内嵌套了次数可变的量词，总重复次数很大且每次重复之间没有分隔字符，可能导致灾难性回溯"
+            risk = _backtracking_risk(sub, multiplier * av[1])
+        elif op is sre_parse.SUBPATTERN:
+            risk = _backtracking_risk(list(av[3]), multiplier)
+        elif op is sre_parse.BRANCH:
+            branches = [list(branch) for branch in av[1]]
+            if in_repeat and _branches_overlap(branches):
+                return "无上限的量词内有可以匹配相同开头的分支，可能导致灾难性回溯"
+            risk = next(filter(None, (_backtracking_risk(branch, multiplier) for branch in branches)), None)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            risk = _backtracking_risk(list(av[1]), multiplier)
+        elif op is sre_parse.GROUPREF and in_repeat:
+            risk = "无上限的量词内不能使用反向引用"
+        else:
+            risk = None
+        if risk:
+            return risk
+    return None
+
+
+def _variable_repeats(items, multiplier):
+    """序列中（含分组和分支内）次数可变的量词，以及计入外层量词后的最大重复次数"""
+    for op, av in items:
+        if op in _REPEATS:
+            if av[0] < av[1]:
+                yield av, multiplier * av[1]
+            yield from _variable_repeats(list(av[2]), multiplier * av[1])
+        elif op is sre_parse.SUBPATTERN:
+            yield from _variable_repeats(list(av[3]), multiplier)
+        elif op is sre_parse.BRANCH:
+            for branch in av[1]:
+                yield from _variable_repeats(list(branch), multiplier)
+
+
+def _separated(items, repeat):
+    """序列中是否有必然出现、且内层量词不能匹配的字面字符，使每次重复的边界唯一"""
+    for op, av in items:
+        if op is sre_parse.LITERAL and not _can_match(list(repeat[2]), chr(av)):
+            return True
+        if op is sre_parse.SUBPATTERN and _separated(list(av[3]), repeat):
+            return True
+    return False
+
+
+def _adjacent_risk(items, top):
+    """
+    序列中相邻（中间只有可以匹配空串的项）的无上限量词能否匹配相同的字符，
+    同一段文本有多种分配方式，之后的匹配失败时逐一回溯。位于规则末尾时之后不会失败，不检查
+    """
+    flat = list(_flatten(items))
+    if top:
+        # 去掉末尾的无上限量词和可以重复 0 次的量词，它们之后没有会失败的项（$ 等断言会失败，保留）
+        while flat and flat[-1][0] in _REPEATS and (_is_wide(*flat[-1]) or flat[-1][1][0] == 0):
+            flat.pop()
+    run = []  # 之前相邻的无上限量词的字符集合
+    for op, av in flat:
+        if _is_wide(op, av):
+            chars = {char for char in _PROBE_CHARS if _can_match(list(av[2]), char)}
+            if any(chars & previous for previous in run):
+                return "相邻的无上限量词可以匹配相同的字符，可能导致灾难性回溯"
+            run = run + [chars] if av[0] == 0 else [chars]
+        elif not _matches_empty(op, av):
+            run = []
+    return None
+
+
+def _flatten(items):
+    """展开分组，得到按顺序匹配的项"""
+    for op, av in items:
+        if op is sre_parse.SUBPATTERN:
+            yield from _flatten(list(av[3]))
+        else:
+            yield op, av
+
+
+def _is_wide(op, av):
+    """次数可变且没有上限的量词"""
+    return op in _REPEATS and av[0] < av[1] and av[1] > LARGE_REPEAT
+
+
+def _matches_empty(op, av):
+    """该项是否可以不消耗字符（零宽断言、可以重复 0 次的量词）"""
+    return op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT) or (op in _REPEATS and av[0] == 0)
+
+
+def _can_match(items, char):
+    """序列中的某一项能否匹配字符（不确定时按能匹配处理）"""
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            matched = chr(av).lower() == char.lower()
+        elif op is sre_parse.NOT_LITERAL:
+            matched = chr(av) != char
+        elif op is sre_parse.IN:
+            matched = _in_set(av, char)
+        elif op in _REPEATS:
+            matched = _can_match(list(av[2]), char)
+        elif op is sre_parse.SUBPATTERN:
+            matched = _can_match(list(av[3]), char)
+        elif op is sre_parse.BRANCH:
+            matched = any(_can_match(list(branch), char) for branch in av[1])
+        elif op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            matched = False
+        else:
+            matched = True
+        if matched:
+            return True
+    return False
+
+
+def _in_set(av, char):
+    negate = False
+    matched = False
+    for op, value in av:
+        if op is sre_parse.NEGATE:
+            negate = True
+        elif op is sre_parse.LITERAL:
+            matched = matched or chr(value).lower() == char.lower()
+        elif op is sre_parse.RANGE:
+            matched = matched or value[0] <= ord(char) <= value[1] or value[0] <= ord(char.swapcase()) <= value[1]
+        elif op is sre_parse.CATEGORY:
+            matched = matched or _CATEGORIES.get(value, lambda c: True)(char)
+        else:
+            matched = True
+    return matched != negate
+
+
+def _branches_overlap(branches):
+    """分支是否可能以相同的字符开头：只有各分支都以不同的字面字符开头时才认为不重叠"""
+    firsts = []
+    for branch in branches:
+        if not branch or branch[0][0] is not sre_parse.LITERAL:
+            return True
+        firsts.append(branch[0][1])
+    return len(set(firsts)) < len(firsts)
+
+
+def required_literals(pattern):
+    """
+    提取正则表达式匹配时必然出现的字面量
+
+    Args:
+        pattern: 已编译的正则表达式
+
+    Returns:
+        tuple: (字面量列表, 是否忽略大小写)，命令中至少包含其中一个字面量时正则才可能匹配；
+               忽略大小写时字面量为小写。无法提取时字面量列表为 None
+    """
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None, False
+    literals = _best_literals(list(parsed))
+    if literals and parsed.state.flags & sre_parse.SRE_FLAG_IGNORECASE:
+        # 只处理 ASCII 字面量，与小写后的 ASCII 命令比较结果和正则一致
+        if not all(literal.isascii() for literal in literals):
+            return None, True
+        return [literal.lower() for literal in literals], True
+    return literals, False
+
+
+def _best_literals(items):
+    """在一个序列中选出最有区分度的字面量（各候选中最短字面量最长的一组）"""
+    best, run = None, []
+
+    def consider(candidate):
+        nonlocal best
+        if candidate and all(candidate) and (
+                best is None or min(map(len, candidate)) > min(map(len, best))):
+            best = candidate
+
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        consider([''.join(run)])
+        run = []
+        if op is sre_parse.SUBPATTERN:
+            _, add_flags, _, sub = av
+            if not add_flags & sre_parse.SRE_FLAG_IGNORECASE:
+                consider(_best_literals(list(sub)))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            consider(_best_literals(list(av[2])))
+        elif op is sre_parse.BRANCH:
+            branches = [_best_literals(list(branch)) for branch in av[1]]
+            if all(branches):
+                consider([literal for branch in branches for literal in branch])
+    consider([''.join(run)])
+    return best
+
+
+class LiteralAutomaton:
+    """Aho-Corasick 自动机，一次扫描找出文本中出现的所有字面量"""
+
+    def __init__(self, literals):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for index, literal in enumerate(literals):
+            state = 0
+            for char in literal:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state] += (index,)
+
+        # 按层次计算失败链接，并合并失败状态的输出
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] += self.output[self.fail[next_state]]
+
+    def search(self, text):
+        """
+        Returns:
+            set: 文本中出现的字面量序号
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class LiteralIndex:
+    """按字面量索引的正则，扫描一次文本找出需要执行的正则"""
+
+    def __init__(self):
+        self._patterns = {}     # 字面量 -> [(规则序号, 正则)]
+        self.literals = ()
+        self.patterns = ()
+        self.automaton = None
+
+    def add(self, literal, position, pattern):
+        self._patterns.setdefault(literal, []).append((position, pattern))
+
+    def freeze(self):
+        """添加完成后建立扫描结构"""
+        self.literals = tuple(self._patterns)
+        self.patterns = tuple(self._patterns.values())
+        if len(self.literals) > AUTOMATON_THRESHOLD:
+            self.automaton = LiteralAutomaton(self.literals)
+
+    def candidates(self, text):
+        """文本中出现了字面量的 (规则序号, 正则)"""
+        if self.automaton is not None:
+            found = self.automaton.search(text)
+        else:
+            found = [index for index, literal in enumerate(self.literals) if literal in text]
+        for index in found:
+            yield from self.patterns[index]
+
+    def __len__(self):
+        return len(self.literals)
+
+
+def search_inline(command, patterns):
+    """在当前线程执行正则，返回 (匹配的正则序号, 无法确定的正则序号)"""
+    return [index for index, pattern in enumerate(patterns) if pattern.search(command)], []
+
+
+class RuleMatcher:
+    """
+    一台主机的命令告警规则匹配器
+
+    1. 精确匹配规则合并为一个 命令 -> 规则 的哈希表，一次查找
+    2. 模糊匹配规则的每个正则提取必然出现的字面量，对命令做一次字面量扫描，
+       只执行字面量出现了的正则；无法提取字面量的正则每次都执行
+    3. 需要执行的正则一次交给 search 执行，见 RegexSandbox；事件循环中使用 match_async，正则不在事件循环中执行
+    4. match_exact 只做精确匹配和字面量过滤，不需要执行正则时调用方可以直接得出结果
+    5. 返回所有匹配的规则，以及正则超时或降级而无法确定是否匹配的规则，顺序与规则顺序一致
+    """
+
+    def __init__(self, rules, search=search_inline, search_async=None):
+        """
+        Args:
+            rules: 规则列表，每条规则提供 commands、patterns 和 literals
+            search: 执行正则的函数 search(command, patterns)，返回 (匹配的正则序号, 无法确定的正则序号)
+            search_async: search 的异步版本，为空时 match_async 直接调用 search
+        """
+        self.rules = tuple(rules)
+        self.search = search
+        self.search_async = search_async
+        self.exact = {}                         # 命令 -> 规则序号元组
+        self.unfiltered = []                    # 无法提取字面量的 (规则序号, 正则)
+        self.ignorecase_unfiltered = []         # 忽略大小写的 (规则序号, 正则)，命令含非 ASCII 字符时执行
+        self.index = LiteralIndex()             # 区分大小写的正则
+        self.ignorecase_index = LiteralIndex()  # 忽略大小写的正则，字面量为小写
+
+        for position, rule in enumerate(self.rules):
+            for command in rule.commands:
+                self.exact[command] = self.exact.get(command, ()) + (position,)
+            for pattern, (literals, ignorecase) in zip(rule.patterns, rule.literals):
+                if literals is None:
+                    self.unfiltered.append((position, pattern))
+                    continue
+                if ignorecase:
+                    self.ignorecase_unfiltered.append((position, pattern))
+                for literal in set(literals):
+                    (self.ignorecase_index if ignorecase else self.index).add(literal, position, pattern)
+
+        self.index.freeze()
+        self.ignorecase_index.freeze()
+
+    def match(self, command):
+        """
+        找出命令匹配的所有规则（阻塞调用，事件循环中使用 match_async）
+
+        Args:
+            command: 命令
+
+        Returns:
+            tuple: (匹配的规则, 无法确定是否匹配的规则)，按规则顺序排列
+        """
+        matched, pending = self._lookup(command)
+        if not pending:
+            return self._result(matched)
+        return self._result(matched, pending, self.search(command, [pattern for _, pattern in pending]))
+
+    async def match_async(self, command):
+        """找出命令匹配的所有规则，正则在 search_async 中执行，返回值同 match"""
+        matched, pending = self._lookup(command)
+        if not pending:
+            return self._result(matched)
+        patterns = [pattern for _, pattern in pending]
+        if self.search_async is not None:
+            searched = await self.search_async(command, patterns)
+        else:
+            searched = self.search(command, patterns)
+        return self._result(matched, pending, searched)
+
+    def match_exact(self, command):
+        """
+        只做精确匹配和字面量过滤，不执行正则
+
+        Returns:
+            tuple: (已匹配的规则, 是否还有需要执行的正则)
+        """
+        matched, pending = self._lookup(command)
+        return [self.rules[position] for position in sorted(matched)], bool(pending)
+
+    def _result(self, matched, pending=(), searched=((), ())):
+        """合并正则的执行结果，同一规则既有匹配又有无法确定的正则时按匹配处理"""
+        found, unknown = searched
+        matched = matched | {pending[index][0] for index in found}
+        undetermined = {pending[index][0] for index in unknown} - matched
+        return [self.rules[position] for position in sorted(matched)], \
+            [self.rules[position] for position in sorted(undetermined)]
+
+    def _lookup(self, command):
+        """
+        Returns:
+            tuple: (精确匹配的规则序号集合, 需要执行的 (规则序号, 正则) 列表)
+        """
+        matched = set(self.exact.get(command, ()))
+
+        candidates = [self.index.candidates(command), self.unfiltered]
+        if self.ignorecase_index:
+            if command.isascii():
+                candidates.append(self.ignorecase_index.candidates(command.lower()))
+            else:
+                candidates.append(self.ignorecase_unfiltered)
+
+        pending = [(position, pattern) for group in candidates for position, pattern in group
+                   if position not in matched]
+        return matched, pending
+
+    def __len__(self):
+        return len(self.rules)
+
+
+# 没有规则的主机共用的空匹配器
+EMPTY_MATCHER = RuleMatcher(())
@@ -0,0 +1,188 @@
+import time
+import hashlib
+import logging
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger('log')
+
+
+class AlertDeliveryError(Exception):
+    """告警通知发送失败，可重试"""
+
+
+class CircuitOpenError(AlertDeliveryError):
+    """Webhook 已熔断，未发送请求"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after  # 距离允许再次尝试的时间(秒)
+
+
+def redact_url(url):
+    """
+    Webhook 地址的路径和参数里带有令牌，日志中只保留协议和主机名，另附地址的摘要用于区分同一主机的不同 Webhook
+    """
+    parts = urlsplit(url)
+    digest = hashlib.sha256(url.encode('utf-8')).hexdigest()[:8]
+    return f"{parts.scheme}://{parts.hostname}#{digest}"
+
+
+def parse_platform_error(response):
+    """
+    解析通知平台在 HTTP 200 响应中返回的错误码
+
+    Returns:
+        tuple: (错误码, 错误信息)，错误码为 0 表示成功，响应不是 JSON 时错误码为 None
+    """
+    try:
+        response_json = response.json()
+    except ValueError:
+        return None, response.text[:200]
+    if not isinstance(response_json, dict):
+        return 0, ''
+    # 钉钉、企微返回 errcode，飞书返回 code（旧版为 StatusCode），0 表示成功
+    error_code = response_json.get('errcode', response_json.get('code', response_json.get('StatusCode', 0)))
+    error_message = response_json.get('errmsg') or response_json.get('msg') or '未知错误'
+    return error_code, error_message
+
+
+class CircuitBreaker:
+    """
+    单个 Webhook 地址的熔断器
+
+    1. 连续失败达到阈值后熔断，冷却时间内的请求直接失败，不占用分发线程
+    2. 冷却时间结束后只放行一个探测请求：成功则恢复，失败则重新熔断
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold  # 熔断前允许的连续失败次数
+        self.cooldown = cooldown    # 熔断后的冷却时间(秒)
+        self.failures = 0
+        self.opened_at = None       # 熔断时间，为空表示未熔断
+        self.probing = False        # 冷却结束后是否已有探测请求在进行
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half_open'
+
+    def allow(self):
+        """
+        Returns:
+            float: 0 表示可以发送请求，否则为距离可以再次尝试的时间(秒)
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return 0
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self.probing:
+                return self.cooldown
+            self.probing = True
+            return 0
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        """
+        Returns:
+            bool: 本次失败是否导致熔断
+        """
+        with self._lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                self.probing = False
+                return True
+            return False
+
+
+class WebhookClient:
+    """
+    进程内共享的 Webhook HTTP 客户端
+
+    1. 所有分发线程共用一个会话和连接池，同一平台的请求复用保持连接，不再每次建立 TCP 和 TLS 连接
+    2. 每个 Webhook 地址一个熔断器，请求异常、HTTP 状态码非 200 或平台返回错误码计为失败
+    """
+
+    def __init__(self, config):
+        self.breaker_threshold = config['BREAKER_THRESHOLD']
+        self.breaker_cooldown = config['BREAKER_COOLDOWN']
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=config['POOL_CONNECTIONS'], pool_maxsize=config['POOL_MAXSIZE'])
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._breakers = {}  # Webhook 地址 -> 熔断器
+        self._breakers_lock = threading.Lock()
+
+    def _get_breaker(self, url):
+        breaker = self._breakers.get(url)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self._breakers.setdefault(url, CircuitBreaker(self.breaker_threshold, self.breaker_cooldown))
+        return breaker
+
+    def post(self, url, payload, timeout):
+        """
+        发送 JSON 请求（阻塞调用）
+
+        Raises:
+            CircuitOpenError: Webhook 已熔断
+            requests.exceptions.RequestException: 网络错误或超时
+        """
+        breaker = self._get_breaker(url)
+        retry_after = breaker.allow()
+        if retry_after:
+            raise CircuitOpenError(f"Webhook 已熔断，{retry_after:.0f} 秒后重试", retry_after)
+
+        try:
+            response = self.session.post(url, json=payload, timeout=timeout)
+        except requests.exceptions.RequestException:
+            self._record_failure(breaker, url)
+            raise
+        # 令牌失效、被限流等情况平台仍返回 HTTP 200，需要看响应里的错误码
+        if response.status_code == 200 and parse_platform_error(response)[0] == 0:
+            breaker.record_success()
+        else:
+            self._record_failure(breaker, url)
+        return response
+
+    def _record_failure(self, breaker, url):
+        if breaker.record_failure():
+            logger.warning(f"Webhook 连续失败 {breaker.failures} 次，熔断 {breaker.cooldown} 秒: {redact_url(url)}")
+
+    def get_stats(self):
+        """
+        获取熔断器状态，只列出有失败记录的 Webhook
+
+        Returns:
+            dict: webhooks 请求过的 Webhook 数，failing 有失败记录的数量，
+                  open 其中熔断中（含半开）的数量
+        """
+        with self._breakers_lock:
+            breakers = list(self._breakers.values())
+        states = [breaker.state for breaker in breakers if breaker.failures]
+        return {
+            'webhooks': len(breakers),
+            'failing': len(states),
+            'open': states.count('open') + states.count('half_open'),
+        }
+
+
+# 进程内共享的 Webhook 客户端
+webhook_client = WebhookClient(settings.ALERT_DISPATCH)
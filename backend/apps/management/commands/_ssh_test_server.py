@@ -0,0 +1,101 @@
+import socket
+import threading
+from types import SimpleNamespace
+import paramiko
+
+# 测试 shell 的提示符
+PROMPT = b'bench@localhost:~$ '
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    """任意用户名和密码均可登录，允许打开 shell"""
+
+    def __init__(self, server):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_window_change_request(self, channel, width, height, pixelwidth, pixelheight):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        threading.Thread(target=self.server.shell, args=(channel,), daemon=True).start()
+        return True
+
+
+class LocalSSHServer:
+    """
+    基准测试用的本机 SSH 服务器
+
+    监听 127.0.0.1 的随机端口，任意密码均可登录；shell 先输出提示符，之后回显输入，
+    回车时换行并再次输出提示符，相当于一个什么命令都不执行的终端。
+    """
+
+    def __init__(self):
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(128)
+        self.port = self.sock.getsockname()[1]
+        self.transports = []
+        threading.Thread(target=self._serve, name='bench-sshd', daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=_ServerInterface(self))
+            self.transports.append(transport)
+
+    def shell(self, channel):
+        channel.send(PROMPT)
+        while True:
+            data = channel.recv(1024)
+            if not data:
+                return
+            channel.send(data.replace(b'\r', b'\r\n' + PROMPT))
+
+    def host(self):
+        """连接本服务器的主机和凭据，字段与 Host、Credential 模型一致"""
+        host = SimpleNamespace(name='bench', network='127.0.0.1', port=self.port)
+        credential = SimpleNamespace(id=0, type='密码', account='bench', password='bench', key=None, key_password=None)
+        return host, credential
+
+    def close(self):
+        self.sock.close()
+        for transport in self.transports:
+            transport.close()
+
+
+
+class BlackHoleServer:
+    """接受 TCP 连接但从不发送 SSH 版本信息，模拟无响应的主机；关闭后排队的连接被重置"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1024)
+        self.port = self.sock.getsockname()[1]
+
+    def host(self):
+        host = SimpleNamespace(name='blackhole', network='127.0.0.1', port=self.port)
+        credential = SimpleNamespace(id=-1, type='密码', account='bench', password='bench', key=None, key_password=None)
+        return host, credential
+
+    def close(self):
+        self.sock.close()
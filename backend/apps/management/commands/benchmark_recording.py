@@ -0,0 +1,73 @@
+import os
+import time
+import codecs
+import asyncio
+import tempfile
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.ssh_utils.session_recorder import SessionRecorder, RECORDING_SUFFIX
+from .benchmark_terminal_parser import build_stream
+
+
+class Command(BaseCommand):
+    help = '对比开启和关闭会话录像（asciicast 分段 gzip 写入）时每帧终端输出的开销'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=50, help='大量输出的大小(MB)')
+        parser.add_argument('--frame', type=int, default=4096, help='大量输出每帧的字节数')
+        parser.add_argument('--echo', type=int, default=100000, help='单字符回显的帧数')
+
+    def handle(self, *args, **options):
+        stream = build_stream(options['size'] * 1024 * 1024)
+        frame = options['frame']
+        workloads = (
+            (f'大量输出 {len(stream) / 1024 / 1024:.1f} MB，每帧 {frame} 字节',
+             [stream[i:i + frame] for i in range(0, len(stream), frame)]),
+            (f"单字符回显 {options['echo']} 帧", [b'x'] * options['echo']),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for number, (label, frames) in enumerate(workloads):
+                self.stdout.write(label)
+                self.stdout.write(f"  {'':<8} {'us/帧':>8} {'MB/s':>9} {'等待写完(s)':>12}")
+                size = sum(len(data) for data in frames) / 1024 / 1024
+                results = {}
+                for name, path in (('不录像', None), ('录像', os.path.join(directory, f'{number}{RECORDING_SUFFIX}'))):
+                    pushed, drained, recorder = asyncio.run(self.measure(frames, path))
+                    results[name] = pushed
+                    row = f'  {name:<8} {pushed / len(frames) * 1e6:>8.2f} {size / pushed:>9.1f}'
+                    self.stdout.write(row + (f' {drained:>12.3f}' if recorder else ''))
+                stats = recorder.get_stats()
+                self.stdout.write(
+                    f"  录像开销 {(results['录像'] - results['不录像']) / len(frames) * 1e6:+.2f} us/帧，"
+                    f"分段 {stats['recording_segments']} 个，"
+                    f"压缩比 {stats['recording_raw_bytes'] / max(stats['recording_file_bytes'], 1):.0f}x，"
+                    f"写入线程耗时 {stats['recording_write_seconds']:.2f} s")
+
+    @staticmethod
+    async def measure(frames, path):
+        """
+        按终端读取输出的方式逐帧增量解码，开启录像时同时录制，每 64 帧让出一次事件循环
+
+        Returns:
+            tuple: (推送耗时(秒), 关闭录像等待分段写完的耗时(秒), 录像器)
+        """
+        config = settings.SESSION_RECORDING
+        recorder = None
+        if path:
+            recorder = SessionRecorder(path, segment_seconds=config['SEGMENT_SECONDS'],
+                                       segment_bytes=config['SEGMENT_BYTES'], compress_level=config['COMPRESS_LEVEL'])
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        started = time.perf_counter()
+        for n, data in enumerate(frames):
+            text = decoder.decode(data)
+            if recorder:
+                recorder.record_output(text)
+            if n % 64 == 0:
+                await asyncio.sleep(0)
+        pushed = time.perf_counter() - started
+        drained = 0.0
+        if recorder:
+            started = time.perf_counter()
+            await recorder.close()
+            drained = time.perf_counter() - started
+        return pushed, drained, recorder
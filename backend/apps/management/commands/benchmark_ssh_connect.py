@@ -0,0 +1,81 @@
+import time
+import socket
+import asyncio
+import logging
+from django.core.management.base import BaseCommand
+from apps.ssh_utils.ssh_connector import ssh_connect_executor, open_shell_channel
+from ._ssh_test_server import LocalSSHServer, BlackHoleServer
+
+
+class Command(BaseCommand):
+    help = '测量大量主机握手无响应时，已建立的终端会话的回显延迟'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connects', type=int, default=50, help='同时连接无响应主机的数量')
+        parser.add_argument('--duration', type=float, default=3, help='每项的测量时间(秒)')
+
+    def handle(self, *args, **options):
+        # 结束时重置的握手会由 paramiko 记录错误日志
+        logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+        server = LocalSSHServer()
+        black_hole = BlackHoleServer()
+        try:
+            asyncio.run(self.run(server, black_hole, options['connects'], options['duration']))
+        finally:
+            # 关闭监听套接字后排队的握手立即失败，线程池随之退出
+            black_hole.close()
+            server.close()
+
+    async def run(self, server, black_hole, connects, duration):
+        loop = asyncio.get_running_loop()
+        client, channel = await loop.run_in_executor(ssh_connect_executor, open_shell_channel, *server.host())
+        readable = asyncio.Event()
+        loop.add_reader(channel.fileno(), readable.set)
+        try:
+            await self.echo(channel, readable, 0.5)  # 读掉提示符
+            baseline = await self.echo(channel, readable, duration)
+
+            slow_host = black_hole.host()
+            pending = [loop.run_in_executor(ssh_connect_executor, open_shell_channel, *slow_host)
+                       for _ in range(connects)]
+            await asyncio.sleep(0.1)
+            loaded = await self.echo(channel, readable, duration)
+            hung = sum(1 for future in pending if not future.done())
+
+            self.stdout.write(f"{'':<24} {'p50(ms)':>9} {'p99(ms)':>9} {'max(ms)':>9} {'次数':>6}")
+            self.stdout.write(self.row('无其他连接', baseline))
+            self.stdout.write(self.row(f'{connects} 个主机握手无响应', loaded))
+            self.stdout.write(f'测量结束时仍在等待握手的连接: {hung}/{connects}')
+            black_hole.close()
+            await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            loop.remove_reader(channel.fileno())
+            client.close()
+
+    @staticmethod
+    async def echo(channel, readable, duration):
+        """每 10ms 输入一个字符，返回每次从输入到收到回显的耗时(秒)"""
+        latencies = []
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            readable.clear()
+            started = time.perf_counter()
+            channel.send(b'x')
+            received = b''
+            while b'x' not in received:
+                await readable.wait()
+                readable.clear()
+                try:
+                    received += channel.recv(65536)
+                except socket.timeout:
+                    pass
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.01)
+        return latencies
+
+    @staticmethod
+    def row(label, latencies):
+        latencies = sorted(latencies)
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        return f'{label:<24} {p50:>9.2f} {p99:>9.2f} {latencies[-1] * 1000:>9.2f} {len(latencies):>6}'
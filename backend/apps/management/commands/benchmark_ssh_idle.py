@@ -0,0 +1,88 @@
+import time
+import socket
+import asyncio
+import resource
+from django.core.management.base import BaseCommand
+from apps.ssh_utils.ssh_connector import connect_transport
+from ._ssh_test_server import LocalSSHServer
+
+
+async def poll_reader(channel):
+    """原先的读取方式：没有数据时每 1ms 轮询一次"""
+    while True:
+        if channel.recv_ready():
+            if not channel.recv(65536):
+                return
+        else:
+            await asyncio.sleep(0.001)
+
+
+async def ready_reader(channel):
+    """SSHConsumer.receive_ssh_data 的读取方式：通道的事件管道注册到事件循环，可读时读空"""
+    loop = asyncio.get_running_loop()
+    readable = asyncio.Event()
+    channel_fd = channel.fileno()
+    loop.add_reader(channel_fd, readable.set)
+    try:
+        while True:
+            await readable.wait()
+            readable.clear()
+            while True:
+                try:
+                    data = channel.recv(65536)
+                except socket.timeout:
+                    break
+                if not data:
+                    return
+    finally:
+        loop.remove_reader(channel_fd)
+
+
+READERS = (('1ms 轮询', poll_reader), ('可读事件', ready_reader))
+
+
+class Command(BaseCommand):
+    help = '对比空闲终端会话在 1ms 轮询读取和按可读事件读取时的进程 CPU 占用'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', default='1,100,1000', help='会话数量，逗号分隔')
+        parser.add_argument('--duration', type=float, default=5, help='每项的测量时间(秒)')
+
+    def handle(self, *args, **options):
+        counts = [int(value) for value in options['sessions'].split(',')]
+        # 每个通道占用两个描述符（事件管道）
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, max(counts) * 2 + 256)), hard))
+
+        server = LocalSSHServer()
+        host, credential = server.host()
+        transport = connect_transport(host, credential)
+        channels = []
+        try:
+            self.stdout.write(f"{'会话数':>8} " + ' '.join(f'{name:>12}' for name, _ in READERS) + '   (进程 CPU 占用)')
+            for count in counts:
+                while len(channels) < count:
+                    channel = transport.open_session()
+                    channel.get_pty()
+                    channel.invoke_shell()
+                    channel.settimeout(0)
+                    channels.append(channel)
+                usage = [asyncio.run(self.measure(channels[:count], reader, options['duration']))
+                         for _, reader in READERS]
+                self.stdout.write(f'{count:>8} ' + ' '.join(f'{value:>11.1f}%' for value in usage))
+        finally:
+            transport.close()
+            server.close()
+
+    @staticmethod
+    async def measure(channels, reader, duration):
+        """所有会话空闲时的进程 CPU 占用(%)，先读掉提示符再开始计时"""
+        tasks = [asyncio.create_task(reader(channel)) for channel in channels]
+        await asyncio.sleep(0.5)
+        cpu, wall = time.process_time(), time.perf_counter()
+        await asyncio.sleep(duration)
+        usage = (time.process_time() - cpu) / (time.perf_counter() - wall) * 100
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return usage
@@ -0,0 +1,62 @@
+import time
+import random
+from django.core.management.base import BaseCommand
+from apps.ssh_utils.terminal_parser import TerminalParser
+
+PROMPT = 'root@web01:/var/log# '
+
+
+def build_stream(size):
+    """生成约 size 字节的终端输出：带颜色的 ls 输出、提示符、命令回显和窗口标题"""
+    rng = random.Random(1)
+    lines = []
+    for n in range(2000):
+        lines.append(f'\x1b[01;34mdir{n}\x1b[0m  -rw-r--r-- 1 root root {rng.randint(1, 99999):>6} '
+                     f'Oct 18 12:00 \x1b[00;32mfile{n}.log\x1b[0m')
+        if n % 50 == 0:
+            lines.append(f'\x1b]0;root@web01: /var/log\x07{PROMPT}ls -la --color=auto /var/log/app{n}')
+    block = ('\r\n'.join(lines) + '\r\n').encode()
+    return block * (size // len(block) + 1)
+
+
+class Command(BaseCommand):
+    help = '测量终端解析器处理 SSH 输出的吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100, help='生成的输出大小(MB)')
+        parser.add_argument('--file', help='使用录制的原始终端输出文件代替生成的输出')
+        parser.add_argument('--chunk', type=int, default=65536, help='每次读取的字节数')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            with open(options['file'], 'rb') as f:
+                stream = f.read()
+        else:
+            stream = build_stream(options['size'] * 1024 * 1024)
+        chunk = options['chunk']
+        chunks = [stream[i:i + chunk].decode('utf-8', errors='ignore') for i in range(0, len(stream), chunk)]
+        total = sum(len(text) for text in chunks) / 1024 / 1024
+
+        self.stdout.write(f'输出 {total:.1f} MB，每次读取 {chunk} 字节')
+        for label, pending_enters in (('没有待回显的回车（跳过整行）', 0), ('逐个解析所有转义序列（最坏情况）', 10 ** 9)):
+            parser = TerminalParser()
+            parser.pending_enters = pending_enters
+            started = time.perf_counter()
+            for text in chunks:
+                parser.feed_output(text)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{label}: {total / elapsed:.1f} MB/s ({elapsed:.2f} s)')
+
+        # 交互输入：每次读取一个字符的回显
+        parser = TerminalParser()
+        parser.feed_output(PROMPT)
+        parser.mark_prompt()
+        rounds = 200000
+        started = time.perf_counter()
+        for n in range(rounds):
+            if n % 80:
+                parser.feed_output('x')
+            else:
+                parser.feed_input('\r')
+                parser.feed_output('\r\n' + PROMPT)
+        self.stdout.write(f'单字符回显: {(time.perf_counter() - started) / rounds * 1e6:.2f} us/次')
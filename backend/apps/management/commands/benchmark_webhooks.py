@@ -0,0 +1,160 @@
+import os
+import ssl
+import json
+import time
+import socket
+import datetime
+import ipaddress
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import requests
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.alert_utils.webhook_client import WebhookClient, CircuitOpenError
+
+# 与钉钉 Markdown 消息大小相当的载荷
+PAYLOAD = {'msgtype': 'markdown', 'markdown': {'title': '命令告警', 'text': 'x' * 800}}
+
+
+class StubWebhookHandler(BaseHTTPRequestHandler):
+    """模拟机器人 Webhook：读取请求体，按 delay 参数等待后返回成功"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        delay = parse_qs(urlparse(self.path).query).get('delay')
+        if delay:
+            time.sleep(float(delay[0]))
+        body = json.dumps({'errcode': 0, 'errmsg': 'ok'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def self_signed_certificate(directory):
+    """生成 127.0.0.1 的自签名证书，返回 (证书文件, 私钥文件)"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, '127.0.0.1')])
+    now = datetime.datetime.utcnow()
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address('127.0.0.1'))]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_file = os.path.join(directory, 'webhook.crt')
+    key_file = os.path.join(directory, 'webhook.key')
+    with open(cert_file, 'wb') as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_file, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return cert_file, key_file
+
+
+class Command(BaseCommand):
+    help = '对比逐条新建连接与连接池发送告警 Webhook 的耗时，以及熔断对无响应 Webhook 的效果'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='逐条发送的请求数')
+        parser.add_argument('--contacts', type=int, default=4, help='一条告警的联系人数')
+        parser.add_argument('--delay', type=float, default=0.1, help='每个 Webhook 的响应时间(秒)')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            cert_file, key_file = self_signed_certificate(directory)
+            # requests 按该环境变量校验自签名证书
+            os.environ['REQUESTS_CA_BUNDLE'] = cert_file
+
+            server = ThreadingHTTPServer(('127.0.0.1', 0), StubWebhookHandler)
+            server.daemon_threads = True
+            server.lock = threading.Lock()
+            server.connections = 0
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(cert_file, key_file)
+            server.socket = context.wrap_socket(server.socket, server_side=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base = f'https://127.0.0.1:{server.server_address[1]}'
+            try:
+                self.sequential(server, base, options['requests'])
+                self.fan_out(base, options['contacts'], options['delay'])
+                self.breaker()
+            finally:
+                server.shutdown()
+
+    def sequential(self, server, base, count):
+        """逐条发送：每次新建连接与复用连接池"""
+        client = WebhookClient(settings.ALERT_DISPATCH)
+        requests.post(f'{base}/warmup', json=PAYLOAD, timeout=5)
+        self.stdout.write(f'逐条发送 {count} 条 HTTPS 请求:')
+        for label, post in (('requests.post', lambda: requests.post(f'{base}/robot', json=PAYLOAD, timeout=5)),
+                            ('WebhookClient', lambda: client.post(f'{base}/robot', PAYLOAD, 5))):
+            connections = server.connections
+            started = time.perf_counter()
+            for _ in range(count):
+                post()
+            elapsed = (time.perf_counter() - started) / count * 1000
+            self.stdout.write(f'  {label:<14} {elapsed:>7.2f} ms/条, 新建连接 {server.connections - connections} 个')
+
+    def fan_out(self, base, contacts, delay):
+        """一条告警发送给多个联系人：逐个发送与分发线程并发发送"""
+        client = WebhookClient(settings.ALERT_DISPATCH)
+        urls = [f'{base}/robot{index}?delay={delay}' for index in range(contacts)]
+        self.stdout.write(f'一条告警 {contacts} 个联系人，每个 Webhook 响应 {delay * 1000:.0f} ms:')
+
+        started = time.perf_counter()
+        for url in urls:
+            requests.post(url, json=PAYLOAD, timeout=5)
+        self.stdout.write(f'  逐个发送          {time.perf_counter() - started:.3f} s')
+
+        workers = settings.ALERT_DISPATCH['WORKERS']
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            started = time.perf_counter()
+            list(executor.map(lambda url: client.post(url, PAYLOAD, 5), urls))
+            self.stdout.write(f'  {workers} 个分发线程       {time.perf_counter() - started:.3f} s')
+
+    def breaker(self):
+        """20 条通知发往不响应的 Webhook，超时 1 秒"""
+        black_hole = socket.socket()
+        black_hole.bind(('127.0.0.1', 0))
+        black_hole.listen(1024)
+        url = f'http://127.0.0.1:{black_hole.getsockname()[1]}/dead'
+        self.stdout.write('20 条通知发往不响应的 Webhook（超时 1 秒）:')
+        try:
+            for label, threshold in (('不熔断', 10 ** 9), ('熔断', settings.ALERT_DISPATCH['BREAKER_THRESHOLD'])):
+                client = WebhookClient(dict(settings.ALERT_DISPATCH, BREAKER_THRESHOLD=threshold))
+                timeouts = rejected = 0
+                started = time.perf_counter()
+                for _ in range(20):
+                    try:
+                        client.post(url, PAYLOAD, 1)
+                    except CircuitOpenError:
+                        rejected += 1
+                    except requests.exceptions.RequestException:
+                        timeouts += 1
+                self.stdout.write(f'  {label:<6} 分发线程耗时 {time.perf_counter() - started:>6.2f} s, '
+                                  f'超时 {timeouts} 条, 熔断跳过 {rejected} 条')
+        finally:
+            black_hole.close()
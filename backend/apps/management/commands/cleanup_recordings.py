@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from apps.ssh_utils.session_recorder import cleanup_recordings
+
+
+class Command(BaseCommand):
+    help = '按 SESSION_RECORDING 的保留天数和总大小上限清理会话录像，可由定时任务执行'
+
+    def handle(self, *args, **options):
+        removed = cleanup_recordings()
+        self.stdout.write(f'已清理 {removed} 个会话录像')
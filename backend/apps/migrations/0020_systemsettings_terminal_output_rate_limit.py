@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0019_alter_alerthistorylog_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='systemsettings',
+            name='terminal_output_rate_limit',
+            field=models.IntegerField(default=0, verbose_name='终端输出速率上限(KB/s)'),
+        ),
+    ]
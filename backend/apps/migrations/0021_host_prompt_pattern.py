@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0020_systemsettings_terminal_output_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='host',
+            name='prompt_pattern',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='提示符正则'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.13 on 2026-10-18 12:30
+
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0021_host_prompt_pattern'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionRecording',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('username', models.CharField(max_length=150, verbose_name='用户名')),
+                ('hosts', models.CharField(max_length=255, verbose_name='主机名称')),
+                ('network', models.CharField(blank=True, max_length=255, null=True, verbose_name='主机IP')),
+                ('file_path', models.CharField(max_length=500, verbose_name='录像文件路径')),
+                ('duration', models.FloatField(default=0, verbose_name='录像时长(秒)')),
+                ('size', models.BigIntegerField(default=0, verbose_name='文件大小(字节)')),
+                ('start_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='开始时间')),
+                ('end_time', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+            ],
+            options={
+                'db_table': 't_session_recording',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0022_sessionrecording'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='host',
+            name='terminal_idle_timeout',
+            field=models.IntegerField(blank=True, null=True, verbose_name='终端空闲超时(分钟)'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='terminal_idle_timeout',
+            field=models.IntegerField(blank=True, null=True, verbose_name='终端空闲超时(分钟)'),
+        ),
+    ]
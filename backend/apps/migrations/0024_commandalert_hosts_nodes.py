@@ -0,0 +1,58 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:10
+
+import uuid
+from django.db import migrations, models
+
+
+def csv_to_relations(apps, schema_editor):
+    """把逗号分隔的主机ID迁移到关联表，忽略无效或已删除的主机"""
+    CommandAlert = apps.get_model('apps', 'CommandAlert')
+    Host = apps.get_model('apps', 'Host')
+    existing = set(Host.objects.values_list('id', flat=True))
+    for alert in CommandAlert.objects.exclude(hosts_csv__isnull=True).exclude(hosts_csv=''):
+        host_ids = set()
+        for value in alert.hosts_csv.split(','):
+            try:
+                host_id = uuid.UUID(value.strip())
+            except ValueError:
+                continue
+            if host_id in existing:
+                host_ids.add(host_id)
+        alert.hosts.set(host_ids)
+
+
+def relations_to_csv(apps, schema_editor):
+    CommandAlert = apps.get_model('apps', 'CommandAlert')
+    for alert in CommandAlert.objects.prefetch_related('hosts'):
+        alert.hosts_csv = ','.join(str(host.id) for host in alert.hosts.all())
+        alert.save(update_fields=['hosts_csv'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0023_host_terminal_idle_timeout_user_terminal_idle_timeout'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='commandalert',
+            old_name='hosts',
+            new_name='hosts_csv',
+        ),
+        migrations.AddField(
+            model_name='commandalert',
+            name='hosts',
+            field=models.ManyToManyField(blank=True, db_table='t_command_alert_hosts', related_name='command_alerts', to='apps.host', verbose_name='关联主机'),
+        ),
+        migrations.AddField(
+            model_name='commandalert',
+            name='nodes',
+            field=models.ManyToManyField(blank=True, db_table='t_command_alert_nodes', related_name='command_alerts', to='apps.node', verbose_name='关联节点'),
+        ),
+        migrations.RunPython(csv_to_relations, relations_to_csv),
+        migrations.RemoveField(
+            model_name='commandalert',
+            name='hosts_csv',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.13 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0024_commandalert_hosts_nodes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandalert',
+            name='suppress_window',
+            field=models.PositiveIntegerField(default=0, verbose_name='告警聚合窗口(秒)'),
+        ),
+        migrations.AddField(
+            model_name='alerthistorylog',
+            name='count',
+            field=models.PositiveIntegerField(default=1, verbose_name='触发次数'),
+        ),
+        migrations.AddField(
+            model_name='alerthistorylog',
+            name='sample_commands',
+            field=models.TextField(blank=True, null=True, verbose_name='命令示例'),
+        ),
+        migrations.AddField(
+            model_name='alerthistorylog',
+            name='last_time',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='最后触发时间'),
+        ),
+    ]
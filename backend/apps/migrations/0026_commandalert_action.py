@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0025_alert_aggregation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandalert',
+            name='action',
+            field=models.CharField(choices=[('alert', '仅告警'), ('block', '阻断执行')], default='alert', max_length=20, verbose_name='触发动作'),
+        ),
+    ]
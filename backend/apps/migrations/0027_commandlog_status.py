@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0026_commandalert_action'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandlog',
+            name='status',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='执行状态'),
+        ),
+    ]
@@ -17,6 +17,7 @@ class User(models.Model):
     update_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")  # 更新时间
     otp_secret_key = models.CharField(max_length=32, null=True, blank=True, verbose_name="OTP密钥")  # 用于存储2FA密钥
     mfa_level = models.IntegerField(default=0, choices=[(0, '关闭'), (1, '开启')], verbose_name="MFA认证等级")  # MFA认证等级
+    terminal_idle_timeout = models.IntegerField(null=True, blank=True, verbose_name="终端空闲超时(分钟)")  # 为空时使用系统默认
 
     class Meta:
         db_table = 't_user'  # 指定数库表名为 t_user
@@ -220,6 +221,8 @@ class Host(models.Model):
     remarks = models.TextField(null=True, blank=True, verbose_name="备注")  # 备注
     create_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")  # 创建时间
     node = models.ForeignKey(Node, null=True, blank=True, on_delete=models.CASCADE, related_name='hosts', verbose_name="所属节点")  # 关联节点，允许为空
+    prompt_pattern = models.CharField(max_length=255, blank=True, default='', verbose_name="提示符正则")  # 自定义 Shell 提示符，为空时使用默认规则
+    terminal_idle_timeout = models.IntegerField(null=True, blank=True, verbose_name="终端空闲超时(分钟)")  # 为空时使用系统默认
 
     class Meta:
         db_table = 't_host'  # 指定数据库表名为 t_host
@@ -237,6 +240,7 @@ class CommandLog(models.Model):
     hosts = models.CharField(max_length=255, verbose_name="执行主机")  # 记录执行的主机名
     network = models.CharField(null=True, blank=True, max_length=255, verbose_name="执行主机IP")  # 记录执行的主机IP
     credential = models.CharField(max_length=150, verbose_name="使用的凭据")  # 记录执行命令当前使用账号凭据名称
+    status = models.CharField(max_length=255, blank=True, default='', verbose_name="执行状态")  # 批量执行的结果（退出码、已取消、超时等），终端中执行的命令为空
     create_time = models.DateTimeField(default=timezone.now, verbose_name="创建时间")  # 执行时间
 
     class Meta:
@@ -245,6 +249,26 @@ class CommandLog(models.Model):
     def __str__(self):
         return f"{self.username} - {self.hosts} - {self.command[:50]}"
 
+class SessionRecording(models.Model):
+    """
+    终端会话录像模型，录像内容存储在 asciicast v2 格式的分段压缩文件中
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)  # 录像ID，同时作为文件名
+    username = models.CharField(max_length=150, verbose_name="用户名")  # 会话用户
+    hosts = models.CharField(max_length=255, verbose_name="主机名称")  # 会话主机名
+    network = models.CharField(null=True, blank=True, max_length=255, verbose_name="主机IP")  # 会话主机IP
+    file_path = models.CharField(max_length=500, verbose_name="录像文件路径")  # 录像文件路径
+    duration = models.FloatField(default=0, verbose_name="录像时长(秒)")  # 录像时长
+    size = models.BigIntegerField(default=0, verbose_name="文件大小(字节)")  # 压缩后的文件大小
+    start_time = models.DateTimeField(default=timezone.now, verbose_name="开始时间")  # 会话开始时间
+    end_time = models.DateTimeField(null=True, blank=True, verbose_name="结束时间")  # 会话结束时间
+
+    class Meta:
+        db_table = 't_session_recording'  # 指定数据库表名为 t_session_recording
+
+    def __str__(self):
+        return f"{self.username} - {self.hosts} - {self.start_time}"
+
 # 在文件的适当位置添加以下代码
 
 class AlertContact(models.Model):
@@ -269,11 +293,14 @@ class CommandAlert(models.Model):
     """
     name = models.CharField(max_length=150, unique=True, verbose_name="告警名称")
     command_rule = models.TextField(null=True, blank=True,verbose_name="命令规则")
-    hosts = models.TextField(null=True, blank=True,verbose_name="关联主机")  # 存储主机名，用逗号分隔
+    hosts = models.ManyToManyField(Host, blank=True, related_name='command_alerts', db_table='t_command_alert_hosts', verbose_name="关联主机")
+    nodes = models.ManyToManyField(Node, blank=True, related_name='command_alerts', db_table='t_command_alert_nodes', verbose_name="关联节点")  # 规则作用于节点及其所有子节点下的主机
     alert_contacts = models.TextField(null=True, blank=True, verbose_name="告警联系人")  # 存储联系人名称，用逗号分隔
     is_active = models.BooleanField(null=True, blank=True, default=True, verbose_name="是否告警")
     create_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     match_type = models.CharField(max_length=20, choices=[('exact', '精匹配'), ('fuzzy', '模糊匹配')], default='exact', verbose_name="匹配类型")
+    suppress_window = models.PositiveIntegerField(default=0, verbose_name="告警聚合窗口(秒)")  # 同一用户在同一主机上重复触发时窗口内合并为一条告警，0 表示不合并
+    action = models.CharField(max_length=20, choices=[('alert', '仅告警'), ('block', '阻断执行')], default='alert', verbose_name="触发动作")  # 阻断执行的规则在终端回车时检查，命中后不发送该命令
 
     class Meta:
         db_table = 't_command_alert'
@@ -290,6 +317,7 @@ class SystemSettings(models.Model):
     ip_blacklist = models.TextField(null=True, blank=True, verbose_name="IP黑名单")
     update_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
     multi_login_account = models.CharField(max_length=150, null=True, blank=True, verbose_name="多人登录账号")
+    terminal_output_rate_limit = models.IntegerField(default=0, verbose_name="终端输出速率上限(KB/s)")  # 0 表示不限速
 
     class Meta:
         db_table = 't_system_settings'
@@ -304,6 +332,9 @@ class AlertHistoryLog(models.Model):
     match_type = models.CharField(null=True, blank=True, max_length=20, verbose_name="匹配类型")  # 精准匹配/模糊匹配
     command = models.TextField(null=True, blank=True, verbose_name="执行命令")
     alert_rule = models.CharField(null=True, blank=True, max_length=150, verbose_name="触发规则")
+    count = models.PositiveIntegerField(default=1, verbose_name="触发次数")  # 聚合窗口内的触发次数
+    sample_commands = models.TextField(null=True, blank=True, verbose_name="命令示例")  # 窗口内重复触发的部分命令，JSON 列表
+    last_time = models.DateTimeField(null=True, blank=True, verbose_name="最后触发时间")
     create_time = models.DateTimeField(null=True, blank=True, auto_now_add=True, verbose_name="创建时间")
 
     class Meta:
@@ -0,0 +1,116 @@
+import time
+import select
+import socket
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from apps.models import Host
+from apps.utils import get_node_subtree
+from apps.ssh_utils.ssh_connector import transport_pool
+
+logger = logging.getLogger('log')
+
+# 批量命令执行线程池，连接和读取输出都是阻塞操作，与终端握手线程池分开，批量任务不会挤占终端连接
+batch_executor = ThreadPoolExecutor(
+    max_workers=settings.BATCH_COMMAND['WORKERS'],
+    thread_name_prefix='batch-command'
+)
+
+
+def resolve_hosts(host_ids=None, node_id=None):
+    """
+    解析批量执行的目标主机（阻塞调用）
+
+    Args:
+        host_ids: 主机ID列表
+        node_id: 节点ID，包含该节点及所有子节点下的主机
+
+    Returns:
+        list: 主机列表（已关联凭据），按名称排序并去重
+    """
+    query = Host.objects.none()
+    if host_ids:
+        query = query | Host.objects.filter(id__in=host_ids)
+    if node_id:
+        query = query | Host.objects.filter(node_id__in=get_node_subtree([node_id]))
+    return list(query.select_related('account_type').distinct().order_by('name'))
+
+
+def run_host_command(host, credential, command, timeout, max_output, cancelled):
+    """
+    在单台主机上执行命令（阻塞调用，需在 batch_executor 中执行）
+
+    Args:
+        host: 主机对象
+        credential: 凭据对象
+        command: 命令
+        timeout: 超时时间(秒)，包括连接和执行
+        max_output: stdout 和 stderr 各自保留的最大字节数，超出部分丢弃
+        cancelled: threading.Event，任务取消时提前结束
+
+    Returns:
+        dict: stdout、stderr、exit_code、error、truncated、duration，
+              executed 命令是否已发送到主机（之后被取消或超时仍为 True）
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    stdout, stderr = bytearray(), bytearray()
+    truncated = False
+    exit_code = None
+    error = None
+    executed = False
+    ssh_client = None
+
+    try:
+        if credential is None:
+            raise ValueError('主机未关联凭据')
+        ssh_client = transport_pool.acquire(host, credential)
+        _, channel_stdout, _ = ssh_client.exec_command(command, timeout=timeout)
+        executed = True
+        channel = channel_stdout.channel
+        channel.settimeout(0)
+
+        while True:
+            # 通道的事件管道在 stdout 有数据或收到 EOF 时可读，stderr 按等待间隔读取；
+            # 收到 EOF 后管道一直可读，改为等待退出状态，避免空转
+            if channel.eof_received:
+                channel.status_event.wait(0.05)
+            else:
+                select.select([channel], [], [], 0.05)
+            while channel.recv_ready() or channel.recv_stderr_ready():
+                for ready, recv, buffer in ((channel.recv_ready, channel.recv, stdout),
+                                            (channel.recv_stderr_ready, channel.recv_stderr, stderr)):
+                    if not ready():
+                        continue
+                    try:
+                        data = recv(32768)
+                    except socket.timeout:
+                        continue
+                    room = max_output - len(buffer)
+                    if len(data) > room:
+                        truncated = True
+                    buffer += data[:max(room, 0)]
+            if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                exit_code = channel.recv_exit_status()
+                break
+            if cancelled.is_set():
+                error = '已取消'
+                break
+            if time.monotonic() > deadline:
+                error = f'执行超时 ({timeout}秒)'
+                break
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+    finally:
+        if ssh_client:
+            ssh_client.close()
+
+    return {
+        'stdout': stdout.decode('utf-8', errors='replace'),
+        'stderr': stderr.decode('utf-8', errors='replace'),
+        'exit_code': exit_code,
+        'error': error,
+        'truncated': truncated,
+        'duration': round(time.monotonic() - started, 3),
+        'executed': executed,
+    }
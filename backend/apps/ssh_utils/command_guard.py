@@ -0,0 +1,242 @@
+import re
+import time
+import asyncio
+import collections
+
+# 输入中的控制字符（编辑键、方向键等），含有这些字符的输入不能直接当作命令
+_CONTROL = re.compile(rb'[\x00-\x1f\x7f]')
+
+
+class CommandGuard:
+    """
+    终端命令阻断检查
+
+    1. 主机有阻断执行的规则时，用户按下回车，暂缓发送回车及之后的输入，
+       检查解析器还原的命令行、客户端上报的命令行和回车前输入的文本，规则在进程内缓存，检查不访问数据库
+    2. 未命中时发送回车，继续处理之后的输入；命中时用 Ctrl+C 代替回车取消该行，丢弃之后的输入
+    3. 回车前的输入尚未回显时（粘贴多行、快速输入），等到 SSH 输出读空（shell 等待输入）后再检查，
+       最多等待 echo_timeout 秒
+    4. 未识别提示符（如修改了 PS1）时不放行：开始输入时光标前的内容即为提示符，据此从当前行中取出命令，
+       同时检查客户端上报的命令行和输入的文本，都无法确定命令时拒绝该回车（on_block 的规则参数为 None）
+    5. 精确匹配和字面量过滤在回车时直接检查；需要执行正则时在后台检查（见 RegexSandbox），
+       不阻塞事件循环，检查完成前之后的输入继续暂缓；检查出错、正则超时或已降级而无法确定结果时同样拒绝该回车
+    6. 主机没有阻断规则时输入直接发送；处于全屏程序中（备用屏幕）且当前行没有可识别的提示符时输入直接发送，
+       只输出备用屏幕的切换序列而仍在 shell 中时照常检查
+    7. 统计检查次数、阻断次数、拒绝次数、等待回显次数和检查耗时
+    """
+
+    MAX_TYPED = 4096  # 记录的回车前输入的最大长度
+
+    def __init__(self, get_matcher, parser, forward, on_block, get_client_command=None, echo_timeout=0.5):
+        self._get_matcher = get_matcher  # 返回主机阻断规则匹配器的函数，没有阻断规则时返回 None
+        self.parser = parser             # 终端解析器，提供当前命令行
+        self._forward = forward          # 把输入写入 SSH 通道的函数
+        self._on_block = on_block        # 命令被阻断时调用 on_block(command, rule)，无法确定命令时 rule 为 None
+        self._get_client_command = get_client_command  # 返回客户端上报的命令行的函数
+        self.echo_timeout = echo_timeout
+
+        self.held = bytearray()          # 暂缓发送的回车及之后的输入
+        self._typed = bytearray()        # 上一个回车之后已发送的输入
+        self._line_prompt = None         # 开始输入时光标前的内容，即当前行的提示符
+        self._unechoed = False           # 已发送的输入是否可能尚未回显
+        self._timer = None               # 等待回显的超时定时器
+        self._task = None                # 正在执行正则的后台检查
+
+        # 统计信息
+        self.checks = 0
+        self.blocked = 0
+        self.rejected = 0
+        self.echo_waits = 0
+        self.latencies = collections.deque(maxlen=1000)  # 最近检查的耗时(秒)，含后台执行正则，不含写入通道
+
+    def feed(self, data):
+        """
+        处理用户输入
+
+        Args:
+            data: 输入的原始字节
+        """
+        if self.held:
+            # 正在等待检查，之后的输入按顺序排在后面
+            self.held += data
+            return
+        self._process(bytes(data))
+
+    def _process(self, data):
+        while data:
+            matcher = self._get_matcher()
+            enter = min((index for index in (data.find(b'\r'), data.find(b'\n')) if index >= 0), default=-1)
+            if matcher is None or enter < 0 or (self.parser.alt_screen and not self.parser.shows_prompt()):
+                self._send(data)
+                return
+            if enter:
+                self._send(data[:enter])
+            self.held += data[enter:]
+            if self._unechoed:
+                # 回车前的输入尚未回显，等待输出读空后再检查
+                self.echo_waits += 1
+                self._timer = asyncio.get_running_loop().call_later(self.echo_timeout, self.on_idle)
+                return
+            data = self._check(matcher)
+
+    def _send(self, data):
+        if not self._typed:
+            # 一行的第一次输入，回显已同步时光标前的内容就是提示符
+            self._line_prompt = None if self._unechoed else self.parser.line[:self.parser.cursor]
+        self._forward(data)
+        self._unechoed = True
+        index = max(data.rfind(b'\r'), data.rfind(b'\n'), data.rfind(b'\x03'))
+        if index >= 0:
+            self._typed = bytearray(data[index + 1:])
+        elif len(self._typed) < self.MAX_TYPED:
+            self._typed += data
+
+    def on_idle(self):
+        """SSH 输出已读空或等待回显超时，检查暂缓的回车"""
+        self._unechoed = False
+        if not self.held or self._task is not None:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        matcher = self._get_matcher()
+        if matcher is None:
+            data, self.held = bytes(self.held), bytearray()
+            self._process(data)
+            return
+        self._process(self._check(matcher))
+
+    def _candidates(self):
+        """
+        回车对应的命令，可能有多种来源，依次检查
+
+        Returns:
+            list | None: 待检查的命令，无法确定命令时返回 None
+        """
+        command = self.parser.pending_command()
+        if command is None:
+            command = self._strip_prompt(self.parser.line)
+        candidates = [command] if command else []
+
+        client_command = self._get_client_command() if self._get_client_command else None
+        if client_command:
+            cleaned = self.parser.clean_line(client_command)
+            candidates.append(self._strip_prompt(cleaned) or cleaned)
+
+        if not _CONTROL.search(self._typed):
+            # 没有编辑键的输入就是命令本身（粘贴、提前输入、未识别提示符时的输入）
+            candidates.append(self._typed.decode('utf-8', errors='replace').strip())
+        elif command is None and not client_command:
+            # 未识别提示符、客户端未上报命令行且输入经过编辑，无法确定命令
+            return None
+        return candidates
+
+    def _strip_prompt(self, line):
+        """
+        去除开始输入时记录的提示符
+
+        Returns:
+            str | None: 命令，当前行不以该提示符开头时返回 None
+        """
+        prompt = (self._line_prompt or '').strip()
+        if not prompt or not line.startswith(prompt):
+            return None
+        return line[len(prompt):].strip()
+
+    def _check(self, matcher):
+        """
+        检查暂缓的回车对应的命令行，需要执行正则时转到后台检查
+
+        Returns:
+            bytes: 检查后需要继续处理的输入
+        """
+        start = time.perf_counter()
+        candidates = self._candidates()
+        commands = list(dict.fromkeys(command for command in candidates or () if command))
+        searching = []
+        for command in commands:
+            matched, pending = matcher.match_exact(command)
+            if matched:
+                return self._finish(candidates, command, matched[0], start)
+            if pending:
+                searching.append(command)
+        if searching:
+            self._task = asyncio.ensure_future(self._search(matcher, candidates, searching, start))
+            return b''
+        return self._finish(candidates, '', None, start)
+
+    async def _search(self, matcher, candidates, commands, start):
+        """在后台执行正则检查，完成后继续处理暂缓的输入"""
+        rule = None
+        command = ''
+        undetermined = False
+        try:
+            for command in commands:
+                matched, unknown = await matcher.match_async(command)
+                if matched:
+                    rule = matched[0]
+                    break
+                undetermined = undetermined or bool(unknown)
+        except Exception:
+            undetermined = True
+        finally:
+            self._task = None
+        if rule is None and undetermined:
+            # 检查出错或正则无法确定是否匹配，按无法确定命令处理，不放行
+            candidates = None
+        self._process(self._finish(candidates, command, rule, start))
+
+    def _finish(self, candidates, command, rule, start):
+        """
+        按检查结果发送或取消暂缓的回车
+
+        Returns:
+            bytes: 需要继续处理的输入
+        """
+        held, self.held = bytes(self.held), bytearray()
+        self.checks += 1
+        self.latencies.append(time.perf_counter() - start)
+        if candidates is None:
+            # 无法确定命令，丢弃回车及之后的输入，当前行保留在 shell 中
+            self.rejected += 1
+            self._on_block(None, None)
+            return b''
+        if rule is not None:
+            # 用 Ctrl+C 取消当前行，丢弃之后的输入
+            self.blocked += 1
+            self._send(b'\x03')
+            self._on_block(command, rule)
+            return b''
+
+        enter = 2 if held.startswith(b'\r\n') else 1
+        self._send(held[:enter])
+        return held[enter:]
+
+    def cancel(self):
+        """会话结束时取消等待"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.held = bytearray()
+
+    def get_stats(self):
+        """
+        获取检查统计信息
+
+        Returns:
+            dict: guard_checks 检查次数，guard_blocked 阻断次数，guard_rejected 无法确定命令或检查结果而拒绝的次数，
+                  guard_echo_waits 等待回显的次数，guard_check_p99_us 检查耗时 p99(微秒)
+        """
+        stats = {
+            'guard_checks': self.checks,
+            'guard_blocked': self.blocked,
+            'guard_rejected': self.rejected,
+            'guard_echo_waits': self.echo_waits,
+        }
+        latencies = sorted(self.latencies)
+        if latencies:
+            stats['guard_check_p99_us'] = round(latencies[int(len(latencies) * 0.99)] * 1e6, 1)
+        return stats
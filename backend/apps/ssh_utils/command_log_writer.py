@@ -0,0 +1,186 @@
+import time
+import atexit
+import asyncio
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from apps.models import CommandLog
+
+logger = logging.getLogger('log')
+
+
+class CommandLogWriter:
+    """
+    命令日志批量写入器
+
+    1. 汇总进程内所有终端会话的命令日志，会话只需入队，不在按键路径上访问数据库
+    2. 累积到批量大小或等待超过刷新间隔时用 bulk_create 一次写入
+    3. 写入失败时保留当前批次并重试，连续失败 max_retries 次后逐条写入，写入失败的日志记录后丢弃，
+       避免一条坏数据阻塞所有日志写入
+    4. 入队不等待，队列满时丢弃并计数，SSH 读取路径不会因数据库变慢而阻塞
+    5. 进程退出时同步写入剩余日志
+    6. 统计队列深度、丢弃条数和写入耗时
+    """
+
+    def __init__(self, batch_size=200, flush_interval=1.0, max_queue=10000, max_retries=3):
+        self.batch_size = batch_size            # 单次批量写入的最大条数
+        self.flush_interval = flush_interval    # 最长等待时间(秒)
+        self.max_queue = max_queue              # 队列最大长度
+        self.max_retries = max_retries          # 批量写入连续失败多少次后改为逐条写入
+
+        self._queue = None          # 待写入队列，首次入队时在当前事件循环中创建
+        self._batch = []            # 正在写入的批次
+        self._worker = None         # 写入任务
+        self._retries = 0           # 当前批次连续失败次数
+
+        # 统计信息
+        self.records_written = 0
+        self.flushes = 0
+        self.failures = 0
+        self.dropped = 0            # 队列满时丢弃的日志数
+        self.rows_failed = 0        # 逐条写入仍失败而丢弃的日志数
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def put(self, record):
+        """
+        加入一条命令日志，需在事件循环中调用，不等待
+
+        Args:
+            record: 未保存的 CommandLog 对象
+
+        Returns:
+            bool: 是否已入队，队列满时丢弃并返回 False
+        """
+        if self._worker is None or self._worker.done():
+            self._queue = self._queue or asyncio.Queue(maxsize=self.max_queue)
+            self._worker = asyncio.create_task(self._run())
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.error(f"命令日志队列已满，丢弃日志: 累计 {self.dropped} 条, 用户={record.username}, 命令={record.command}")
+            return False
+        return True
+
+    async def _run(self):
+        """持续从队列中取出日志，按批量大小或刷新间隔写入"""
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._batch:
+                self._batch.append(await self._queue.get())
+            deadline = loop.time() + self.flush_interval
+
+            while len(self._batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # 继续取出已在队列中的日志，不再等待
+            while len(self._batch) < self.batch_size and not self._queue.empty():
+                self._batch.append(self._queue.get_nowait())
+
+            if not await sync_to_async(self._flush_batch)():
+                await asyncio.sleep(self.flush_interval)
+
+    def _flush_batch(self):
+        """
+        写入当前批次
+
+        Returns:
+            bool: 是否写入成功，失败时批次保留到下次重试，重试次数用完后逐条写入并返回 True
+        """
+        batch = self._batch
+        if not batch:
+            return True
+        started = time.perf_counter()
+        try:
+            CommandLog.objects.bulk_create(batch)
+            written = len(batch)
+        except Exception as e:
+            self.failures += 1
+            self._retries += 1
+            if self._retries <= self.max_retries:
+                logger.error(f"批量写入命令日志失败，稍后重试: {len(batch)} 条, 第 {self._retries} 次, {str(e)}")
+                return False
+            logger.error(f"批量写入命令日志失败 {self._retries} 次，改为逐条写入: {len(batch)} 条, {str(e)}")
+            written = self._save_rows(batch)
+
+        elapsed = time.perf_counter() - started
+        self._batch = []
+        self._retries = 0
+        self.records_written += written
+        self.flushes += 1
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.total_flush_seconds += elapsed
+        return True
+
+    def _save_rows(self, batch):
+        """
+        逐条写入批次中的日志，写入失败的日志记录到错误日志后丢弃
+
+        Returns:
+            int: 写入成功的条数
+        """
+        written = 0
+        for record in batch:
+            try:
+                record.save()
+                written += 1
+            except Exception as e:
+                self.rows_failed += 1
+                logger.error(f"写入命令日志失败，已丢弃: 用户={record.username}, 主机={record.hosts}, "
+                             f"命令={record.command}, {str(e)}")
+        return written
+
+    def flush_sync(self):
+        """进程退出时同步写入剩余日志"""
+        if self._queue is not None:
+            while not self._queue.empty():
+                self._batch.append(self._queue.get_nowait())
+        if self._batch:
+            count = len(self._batch)
+            if self._flush_batch():
+                logger.info(f"进程退出前写入剩余命令日志: {count} 条")
+
+    def queue_depth(self):
+        """当前等待写入的日志数"""
+        return (self._queue.qsize() if self._queue is not None else 0) + len(self._batch)
+
+    def get_stats(self):
+        """
+        获取写入统计信息
+
+        Returns:
+            dict: queue_depth 等待写入的记录数，records_written 已写入记录数，flushes 批量写入次数，
+                  failures 批量写入失败次数，dropped 队列满时丢弃的记录数，rows_failed 逐条写入仍失败而丢弃的记录数，
+                  last_flush_ms/max_flush_ms/avg_flush_ms 批量写入耗时(毫秒)
+        """
+        return {
+            'queue_depth': self.queue_depth(),
+            'records_written': self.records_written,
+            'flushes': self.flushes,
+            'failures': self.failures,
+            'dropped': self.dropped,
+            'rows_failed': self.rows_failed,
+            'last_flush_ms': round(self.last_flush_seconds * 1000, 2),
+            'max_flush_ms': round(self.max_flush_seconds * 1000, 2),
+            'avg_flush_ms': round(self.total_flush_seconds / self.flushes * 1000, 2) if self.flushes else 0,
+        }
+
+
+# 进程内共享的命令日志写入器
+command_log_writer = CommandLogWriter(
+    batch_size=settings.COMMAND_LOG_WRITER['BATCH_SIZE'],
+    flush_interval=settings.COMMAND_LOG_WRITER['FLUSH_INTERVAL'],
+    max_queue=settings.COMMAND_LOG_WRITER['MAX_QUEUE'],
+    max_retries=settings.COMMAND_LOG_WRITER['MAX_RETRIES'],
+)
+atexit.register(command_log_writer.flush_sync)
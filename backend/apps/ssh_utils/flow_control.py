@@ -0,0 +1,148 @@
+import time
+
+
+class OutputFlowControl:
+    """
+    终端输出流量控制
+
+    1. 背压: 客户端未确认的字节数超过高水位时暂停读取 SSH 通道，低于低水位时恢复
+    2. 限速: 令牌桶限制每个会话的输出速率
+    3. 记录暂停次数和累计暂停时长
+    """
+
+    BACKPRESSURE = 'backpressure'
+    RATE_LIMIT = 'rate_limit'
+
+    def __init__(self, high_water, low_water, rate_limit=0, enabled=True):
+        self.high_water = high_water   # 高水位(字节)
+        self.low_water = low_water     # 低水位(字节)
+        self.rate_limit = rate_limit   # 速率上限(字节/秒)，0 表示不限速
+        self.enabled = enabled         # 是否启用背压（客户端需回传确认）
+
+        self.unacked_bytes = 0         # 已发送但客户端未确认的字节数
+
+        # 令牌桶，容量为 1 秒的流量
+        self._tokens = float(rate_limit)
+        self._last_refill = time.monotonic()
+
+        # 暂停状态和统计
+        self._pause_reasons = set()
+        self._paused_at = None
+        self.pause_counts = {self.BACKPRESSURE: 0, self.RATE_LIMIT: 0}
+        self.paused_seconds = 0.0
+
+    @property
+    def paused(self):
+        return bool(self._pause_reasons)
+
+    def on_sent(self, size):
+        """
+        记录已发送字节数
+
+        Returns:
+            bool: 是否超过高水位需要暂停读取
+        """
+        if not self.enabled:
+            return False
+        self.unacked_bytes += size
+        return self.unacked_bytes >= self.high_water and self.BACKPRESSURE not in self._pause_reasons
+
+    def on_ack(self, size):
+        """
+        记录客户端确认的字节数
+
+        Returns:
+            bool: 是否降到低水位以下可以恢复读取
+        """
+        self.unacked_bytes = max(0, self.unacked_bytes - size)
+        return self.unacked_bytes <= self.low_water and self.BACKPRESSURE in self._pause_reasons
+
+    def reset(self):
+        """
+        清零未确认字节数，客户端断开或重新接入时调用，之前发送的输出不会再被确认
+        """
+        self.unacked_bytes = 0
+
+    def consume(self, size):
+        """
+        从令牌桶中扣除字节数
+
+        Returns:
+            float: 需要暂停读取的秒数，0 表示未超出速率上限
+        """
+        if not self.rate_limit:
+            return 0.0
+
+        now = time.monotonic()
+        self._tokens = min(float(self.rate_limit), self._tokens + (now - self._last_refill) * self.rate_limit)
+        self._last_refill = now
+        self._tokens -= size
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate_limit
+
+    def read_size(self, default):
+        """
+        计算本次读取的字节数，限速时不超过桶内剩余令牌，避免一次读入过多数据
+
+        Args:
+            default: 不限速时的读取大小
+        """
+        if not self.rate_limit:
+            return default
+        return max(4096, min(default, int(self._tokens)))
+
+    def pause(self, reason):
+        """
+        标记暂停
+
+        Returns:
+            bool: 是否从运行状态转为暂停状态
+        """
+        if reason in self._pause_reasons:
+            return False
+        was_paused = self.paused
+        self._pause_reasons.add(reason)
+        self.pause_counts[reason] += 1
+        if not was_paused:
+            self._paused_at = time.monotonic()
+        return not was_paused
+
+    def resume(self, reason):
+        """
+        取消暂停
+
+        Returns:
+            bool: 是否从暂停状态恢复为运行状态
+        """
+        if reason not in self._pause_reasons:
+            return False
+        self._pause_reasons.discard(reason)
+        if self.paused:
+            return False
+        self.paused_seconds += time.monotonic() - self._paused_at
+        self._paused_at = None
+        return True
+
+    def get_stats(self):
+        """
+        获取流量控制统计信息
+
+        Returns:
+            dict: flow_control 是否启用背压，rate_limit 速率上限(字节/秒)，unacked_bytes 未确认字节数，throttled 是否暂停读取，
+                  throttle_reasons 暂停原因，backpressure_pauses/rate_limit_pauses 两种原因的暂停次数，
+                  throttled_seconds 累计暂停时间(秒)
+        """
+        paused_seconds = self.paused_seconds
+        if self._paused_at is not None:
+            paused_seconds += time.monotonic() - self._paused_at
+        return {
+            'flow_control': self.enabled,
+            'rate_limit': self.rate_limit,
+            'unacked_bytes': self.unacked_bytes,
+            'throttled': self.paused,
+            'throttle_reasons': sorted(self._pause_reasons),
+            'backpressure_pauses': self.pause_counts[self.BACKPRESSURE],
+            'rate_limit_pauses': self.pause_counts[self.RATE_LIMIT],
+            'throttled_seconds': round(paused_seconds, 3),
+        }
@@ -0,0 +1,95 @@
+import time
+import heapq
+import asyncio
+import logging
+
+logger = logging.getLogger('log')
+
+
+class IdleReaper:
+    """
+    终端会话空闲超时回收器
+
+    1. 进程内所有会话共用一个定时器，按到期时间维护最小堆
+    2. 会话有活动时只更新单调时钟时间戳，不操作堆
+    3. 到期时检查实际的最后活动时间，仍有活动则按新的到期时间重新入堆，否则触发超时回调
+    """
+
+    def __init__(self):
+        self._sessions = {}   # 会话ID -> [最后活动时间, 超时秒数, 超时回调]
+        self._heap = []       # (到期时间, 会话ID)
+        self._timer = None    # 唯一的定时器
+        self._wake_at = None  # 定时器触发时间
+
+    def track(self, session_id, timeout, on_timeout):
+        """
+        开始跟踪一个会话
+
+        Args:
+            session_id: 会话ID
+            timeout: 空闲超时(秒)
+            on_timeout: 超时回调，协程函数
+        """
+        now = time.monotonic()
+        self._sessions[session_id] = [now, timeout, on_timeout]
+        self._push(now + timeout, session_id)
+
+    def untrack(self, session_id):
+        """停止跟踪会话，堆中的旧条目到期时自动忽略"""
+        self._sessions.pop(session_id, None)
+
+    def touch(self, session_id):
+        """记录会话活动"""
+        entry = self._sessions.get(session_id)
+        if entry is not None:
+            entry[0] = time.monotonic()
+
+    def count(self):
+        """当前跟踪的会话数量"""
+        return len(self._sessions)
+
+    def _push(self, deadline, session_id):
+        heapq.heappush(self._heap, (deadline, session_id))
+        if self._wake_at is None or deadline < self._wake_at:
+            self._schedule(deadline)
+
+    def _schedule(self, deadline):
+        """把定时器调整到指定的到期时间"""
+        if self._timer:
+            self._timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._wake_at = deadline
+        self._timer = loop.call_later(max(0.0, deadline - time.monotonic()), self._reap)
+
+    def _reap(self):
+        """处理所有已到期的堆条目"""
+        self._timer = None
+        self._wake_at = None
+        now = time.monotonic()
+
+        while self._heap and self._heap[0][0] <= now:
+            _, session_id = heapq.heappop(self._heap)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                continue
+            last_activity, timeout, on_timeout = entry
+            deadline = last_activity + timeout
+            if deadline > now:
+                # 期间有活动，按新的到期时间重新入堆
+                heapq.heappush(self._heap, (deadline, session_id))
+                continue
+            del self._sessions[session_id]
+            asyncio.ensure_future(self._expire(session_id, on_timeout))
+
+        if self._heap:
+            self._schedule(self._heap[0][0])
+
+    async def _expire(self, session_id, on_timeout):
+        try:
+            await on_timeout()
+        except Exception as e:
+            logger.error(f"处理会话空闲超时出错: {session_id}, {str(e)}")
+
+
+# 进程内共享的空闲超时回收器
+idle_reaper = IdleReaper()
@@ -0,0 +1,96 @@
+import time
+
+
+class OutputBatcher:
+    """
+    终端输出合并器
+
+    1. 在短时间窗口内合并 SSH 输出，减少 WebSocket 帧数量
+    2. 累积数据达到字节上限时立即发送
+    3. 空闲后的首段输出和按键回显立即发送，保证交互响应
+    4. 统计发送帧数和字节数
+    """
+
+    def __init__(self, send, flush_interval=0.005, flush_bytes=64 * 1024):
+        self._send = send                    # 发送一帧数据的协程函数
+        self.flush_interval = flush_interval  # 合并窗口(秒)
+        self.flush_bytes = flush_bytes        # 单帧最大字节数
+
+        self._chunks = []           # 待发送的数据块
+        self._pending_size = 0      # 待发送数据大小
+        self._deadline = None       # 本批数据最迟发送时间
+        self._quiet_until = 0.0     # 在此时间之前到达的输出视为连续输出
+        self._echo_pending = False  # 是否有等待回显的用户输入
+
+        # 统计信息
+        self.started_at = time.monotonic()
+        self.frames_sent = 0
+        self.bytes_sent = 0
+
+    def mark_input(self):
+        """标记收到用户输入，下一段输出作为回显立即发送"""
+        self._echo_pending = True
+
+    def time_until_flush(self):
+        """
+        距离本批数据发送的剩余时间
+
+        Returns:
+            float | None: 剩余秒数，没有待发送数据时返回 None
+        """
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - time.monotonic())
+
+    async def push(self, data):
+        """
+        加入一段输出数据
+
+        Args:
+            data: SSH 输出数据
+        """
+        now = time.monotonic()
+        self._chunks.append(data)
+        self._pending_size += len(data)
+
+        # 回显或空闲后的首段输出立即发送
+        if self._echo_pending or (len(self._chunks) == 1 and now >= self._quiet_until):
+            self._echo_pending = False
+            await self.flush()
+            return
+
+        if self._pending_size >= self.flush_bytes:
+            await self.flush()
+        elif self._deadline is None:
+            self._deadline = now + self.flush_interval
+
+    async def flush(self):
+        """发送所有待发送数据"""
+        if not self._chunks:
+            return
+
+        frame = self._chunks[0] if len(self._chunks) == 1 else self._chunks[0][:0].join(self._chunks)
+        self._chunks = []
+        self._pending_size = 0
+        self._deadline = None
+        self._quiet_until = time.monotonic() + self.flush_interval
+
+        self.frames_sent += 1
+        self.bytes_sent += len(frame)
+        await self._send(frame)
+
+    def get_stats(self):
+        """
+        获取帧统计信息
+
+        Returns:
+            dict: frames_sent 发送帧数，bytes_sent 发送字节数，frames_per_second 每秒帧数，
+                  bytes_per_frame 平均每帧字节数
+        """
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        return {
+            'frames_sent': self.frames_sent,
+            'bytes_sent': self.bytes_sent,
+            'frames_per_second': round(self.frames_sent / elapsed, 2),
+            'bytes_per_frame': round(self.bytes_sent / self.frames_sent, 2) if self.frames_sent else 0,
+        }
@@ -0,0 +1,139 @@
+import time
+import uuid
+import threading
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.models import Token, User, Host, Credential, SystemSettings
+
+
+class TTLCache:
+    """
+    进程内短时缓存
+
+    条目在 ttl 秒后过期，超过容量时先清理过期条目，再淘汰最早写入的条目。
+    """
+
+    def __init__(self, ttl, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if len(self._data) >= self.max_size:
+                for k in [k for k, (expires, _) in self._data.items() if expires < now]:
+                    del self._data[k]
+                while len(self._data) >= self.max_size:
+                    del self._data[next(iter(self._data))]
+            self._data[key] = (now + self.ttl, value)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_ttl = settings.SSH_TERMINAL['BOOTSTRAP_CACHE_TTL']
+token_cache = TTLCache(_ttl)    # 令牌 -> 用户
+host_cache = TTLCache(_ttl)     # 规范化的主机ID（带连字符的 UUID）-> 主机（已关联凭据）
+settings_cache = TTLCache(_ttl)  # 系统设置
+
+
+def load_session_context(token, host_id):
+    """
+    加载终端会话所需的用户、主机、凭据和系统设置（阻塞调用）
+
+    令牌和用户、主机和凭据分别通过一次 select_related 查询获取，结果短时缓存，
+    同一用户短时间内打开多个终端时无需再次查询。
+
+    Args:
+        token: 用户令牌
+        host_id: 主机ID
+
+    Returns:
+        tuple: (用户, 主机, 凭据, 系统设置)，主机未关联凭据时凭据为 None，未配置系统设置时为 None
+
+    Raises:
+        Token.DoesNotExist: 令牌无效
+        Host.DoesNotExist: 主机不存在或主机ID无效
+    """
+    user = token_cache.get(token)
+    if user is None:
+        user = Token.objects.select_related('user').get(token=token).user
+        token_cache.set(token, user)
+
+    # 前端传入的主机ID不带连字符，统一为带连字符的格式，与保存主机时失效缓存的键一致
+    try:
+        host_key = str(uuid.UUID(host_id))
+    except ValueError:
+        raise Host.DoesNotExist(f"无效的主机ID: {host_id}")
+    host = host_cache.get(host_key)
+    if host is None:
+        host = Host.objects.select_related('account_type').get(id=host_key)
+        host_cache.set(host_key, host)
+
+    system_settings = settings_cache.get('system')
+    if system_settings is None:
+        system_settings = SystemSettings.objects.first()
+        if system_settings is not None:
+            settings_cache.set('system', system_settings)
+
+    return user, host, host.account_type, system_settings
+
+
+def get_cache_stats():
+    """
+    获取缓存命中统计
+
+    Returns:
+        dict: token、host、settings 三个缓存各自的 hits 命中次数和 misses 未命中次数
+    """
+    return {
+        name: {'hits': cache.hits, 'misses': cache.misses}
+        for name, cache in (('token', token_cache), ('host', host_cache), ('settings', settings_cache))
+    }
+
+
+# 数据变更时清除本进程内的缓存，其他进程依靠过期时间
+@receiver([post_save, post_delete], sender=Token)
+def _invalidate_token(sender, instance, **kwargs):
+    token_cache.pop(instance.token)
+
+
+@receiver([post_save, post_delete], sender=User)
+def _invalidate_user(sender, instance, **kwargs):
+    token_cache.clear()
+
+
+@receiver([post_save, post_delete], sender=Host)
+def _invalidate_host(sender, instance, **kwargs):
+    host_cache.pop(str(uuid.UUID(str(instance.id))))
+
+
+@receiver([post_save, post_delete], sender=Credential)
+def _invalidate_credential(sender, instance, **kwargs):
+    host_cache.clear()
+
+
+@receiver([post_save, post_delete], sender=SystemSettings)
+def _invalidate_settings(sender, instance, **kwargs):
+    settings_cache.clear()
@@ -0,0 +1,332 @@
+import os
+import json
+import gzip
+import time
+import asyncio
+import bisect
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Sum
+from apps.models import SessionRecording
+
+logger = logging.getLogger('log')
+
+# 录像写入线程池，序列化、压缩和写文件都在这里执行，不占用事件循环
+recording_executor = ThreadPoolExecutor(
+    max_workers=settings.SESSION_RECORDING['WRITER_WORKERS'],
+    thread_name_prefix='session-recorder'
+)
+
+# 录像文件 <id>.cast.gz 由多个 gzip 成员拼接而成，整体解压即为 asciicast v2 文件；
+# 索引文件 <id>.idx 每行记录一个分段的时间范围和在录像文件中的偏移，首行为录像头
+RECORDING_SUFFIX = '.cast.gz'
+INDEX_SUFFIX = '.idx'
+
+
+class SessionRecorder:
+    """
+    终端会话录像器
+
+    1. 以 asciicast v2 格式记录终端输出和窗口大小变化
+    2. 事件先缓存在内存中，按时间或大小切分为分段
+    3. 分段在线程池中压缩并追加写入录像文件，同时写入时间索引，不影响实时终端
+    4. 同一录像的分段按顺序写入
+    """
+
+    def __init__(self, path, width=80, height=24, title='', segment_seconds=30, segment_bytes=1024 * 1024,
+                 compress_level=6):
+        self.path = path                          # 录像文件路径
+        self.index_path = path[:-len(RECORDING_SUFFIX)] + INDEX_SUFFIX
+        self.width = width                        # 终端宽度
+        self.height = height                      # 终端高度
+        self.title = title                        # 录像标题
+        self.segment_seconds = segment_seconds    # 分段最长时间(秒)
+        self.segment_bytes = segment_bytes        # 分段最大字节数
+        self.compress_level = compress_level      # gzip 压缩级别
+
+        self.started = time.monotonic()
+        self.timestamp = int(time.time())
+        self._events = []            # 当前分段的事件 (时间, 类型, 数据)
+        self._buffered = 0           # 当前分段的数据大小
+        self._timer = None           # 分段定时器
+        self._lock = asyncio.Lock()  # 保证分段按顺序写入
+        self._tasks = set()          # 进行中的写入任务
+        self._offset = 0             # 录像文件当前大小
+        self._header_written = False
+        self._has_events = False     # 是否已记录过事件，之后的窗口大小变化不再更新录像头
+        self.closed = False
+
+        # 统计信息
+        self.events = 0
+        self.raw_bytes = 0
+        self.segments = 0
+        self.write_seconds = 0.0
+
+    def record_output(self, data):
+        """
+        记录一段终端输出
+
+        Args:
+            data: 解码后的输出文本
+        """
+        self._add('o', data)
+
+    def record_resize(self, cols, rows):
+        """
+        记录终端窗口大小变化，录像开始前的变化直接更新录像头
+        """
+        # 分段交给写入线程后录像头可能尚未写入，不能按录像头是否已写入判断
+        if not self._has_events:
+            self.width, self.height = cols, rows
+            return
+        self._add('r', f'{cols}x{rows}')
+
+    def _add(self, code, data):
+        if self.closed or not data:
+            return
+        if not self._events:
+            self._timer = asyncio.get_running_loop().call_later(self.segment_seconds, self._rotate)
+        self._has_events = True
+        self._events.append((time.monotonic() - self.started, code, data))
+        self._buffered += len(data)
+        if self._buffered >= self.segment_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        """结束当前分段，交给线程池写入"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._events:
+            return
+        events, self._events = self._events, []
+        self._buffered = 0
+        task = asyncio.ensure_future(self._write(events))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, events):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(recording_executor, self._write_segment, events)
+            except Exception as e:
+                logger.error(f"写入会话录像失败: {self.path}, {str(e)}")
+
+    def _write_segment(self, events):
+        """压缩一个分段并追加到录像文件（在线程池中执行）"""
+        started = time.perf_counter()
+        index_lines = []
+        payload = b''
+
+        if not self._header_written:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            header = {
+                'version': 2,
+                'width': self.width,
+                'height': self.height,
+                'timestamp': self.timestamp,
+                'title': self.title,
+                'env': {'TERM': 'xterm-256color'},
+            }
+            member = gzip.compress((json.dumps(header, ensure_ascii=False) + '\n').encode('utf-8'), self.compress_level)
+            index_lines.append(json.dumps({'header': header, 'offset': 0, 'length': len(member)}, ensure_ascii=False))
+            payload += member
+            self._offset += len(member)
+            self._header_written = True
+
+        lines = ''.join(
+            json.dumps([round(t, 6), code, data], ensure_ascii=False) + '\n' for t, code, data in events
+        )
+        member = gzip.compress(lines.encode('utf-8'), self.compress_level)
+        index_lines.append(json.dumps({
+            'start': round(events[0][0], 6),
+            'end': round(events[-1][0], 6),
+            'offset': self._offset,
+            'length': len(member),
+            'events': len(events),
+        }))
+        payload += member
+
+        with open(self.path, 'ab') as f:
+            f.write(payload)
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(index_lines) + '\n')
+
+        self._offset += len(member)
+        self.events += len(events)
+        self.raw_bytes += len(lines)
+        self.segments += 1
+        self.write_seconds += time.perf_counter() - started
+
+    async def close(self):
+        """
+        停止录像，写入剩余事件并等待所有分段写完
+
+        Returns:
+            float: 录像时长(秒)
+        """
+        if not self.closed:
+            self._rotate()
+            self.closed = True
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        return time.monotonic() - self.started
+
+    def get_stats(self):
+        """
+        获取录像统计信息
+
+        Returns:
+            dict: recording_events 事件数，recording_raw_bytes 原始字节数，recording_file_bytes 压缩后的文件字节数，
+                  recording_segments 分段数，recording_write_seconds 累计写入耗时(秒)
+        """
+        return {
+            'recording_events': self.events,
+            'recording_raw_bytes': self.raw_bytes,
+            'recording_file_bytes': self._offset,
+            'recording_segments': self.segments,
+            'recording_write_seconds': round(self.write_seconds, 3),
+        }
+
+
+def create_recorder(recording_id, started_at, title=''):
+    """
+    按系统配置创建录像器
+
+    Args:
+        recording_id: 录像ID
+        started_at: 会话开始时间，用于按日期归档
+        title: 录像标题
+
+    Returns:
+        SessionRecorder | None: 未开启录像时返回 None
+    """
+    config = settings.SESSION_RECORDING
+    if not config['ENABLED']:
+        return None
+    schedule_cleanup()
+    path = os.path.join(config['DIR'], started_at.strftime('%Y%m%d'), f'{recording_id}{RECORDING_SUFFIX}')
+    return SessionRecorder(
+        path,
+        title=title,
+        segment_seconds=config['SEGMENT_SECONDS'],
+        segment_bytes=config['SEGMENT_BYTES'],
+        compress_level=config['COMPRESS_LEVEL'],
+    )
+
+
+# 本进程上次自动清理录像的时间
+_last_cleanup = None
+
+
+def schedule_cleanup():
+    """距离上次清理超过清理间隔时，在录像线程池中清理一次过期和超出总大小的录像"""
+    global _last_cleanup
+    now = time.monotonic()
+    if _last_cleanup is not None and now - _last_cleanup < settings.SESSION_RECORDING['CLEANUP_INTERVAL']:
+        return
+    _last_cleanup = now
+    recording_executor.submit(_run_cleanup)
+
+
+def _run_cleanup():
+    try:
+        removed = cleanup_recordings()
+        if removed:
+            logger.info(f"已清理 {removed} 个会话录像")
+    except Exception as e:
+        logger.error(f"清理会话录像失败: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def cleanup_recordings():
+    """
+    删除超过保留天数的录像，总大小超出上限时再从最早的录像开始删除（阻塞调用）。
+    进行中的录像不删除。
+
+    Returns:
+        int: 删除的录像数
+    """
+    config = settings.SESSION_RECORDING
+    finished = SessionRecording.objects.filter(end_time__isnull=False).order_by('start_time')
+    removed = []
+
+    if config['MAX_AGE_DAYS']:
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=config['MAX_AGE_DAYS'])
+        removed.extend(finished.filter(start_time__lt=cutoff).values_list('id', 'file_path'))
+
+    if config['MAX_TOTAL_BYTES']:
+        expired = {recording_id for recording_id, _ in removed}
+        total = SessionRecording.objects.exclude(id__in=expired).aggregate(total=Sum('size'))['total'] or 0
+        if total > config['MAX_TOTAL_BYTES']:
+            for recording_id, file_path, size in finished.exclude(id__in=expired).values_list('id', 'file_path', 'size').iterator():
+                if total <= config['MAX_TOTAL_BYTES']:
+                    break
+                removed.append((recording_id, file_path))
+                total -= size
+
+    for _, file_path in removed:
+        for path in (file_path, file_path[:-len(RECORDING_SUFFIX)] + INDEX_SUFFIX):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            # 删除已经空了的日期目录
+            os.rmdir(os.path.dirname(file_path))
+        except OSError:
+            pass
+    SessionRecording.objects.filter(id__in=[recording_id for recording_id, _ in removed]).delete()
+    return len(removed)
+
+
+def read_recording(path, start=0.0, duration=None):
+    """
+    读取录像的某一时间段，通过时间索引定位分段，只解压覆盖该时间段的分段
+
+    Args:
+        path: 录像文件路径
+        start: 开始时间(秒)
+        duration: 读取时长(秒)，为空时读到录像结束
+
+    Returns:
+        dict: 录像头、时间段内的事件 [时间, 类型, 数据] 以及录像总时长
+    """
+    index_path = path[:-len(RECORDING_SUFFIX)] + INDEX_SUFFIX
+    with open(index_path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    if not entries:
+        raise ValueError('录像索引为空')
+
+    header = entries[0]['header']
+    segments = entries[1:]
+    stop = start + duration if duration is not None else None
+
+    events = []
+    # 第一个结束时间不早于 start 的分段
+    first = bisect.bisect_left([segment['end'] for segment in segments], start)
+    with open(path, 'rb') as f:
+        for segment in segments[first:]:
+            if stop is not None and segment['start'] >= stop:
+                break
+            f.seek(segment['offset'])
+            for line in gzip.decompress(f.read(segment['length'])).decode('utf-8').splitlines():
+                event = json.loads(line)
+                if event[0] < start:
+                    continue
+                if stop is not None and event[0] >= stop:
+                    break
+                events.append(event)
+
+    return {
+        'header': header,
+        'start': start,
+        'end': stop,
+        'duration': segments[-1]['end'] if segments else 0,
+        'events': events,
+    }
@@ -0,0 +1,37 @@
+import threading
+
+
+class SessionRegistry:
+    """
+    终端会话注册表
+
+    记录当前进程内所有活跃的 SSH 终端会话，用于统计和监控。
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def register(self, session_id, consumer):
+        """注册会话"""
+        with self._lock:
+            self._sessions[session_id] = consumer
+
+    def unregister(self, session_id):
+        """注销会话"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def count(self):
+        """当前会话数量"""
+        return len(self._sessions)
+
+    def snapshot(self):
+        """获取所有会话的统计信息"""
+        with self._lock:
+            consumers = list(self._sessions.values())
+        return [consumer.get_session_stats() for consumer in consumers]
+
+
+# 创建全局会话注册表实例
+session_registry = SessionRegistry()
@@ -0,0 +1,110 @@
+import threading
+
+
+class ScrollbackBuffer:
+    """
+    终端输出环形缓冲区
+
+    1. 按固定容量保留最近的输出字节，写满后覆盖最旧的数据，内存占用不超过容量
+    2. 记录累计写入的字节数，客户端按已接收的字节偏移读取之后的输出
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity    # 容量(字节)
+        self.total = 0              # 累计写入的字节数
+        self._buf = bytearray()     # 按需增长到容量后不再扩容
+        self._head = 0              # 写满后下一次写入的位置，也是最旧数据的位置
+
+    def append(self, data):
+        """
+        追加输出
+
+        Args:
+            data: 输出字节
+        """
+        size = len(data)
+        self.total += size
+        capacity = self.capacity
+        if size >= capacity:
+            self._buf = bytearray(data[size - capacity:])
+            self._head = 0
+            return
+
+        view = memoryview(data)
+        free = capacity - len(self._buf)
+        if free > 0:
+            self._buf += view[:free]
+            view = view[free:]
+            if not view:
+                return
+
+        # 缓冲区已满，从最旧的位置开始覆盖
+        head = self._head
+        end = head + len(view)
+        if end <= capacity:
+            self._buf[head:end] = view
+        else:
+            first = capacity - head
+            self._buf[head:] = view[:first]
+            self._buf[:end - capacity] = view[first:]
+        self._head = end % capacity
+
+    def read_from(self, offset):
+        """
+        读取指定偏移之后的输出
+
+        Args:
+            offset: 客户端已接收的字节数
+
+        Returns:
+            tuple: (输出字节, 偏移之后是否有数据已被覆盖)
+        """
+        size = len(self._buf)
+        oldest = self.total - size
+        lost = offset < oldest
+        offset = min(max(offset, oldest), self.total)
+        count = self.total - offset
+        if not count:
+            return b'', lost
+        data = bytes(self._buf[self._head:]) + bytes(self._buf[:self._head])
+        return data[size - count:], lost
+
+    def __len__(self):
+        return len(self._buf)
+
+
+class ResumableSessions:
+    """
+    可恢复的终端会话
+
+    按恢复令牌记录本进程内的会话，WebSocket 断开后会话在宽限期内保留，
+    客户端凭恢复令牌重新连接到同一进程时接入原 SSH 通道。
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def register(self, resume_token, consumer):
+        """登记会话"""
+        with self._lock:
+            self._sessions[resume_token] = consumer
+
+    def unregister(self, resume_token):
+        """移除会话"""
+        with self._lock:
+            self._sessions.pop(resume_token, None)
+
+    def get(self, resume_token):
+        """按恢复令牌查找会话"""
+        with self._lock:
+            return self._sessions.get(resume_token)
+
+    def detached_count(self):
+        """已断开、等待恢复的会话数量"""
+        with self._lock:
+            return sum(1 for consumer in self._sessions.values() if consumer.client is None)
+
+
+# 进程内共享的可恢复会话表
+resumable_sessions = ResumableSessions()
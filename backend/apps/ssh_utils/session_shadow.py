@@ -0,0 +1,155 @@
+import asyncio
+import logging
+
+logger = logging.getLogger('log')
+
+
+def control_group(shadow_id):
+    """会话控制组，只包含会话当前接入的 WebSocket 连接，观看者通过它加入和离开"""
+    return f'terminal_session_{shadow_id}'
+
+
+def watch_group(shadow_id):
+    """会话观看组，包含所有观看者"""
+    return f'terminal_shadow_{shadow_id}'
+
+
+class ShadowPublisher:
+    """
+    终端会话观看输出分发
+
+    1. 会话只有一个 SSH 读取循环，输出通过通道层发布到观看组，观看者可以在任意 ASGI 进程中
+    2. 没有观看者时不访问通道层；有观看者时读取循环只把输出追加到待发布缓冲区，
+       由后台任务合并后发布，会话本身不等待 Redis
+    3. 待发布缓冲区超过上限时丢弃发给观看者的输出并计数，不影响会话
+    4. 每次发布携带输出的累计字节偏移，观看者据此与加入时的快照衔接
+    """
+
+    def __init__(self, channel_layer, shadow_id, max_pending=1024 * 1024):
+        self.channel_layer = channel_layer
+        self.shadow_id = shadow_id
+        self.max_pending = max_pending    # 待发布缓冲区上限(字节)
+
+        self.watchers = set()             # 观看者的通道名
+        self.size = (80, 24)              # 终端列数和行数
+        self._pending = bytearray()       # 待发布的输出
+        self._pending_end = 0             # 待发布输出末尾的累计字节偏移
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        # 统计信息
+        self.published_bytes = 0
+        self.dropped_bytes = 0
+
+    async def attach(self, channel_name):
+        """把会话当前的连接加入控制组"""
+        try:
+            await self.channel_layer.group_add(control_group(self.shadow_id), channel_name)
+        except Exception as e:
+            logger.warning(f"加入会话控制组失败，会话无法被观看: {str(e)}")
+
+    async def detach(self, channel_name):
+        """连接断开时移出控制组"""
+        try:
+            await self.channel_layer.group_discard(control_group(self.shadow_id), channel_name)
+        except Exception as e:
+            logger.warning(f"移出会话控制组失败: {str(e)}")
+
+    def add_watcher(self, channel_name):
+        self.watchers.add(channel_name)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def remove_watcher(self, channel_name):
+        self.watchers.discard(channel_name)
+
+    def publish(self, data, end):
+        """
+        追加待发布的输出
+
+        Args:
+            data: 输出字节
+            end: 本段输出末尾的累计字节偏移
+        """
+        if not self.watchers:
+            return
+        if len(self._pending) + len(data) > self.max_pending:
+            self.dropped_bytes += len(data)
+            return
+        self._pending += data
+        self._pending_end = end
+        self._wakeup.set()
+
+    def resize(self, cols, rows):
+        """记录终端大小，随下一次发布通知观看者"""
+        self.size = (cols, rows)
+        if self.watchers:
+            self._wakeup.set()
+
+    async def send_snapshot(self, channel_name, data, offset, **info):
+        """
+        向新加入的观看者发送快照
+
+        Args:
+            channel_name: 观看者的通道名
+            data: 最近的输出
+            offset: 快照末尾的累计字节偏移
+            info: 会话信息（用户、主机等）
+        """
+        cols, rows = self.size
+        await self.channel_layer.send(channel_name, {
+            'type': 'shadow.snapshot',
+            'data': bytes(data),
+            'offset': offset,
+            'cols': cols,
+            'rows': rows,
+            **info,
+        })
+
+    async def _run(self):
+        """合并待发布的输出，发布到观看组"""
+        group = watch_group(self.shadow_id)
+        while self.watchers:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            data, self._pending = bytes(self._pending), bytearray()
+            cols, rows = self.size
+            try:
+                await self.channel_layer.group_send(group, {
+                    'type': 'shadow.output',
+                    'data': data,
+                    'end': self._pending_end,
+                    'cols': cols,
+                    'rows': rows,
+                })
+                self.published_bytes += len(data)
+            except Exception as e:
+                self.dropped_bytes += len(data)
+                logger.warning(f"发布会话输出失败: {str(e)}")
+
+    async def close(self):
+        """会话结束，通知所有观看者"""
+        if self._task:
+            self._task.cancel()
+        if not self.watchers:
+            return
+        self.watchers.clear()
+        try:
+            await self.channel_layer.group_send(watch_group(self.shadow_id), {'type': 'shadow.end'})
+        except Exception as e:
+            logger.warning(f"通知观看者会话结束失败: {str(e)}")
+
+    def get_stats(self):
+        """
+        获取观看统计信息
+
+        Returns:
+            dict: shadow_id 观看标识，watchers 观看者数，shadow_published_bytes 已发布字节数，
+                  shadow_dropped_bytes 积压过多或发布失败而丢弃的字节数
+        """
+        return {
+            'shadow_id': self.shadow_id,
+            'watchers': len(self.watchers),
+            'shadow_published_bytes': self.published_bytes,
+            'shadow_dropped_bytes': self.dropped_bytes,
+        }
@@ -0,0 +1,99 @@
+import socket
+import logging
+import paramiko
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from apps.ssh_utils.transport_pool import TransportPool
+from apps.ssh_utils.key_cache import load_private_key
+
+logger = logging.getLogger('log')
+
+# SSH 握手专用线程池，TCP 连接、密钥交换和认证都在这里执行，不阻塞事件循环
+ssh_connect_executor = ThreadPoolExecutor(
+    max_workers=settings.SSH_TERMINAL['CONNECT_WORKERS'],
+    thread_name_prefix='ssh-connect'
+)
+
+def connect_transport(host, credential):
+    """
+    建立并认证 SSH Transport（阻塞调用）
+
+    Args:
+        host: 主机对象
+        credential: 凭据对象
+
+    Returns:
+        paramiko.Transport: 已认证的连接
+    """
+    # 设置传输层参数
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(10)
+
+    try:
+        sock.connect((host.network, host.port))
+
+        transport = paramiko.Transport(sock)
+        transport.set_keepalive(30)  # 30秒发送一次心跳
+        transport.window_size = 2147483647  # 设置最大窗口大小
+        transport.packetizer.REKEY_BYTES = pow(2, 40)  # 重新生成密钥的字节数
+        transport.packetizer.REKEY_PACKETS = pow(2, 40)  # 重新生成密钥的包数量
+
+        if credential.type == '密码':
+            logger.debug(f"使用密码认证连接到主机: {host.network}")
+            transport.connect(username=credential.account, password=credential.password)
+        elif credential.type == '密钥':
+            logger.debug(f"使用密钥认证接到主机: {host.network}")
+            pkey = load_private_key(credential.key, credential.key_password, credential.id)
+            transport.connect(username=credential.account, pkey=pkey)
+        else:
+            raise ValueError(f"不支持的凭据类型: {credential.type}")
+
+        logger.debug(f"SSH 连接成功建立")
+        return transport
+
+    except Exception:
+        # 握手失败时释放套接字和传输层
+        if 'transport' in locals():
+            transport.close()
+        sock.close()
+        raise
+
+# 进程级 SSH 连接池，终端和文件管理共享已认证的连接
+transport_pool = TransportPool(
+    connect_transport,
+    idle_timeout=settings.SSH_TRANSPORT_POOL['IDLE_TIMEOUT'],
+    max_channels_per_transport=settings.SSH_TRANSPORT_POOL['MAX_CHANNELS_PER_TRANSPORT'],
+    max_channels_per_host=settings.SSH_TRANSPORT_POOL['MAX_CHANNELS_PER_HOST'],
+    health_check_interval=settings.SSH_TRANSPORT_POOL['HEALTH_CHECK_INTERVAL'],
+)
+
+def open_shell_channel(host, credential):
+    """
+    从连接池获取连接并打开交互式 shell（阻塞调用，需在 ssh_connect_executor 中执行）
+
+    Args:
+        host: 主机对象
+        credential: 凭据对象
+
+    Returns:
+        tuple: (ssh_client, ssh_channel)，ssh_client.close() 关闭 shell 并归还连接
+    """
+    ssh_client = transport_pool.acquire(host, credential)
+
+    try:
+        # 使用更大的终端大小启动 shell
+        ssh_channel = ssh_client.invoke_shell(
+            term='xterm-256color',
+            width=500,
+            height=2000,
+            width_pixels=0,
+            height_pixels=0
+        )
+        ssh_channel.settimeout(0)
+        ssh_channel.set_combine_stderr(True)  # 合并标准错误到标准输出
+
+        return ssh_client, ssh_channel
+
+    except Exception:
+        ssh_client.close()
+        raise
@@ -0,0 +1,372 @@
+import re
+
+# 终端输出词法: 可打印文本 / CSI / OSC / DCS 等字符串序列 / 其他 ESC 序列 / C0 控制字符
+_TOKEN = re.compile(
+    r'(?P<text>[^\x00-\x1f\x7f\x1b]+)'
+    r'|\x1b\[(?P<params>[0-?]*)[ -/]*(?P<final>[@-~])'
+    r'|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)'
+    r'|\x1b[PX^_][^\x1b]*\x1b\\'
+    r'|\x1b[ -/]*[0-~]'
+    r'|(?P<ctrl>[\x00-\x1a\x1c-\x1f\x7f])'
+)
+
+# 输出末尾未完成的转义序列: 未结束的 OSC / DCS 等字符串序列（可能停在 ST 的 ESC 上），未结束的 CSI 或 ESC 序列
+_INCOMPLETE = re.compile(
+    r'\x1b\][^\x07\x1b]*\x1b?\Z'
+    r'|\x1b[PX^_][^\x1b]*\x1b?\Z'
+    r'|\x1b(?:\[[0-?]*)?[ -/]*\Z'
+)
+
+# 默认 Shell 提示符规则，匹配一行开头的提示符: user@host:path$ 与 [user@host path]#
+DEFAULT_PROMPT_PATTERNS = (
+    r'[^@\r\n]+@[^:\r\n]+:[^$#\r\n]*[#$] ?',
+    r'[^\[\r\n]*\[[^\]\r\n]+@[^\]\r\n]+\][#$] ?',
+)
+
+# 未识别提示符时的兜底清理规则
+_FALLBACK_PROMPTS = (
+    re.compile(r'^\[.*?\]#\s*'),           # 方括号类型提示符
+    re.compile(r'^.*?[@:].*?[#$]\s*'),     # 常见的shell提示符格式
+)
+
+# 历史搜索提示符，如 (reverse-i-search)`ls': ls -la
+_SEARCH_PREFIXES = ('(reverse-i-search)', '(i-search)', '(failed reverse-i-search)', '(failed i-search)')
+_SEARCH_SEPARATOR = "': "
+
+# 备用屏幕模式（vim、less、top 等全屏程序）
+_ALT_SCREEN_MODES = ('?1049', '?1047', '?47')
+_ALT_SCREEN = re.compile(r'\x1b\[\?(?:1049|1047|47)([hl])')
+
+
+class TerminalParser:
+    """
+    流式终端解析器
+
+    1. 单遍增量解析 SSH 输出，跟踪转义序列状态（序列可跨多次读取）
+    2. 维护当前行的编辑状态（回车、退格、光标移动、行内擦除），即用户实际看到的命令行
+    3. 在当前行上识别提示符（支持按主机自定义规则），识别历史搜索(reverse-i-search)行
+    4. 识别全屏程序的备用屏幕，期间不采集命令；备用屏幕中当前行以提示符开头时（只输出了切换序列，
+       仍在 shell 中）照常按命令行处理，输出切换序列不能绕过命令采集和阻断检查
+    5. 用户按下回车后，在回显的换行处提交当前行，得到实际执行的命令
+    """
+
+    MAX_LINE = 4096       # 当前行最大长度，超出后丢弃行首
+    MAX_PENDING = 4096    # 未完成转义序列的最大缓存长度
+
+    def __init__(self, prompt_patterns=DEFAULT_PROMPT_PATTERNS):
+        self.prompt_patterns = [re.compile(pattern) for pattern in prompt_patterns]
+        self.line = ''              # 当前行内容
+        self.cursor = 0             # 光标所在列
+        self.prompt = None          # 当前行的提示符文本，None 表示当前行不是命令行
+        self.last_prompt = None     # 最近一次识别到的提示符
+        self.alt_screen = False     # 是否处于备用屏幕
+        self.pending_enters = 0     # 已按下但尚未回显的回车数
+        self._pending = ''          # 未完成的转义序列
+        self._line_changed = False  # 上次提示符检测后当前行是否有变化
+
+    # ---------------------------------------------------------------- 输入
+
+    def feed_input(self, data):
+        """
+        处理用户输入，只关心回车和 Ctrl+C
+
+        Args:
+            data: 用户输入的文本或原始字节
+        """
+        if self.alt_screen and not self.shows_prompt():
+            return
+        ctrl_c, cr, lf, crlf = ('\x03', '\r', '\n', '\r\n') if isinstance(data, str) else (b'\x03', b'\r', b'\n', b'\r\n')
+        if ctrl_c in data:
+            # Ctrl+C 取消当前输入
+            self.pending_enters = 0
+            data = data[data.rindex(ctrl_c) + 1:]
+        self.pending_enters += data.count(cr) + data.count(lf) - data.count(crlf)
+
+    # ---------------------------------------------------------------- 输出
+
+    def feed_output(self, data):
+        """
+        增量解析 SSH 输出
+
+        Args:
+            data: 解码后的输出文本
+
+        Returns:
+            list: 本次输出中提交的命令，每个待回显的回车对应一项，未识别到命令时为空字符串
+        """
+        if self._pending:
+            data = self._pending + data
+            self._pending = ''
+
+        # 序列在读取边界处被截断时，不完整的部分会被当作普通 ESC 序列和文本解析，留到下次与后续输出拼接。
+        # 序列内部除结尾的 ST 外不含 ESC，只需从最后两个 ESC 开始查找
+        window = max(0, len(data) - self.MAX_PENDING)
+        last = data.rfind('\x1b', window)
+        if last >= 0:
+            start = data.rfind('\x1b', window, last)
+            tail = _INCOMPLETE.search(data, start if start >= 0 else last)
+            if tail is not None:
+                self._pending = data[tail.start():]
+                data = data[:tail.start()]
+
+        commands = []
+        pos = 0
+        end = len(data)
+        match_token = _TOKEN.match
+        last_newline = data.rfind('\n')
+        if not self.pending_enters:
+            pos = self._skip_lines(data, pos, last_newline)
+
+        while pos < end:
+            m = match_token(data, pos)
+            if m is None:
+                # 只可能停在 ESC 上: 序列不完整时留到下次，否则跳过该字符
+                rest = data[pos:]
+                if len(rest) < self.MAX_PENDING:
+                    self._pending = rest
+                    break
+                pos += 1
+                continue
+
+            pos = m.end()
+            text = m.group('text')
+            if text is not None:
+                self._write(text)
+                continue
+
+            ctrl = m.group('ctrl')
+            if ctrl is not None:
+                if ctrl == '\n':
+                    command = self._commit_line()
+                    if command is not None:
+                        commands.append(command)
+                    if not self.pending_enters:
+                        pos = self._skip_lines(data, pos, last_newline)
+                elif ctrl == '\r':
+                    self.cursor = 0
+                elif ctrl == '\b':
+                    if self.cursor > 0:
+                        self.cursor -= 1
+                elif ctrl == '\t':
+                    self._write(' ' * (8 - self.cursor % 8))
+                continue
+
+            final = m.group('final')
+            if final is not None:
+                self._csi(m.group('params'), final)
+
+        return commands
+
+    def _skip_lines(self, data, pos, last_newline):
+        """
+        没有待回显的回车时，最后一个换行之前的输出不影响命令行，直接跳过，
+        只需找出其中最后一次备用屏幕切换。大量输出时解析开销只与最后一行有关。
+
+        Returns:
+            int: 继续解析的位置
+        """
+        if last_newline < pos:
+            return pos
+        toggle = None
+        for toggle in _ALT_SCREEN.finditer(data, pos, last_newline):
+            pass
+        if toggle is not None:
+            self.alt_screen = toggle.group(1) == 'h'
+        self._reset_line()
+        return last_newline + 1
+
+    def _write(self, text):
+        """在光标处写入文本（覆盖模式）"""
+        line = self.line
+        cursor = self.cursor
+        if cursor == len(line):
+            line += text
+        elif cursor > len(line):
+            line += ' ' * (cursor - len(line)) + text
+        else:
+            line = line[:cursor] + text + line[cursor + len(text):]
+        cursor += len(text)
+
+        if len(line) > self.MAX_LINE:
+            # 超长行（无换行的大量输出）只保留行尾，不再是命令行
+            drop = len(line) - self.MAX_LINE
+            line = line[drop:]
+            cursor = max(0, cursor - drop)
+            self.prompt = None
+
+        self.line = line
+        self.cursor = cursor
+        self._line_changed = True
+
+    def _csi(self, params, final):
+        """处理 CSI 控制序列"""
+        if final == 'm':
+            return
+
+        if final in 'hl':
+            if params in _ALT_SCREEN_MODES:
+                # 切换屏幕后当前行重新开始，之前识别的提示符不再有效
+                self.alt_screen = final == 'h'
+                self.pending_enters = 0
+                self._reset_line()
+            return
+
+        n = int(params) if params.isdigit() else 0
+        line = self.line
+        cursor = self.cursor
+        self._line_changed = True
+
+        if final == 'K':
+            # 行内擦除: 0 光标到行尾, 1 行首到光标, 2 整行
+            if n == 0:
+                self.line = line[:cursor]
+            elif n == 1:
+                self.line = ' ' * cursor + line[cursor:]
+            else:
+                self.line = ''
+        elif final == 'C':
+            self.cursor = cursor + max(n, 1)
+        elif final == 'D':
+            self.cursor = max(0, cursor - max(n, 1))
+        elif final == 'G':
+            self.cursor = max(n, 1) - 1
+        elif final == 'P':
+            self.line = line[:cursor] + line[cursor + max(n, 1):]
+        elif final == '@':
+            self.line = line[:cursor] + ' ' * max(n, 1) + line[cursor:]
+        elif final == 'X':
+            count = max(n, 1)
+            self.line = line[:cursor] + ' ' * min(count, max(0, len(line) - cursor)) + line[cursor + count:]
+        elif final == 'J':
+            if n == 0:
+                self.line = line[:cursor]
+            elif n >= 2:
+                self._reset_line()
+        elif final in 'Hf':
+            # 光标定位 row;col，只关心列
+            col = params.split(';')[1] if ';' in params else ''
+            self.cursor = int(col) - 1 if col.isdigit() and int(col) > 0 else 0
+
+    def _reset_line(self):
+        self.line = ''
+        self.cursor = 0
+        self.prompt = None
+        self._line_changed = True
+
+    def _commit_line(self):
+        """
+        换行时提交当前行
+
+        Returns:
+            str | None: 如果这一行是用户回车确认的命令行，返回命令（可能为空字符串），否则返回 None
+        """
+        command = None
+        if self.pending_enters and (not self.alt_screen or self.shows_prompt()):
+            if self.prompt is None:
+                # 连续输入多条命令时，提示符和回显可能在同一次读取中到达，未来得及检测
+                self._match_prompt()
+            # 已识别过提示符时，只有命令行的换行才对应回车（命令输出、密码输入行不算）
+            if self.prompt is not None or self.line.startswith(_SEARCH_PREFIXES) or self.last_prompt is None:
+                self.pending_enters -= 1
+                command = self.current_command()
+        self._reset_line()
+        return command
+
+    # ---------------------------------------------------------------- 提示符
+
+    def detect_prompt(self):
+        """
+        检测光标前的内容是否恰好是提示符，只检查最后一个换行之后的当前行。
+        当前行自上次检测后没有变化时直接返回，调用方在输出读空（shell 等待输入）时调用即可，
+        大量输出期间无需检测。
+
+        Returns:
+            bool: 是否检测到新的提示符
+        """
+        if not self._line_changed or self.alt_screen:
+            return False
+        self._line_changed = False
+
+        text = self.line[:self.cursor]
+        for pattern in self.prompt_patterns:
+            if pattern.fullmatch(text):
+                self.mark_prompt()
+                return True
+        return False
+
+    def _match_prompt(self):
+        """在当前行开头匹配提示符，匹配成功时记录提示符边界"""
+        for pattern in self.prompt_patterns:
+            m = pattern.match(self.line)
+            if m:
+                self.prompt = self.line[:m.end()]
+                self.last_prompt = self.prompt
+                return
+
+    def shows_prompt(self):
+        """
+        当前行是否以提示符开头，备用屏幕中据此判断是否仍在 shell 中
+
+        Returns:
+            bool: 当前行是否以提示符开头
+        """
+        if self.prompt is None:
+            self._match_prompt()
+        return self.prompt is not None
+
+    def mark_prompt(self):
+        """标记当前光标位置之前的内容为提示符"""
+        self.prompt = self.line[:self.cursor]
+        self.last_prompt = self.prompt
+
+    def pending_command(self):
+        """
+        用户按下回车前当前行中的命令，供回车时检查阻断规则
+
+        Returns:
+            str | None: 去除提示符后的命令，当前行不是命令行时返回 None（备用屏幕中同样以提示符判断）
+        """
+        if not self.shows_prompt():
+            return None
+        return self.current_command()
+
+    def current_command(self):
+        """
+        当前行中的命令文本
+
+        Returns:
+            str: 去除提示符后的命令，无法确定提示符时返回空字符串
+        """
+        line = self.line
+        if line.startswith(_SEARCH_PREFIXES):
+            index = line.find(_SEARCH_SEPARATOR)
+            return line[index + len(_SEARCH_SEPARATOR):].strip() if index >= 0 else ''
+        if self.prompt is not None and line.startswith(self.prompt):
+            return line[len(self.prompt):].strip()
+        return ''
+
+    def clean_line(self, text):
+        """
+        清理一段包含提示符和转义序列的终端行文本（如客户端上报的命令行）
+
+        Args:
+            text: 原始行文本
+
+        Returns:
+            str: 清理后的命令
+        """
+        parser = TerminalParser()
+        parser.feed_output(text)
+        line = parser.line.strip()
+
+        if line.startswith(_SEARCH_PREFIXES):
+            index = line.find(_SEARCH_SEPARATOR)
+            return line[index + len(_SEARCH_SEPARATOR):].strip() if index >= 0 else ''
+
+        prompt = (self.last_prompt or '').strip()
+        if prompt and line.startswith(prompt):
+            return line[len(prompt):].strip()
+
+        for pattern in _FALLBACK_PROMPTS:
+            line = pattern.sub('', line, count=1)
+        return line.strip()
@@ -0,0 +1,40 @@
+import struct
+
+# 终端 WebSocket 二进制输入协议
+# 客户端以二进制帧发送，首字节为操作码，其后为负载:
+#   INPUT   原始输入字节（UTF-8），不做任何解析直接写入 SSH 通道
+#   RESIZE  列数、行数，各 2 字节大端无符号整数
+#   COMMAND 客户端记录的命令行文本（UTF-8），服务端无法识别命令时使用
+#   PING    无负载，服务端回复 pong 文本帧
+#   ACK     已渲染的输出字节数，4 字节大端无符号整数
+# 文本帧仍按 JSON 兼容模式处理。
+OP_INPUT = 0x00
+OP_RESIZE = 0x01
+OP_COMMAND = 0x02
+OP_PING = 0x03
+OP_ACK = 0x04
+
+_RESIZE = struct.Struct('>HH')
+_ACK = struct.Struct('>I')
+
+PONG = '{"type": "pong"}'
+
+
+def parse_resize(frame):
+    """
+    解析 RESIZE 帧
+
+    Returns:
+        tuple: (列数, 行数)
+    """
+    return _RESIZE.unpack_from(frame, 1)
+
+
+def parse_ack(frame):
+    """
+    解析 ACK 帧
+
+    Returns:
+        int: 已渲染的输出字节数
+    """
+    return _ACK.unpack_from(frame, 1)[0]
@@ -0,0 +1,287 @@
+import time
+import hashlib
+import logging
+import threading
+import paramiko
+
+logger = logging.getLogger('log')
+
+
+class TransportPoolExhausted(paramiko.SSHException):
+    """主机通道数达到上限"""
+
+
+class PooledTransport:
+    """
+    连接池中的一条已认证 SSH 连接
+    """
+
+    def __init__(self, key, transport):
+        self.key = key
+        self.transport = transport
+        self.leases = 0                      # 当前借出的客户端数量
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+
+    def is_healthy(self):
+        """连接是否可用"""
+        return self.transport.is_active() and self.transport.is_authenticated()
+
+    def probe(self):
+        """发送 SSH_MSG_IGNORE 探测连接是否存活"""
+        try:
+            self.transport.send_ignore()
+        except Exception:
+            return False
+        self.last_checked = time.monotonic()
+        return self.is_healthy()
+
+
+class PooledSSHClient(paramiko.SSHClient):
+    """
+    基于连接池中已认证 Transport 的 SSHClient
+
+    invoke_shell / exec_command / open_sftp 在共享连接上打开新通道，
+    close() 只关闭本客户端打开的通道并归还连接，不会断开 Transport。
+    """
+
+    def __init__(self, pool, entry):
+        super().__init__()
+        self._pool = pool
+        self._entry = entry
+        self._transport = entry.transport
+        self._channels = []
+        self._released = False
+
+    def invoke_shell(self, *args, **kwargs):
+        channel = super().invoke_shell(*args, **kwargs)
+        self._channels.append(channel)
+        return channel
+
+    def exec_command(self, *args, **kwargs):
+        stdin, stdout, stderr = super().exec_command(*args, **kwargs)
+        self._channels.append(stdout.channel)
+        return stdin, stdout, stderr
+
+    def open_sftp(self):
+        sftp_client = super().open_sftp()
+        self._channels.append(sftp_client.get_channel())
+        return sftp_client
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        for channel in self._channels:
+            channel.close()
+        self._channels = []
+        self._transport = None
+        self._pool.release(self._entry)
+
+
+class TransportPool:
+    """
+    进程级 SSH 连接池
+
+    1. 按 (主机地址, 端口, 凭据) 复用已认证的 Transport，终端、文件浏览和上传下载共享连接
+    2. 单条连接的通道数达到上限时建立新连接，单台主机的总通道数有上限
+    3. 空闲连接超时后关闭，复用前对空闲连接做存活探测
+    """
+
+    def __init__(self, connect, idle_timeout=300, max_channels_per_transport=4,
+                 max_channels_per_host=32, health_check_interval=30):
+        self._connect = connect    # 建立已认证 Transport 的函数 connect(host, credential)
+        self.idle_timeout = idle_timeout
+        self.max_channels_per_transport = max_channels_per_transport
+        self.max_channels_per_host = max_channels_per_host
+        self.health_check_interval = health_check_interval
+
+        self._entries = {}         # key -> [PooledTransport]
+        self._lock = threading.Lock()
+        self._key_locks = {}       # key -> Lock，避免同一 key 并发握手
+        self._key_lock_users = {}  # key -> 正在使用或等待握手锁的线程数，为 0 且没有连接时才移除握手锁
+        self._reaper = None
+
+        # 统计信息
+        self.handshakes = 0
+        self.reuses = 0
+
+    @staticmethod
+    def make_key(host, credential):
+        """
+        生成连接池键，凭据内容变化后不会复用旧连接
+        """
+        secret = f"{credential.account}\0{credential.password}\0{credential.key}\0{credential.key_password}"
+        digest = hashlib.sha256(secret.encode('utf-8')).hexdigest()[:16]
+        return (host.network, host.port, credential.id, digest)
+
+    def acquire(self, host, credential):
+        """
+        获取一个基于共享连接的 SSH 客户端（阻塞调用，可能触发握手）
+
+        Returns:
+            PooledSSHClient: 使用完毕后调用 close() 归还
+        """
+        self._start_reaper()
+        key = self.make_key(host, credential)
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+            self._key_lock_users[key] = self._key_lock_users.get(key, 0) + 1
+
+        try:
+            with key_lock:
+                entry = self._checkout(key)
+                if entry is None:
+                    transport = self._connect(host, credential)
+                    entry = PooledTransport(key, transport)
+                    entry.leases = 1
+                    with self._lock:
+                        self._entries.setdefault(key, []).append(entry)
+                        self.handshakes += 1
+                    logger.debug(f"SSH 连接池新建连接: {host.network}:{host.port}")
+                else:
+                    logger.debug(f"SSH 连接池复用连接: {host.network}:{host.port}")
+        finally:
+            with self._lock:
+                self._key_lock_users[key] -= 1
+                # 握手失败时该 key 没有连接，没有其他线程在等待时移除握手锁；
+                # 有线程等待时保留，避免之后的线程新建另一把锁并发握手
+                if key not in self._entries:
+                    self._drop_key_lock(key)
+
+        return PooledSSHClient(self, entry)
+
+    def release(self, entry):
+        """归还连接"""
+        with self._lock:
+            entry.leases = max(0, entry.leases - 1)
+            entry.last_used = time.monotonic()
+
+    def _checkout(self, key):
+        """从池中取出一条有空余通道的健康连接，没有时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = list(self._entries.get(key, []))
+
+        for entry in candidates:
+            if entry.leases >= self.max_channels_per_transport:
+                continue
+            healthy = entry.is_healthy()
+            if healthy and now - entry.last_checked >= self.health_check_interval:
+                healthy = entry.probe()
+            if not healthy:
+                self._discard(entry)
+                continue
+            with self._lock:
+                # 复制列表后连接可能已被回收
+                if entry.leases >= self.max_channels_per_transport or entry not in self._entries.get(key, ()):
+                    continue
+                self._check_host_capacity(key)
+                entry.leases += 1
+                entry.last_used = now
+                self.reuses += 1
+            return entry
+
+        with self._lock:
+            self._check_host_capacity(key)
+        return None
+
+    def _check_host_capacity(self, key):
+        """检查主机总通道数，需持有 self._lock"""
+        host_key = key[:2]
+        in_use = sum(
+            entry.leases
+            for entry_key, entries in self._entries.items() if entry_key[:2] == host_key
+            for entry in entries
+        )
+        if in_use >= self.max_channels_per_host:
+            raise TransportPoolExhausted(f"主机 {host_key[0]}:{host_key[1]} 的通道数已达上限 {self.max_channels_per_host}")
+
+    def _remove(self, entry):
+        """
+        从池中移除连接，需持有 self._lock；该 key 没有连接且没有线程使用握手锁时一并移除握手锁
+
+        Returns:
+            bool: 连接是否仍在池中并已移除
+        """
+        entries = self._entries.get(entry.key, [])
+        removed = entry in entries
+        if removed:
+            entries.remove(entry)
+        if not entries:
+            self._entries.pop(entry.key, None)
+            self._drop_key_lock(entry.key)
+        return removed
+
+    def _drop_key_lock(self, key):
+        """没有线程使用或等待时移除 key 的握手锁，需持有 self._lock"""
+        if not self._key_lock_users.get(key):
+            self._key_locks.pop(key, None)
+            self._key_lock_users.pop(key, None)
+
+    def _discard(self, entry):
+        """从池中移除并关闭连接"""
+        with self._lock:
+            self._remove(entry)
+        self._close(entry)
+
+    @staticmethod
+    def _close(entry):
+        try:
+            entry.transport.close()
+        except Exception:
+            pass
+
+    def reap(self):
+        """关闭空闲超时和已失效的连接"""
+        now = time.monotonic()
+        with self._lock:
+            entries = [entry for entries in self._entries.values() for entry in entries]
+
+        for entry in entries:
+            if not entry.is_healthy():
+                self._discard(entry)
+                continue
+            with self._lock:
+                # 在锁内检查空闲并移除，移除后不会再被借出
+                idle = entry.leases == 0 and now - entry.last_used >= self.idle_timeout and self._remove(entry)
+            if idle:
+                logger.debug(f"SSH 连接池关闭空闲连接: {entry.key[0]}:{entry.key[1]}")
+                self._close(entry)
+
+    def _start_reaper(self):
+        """启动空闲连接回收线程"""
+        if self._reaper is not None:
+            return
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_forever, name='ssh-pool-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self):
+        interval = max(1, min(self.idle_timeout, self.health_check_interval))
+        while True:
+            time.sleep(interval)
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"SSH 连接池回收出错: {str(e)}")
+
+    def get_stats(self):
+        """
+        获取连接池统计信息
+
+        Returns:
+            dict: transports 池中的连接数，channels_in_use 使用中的通道数，handshakes 握手次数，reuses 复用次数
+        """
+        with self._lock:
+            entries = [entry for entries in self._entries.values() for entry in entries]
+        return {
+            'transports': len(entries),
+            'channels_in_use': sum(entry.leases for entry in entries),
+            'handshakes': self.handshakes,
+            'reuses': self.reuses,
+        }
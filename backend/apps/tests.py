@@ -1,3 +1,980 @@
-from django.test import TestCase
+import os
+import gzip
+import tempfile
+import contextlib
+import re
+import json
+import uuid
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest import mock
+import redis
+from django.conf import settings
+from django.test import SimpleTestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+from apps.alert_utils.rule_matcher import RuleMatcher, check_pattern
+from apps.alert_utils.regex_sandbox import RegexSandbox
+from apps.alert_utils.alert_rule_cache import CompiledRule
+from apps.ssh_utils.terminal_parser import TerminalParser
+from apps.ssh_utils.command_guard import CommandGuard
+from apps.ssh_utils.batch_executor import run_host_command
+from apps.ssh_utils.transport_pool import TransportPool, TransportPoolExhausted
+from apps.ssh_utils.session_recorder import SessionRecorder, read_recording, RECORDING_SUFFIX
+from apps.views.batch_command_consumer import BatchCommandConsumer
+from apps.views.consumers import SSHConsumer
+from apps.ssh_utils.flow_control import OutputFlowControl
+from apps.ssh_utils.session_resume import ScrollbackBuffer, resumable_sessions
+from apps.views.terminal_sessions import TerminalSessionStatsView
+from apps.views.system_settings import SystemSettingsView
+from apps.alert_utils.webhook_client import WebhookClient, CircuitOpenError, redact_url
+from apps.alert_utils.alert_dispatcher import AlertDispatcher
 
-# Create your tests here.
+
+def compiled_rule(rule_id, match_type, *commands):
+    """按数据库中保存的格式构造规则"""
+    return CompiledRule(SimpleNamespace(id=rule_id, name=f'rule{rule_id}', match_type=match_type, suppress_window=0,
+                                        action='block', command_rule=json.dumps(commands)))
+
+
+# 在 20 多个字符上灾难性回溯的正则
+SLOW_PATTERN = r'(a+)+$'
+SLOW_COMMAND = 'rm ' + 'a' * 40 + '! ls'
+
+
+def stop_sandbox(sandbox):
+    """结束正则执行进程和等待线程"""
+    with sandbox._lock:
+        if sandbox._process is not None:
+            sandbox._stop_process()
+    sandbox._executor.shutdown()
+
+
+class FakeMatcher:
+    """按命令精确匹配的规则匹配器，searched 中的命令需要执行正则才能确定，undetermined 中的命令执行正则无法确定"""
+
+    def __init__(self, *commands, searched=(), undetermined=()):
+        self.rule = SimpleNamespace(id=1, name='block', suppress_window=0)
+        self.commands = set(commands)
+        self.searched = set(searched)
+        self.undetermined = set(undetermined)  # 正则超时或已降级的命令
+
+    def match_exact(self, command):
+        if command in self.searched:
+            return [], True
+        return ([self.rule] if command in self.commands else []), False
+
+    async def match_async(self, command):
+        await asyncio.sleep(0)
+        return ([self.rule] if command in self.commands else []), ([self.rule] if command in self.undetermined else [])
+
+
+class CommandGuardTests(SimpleTestCase):
+    """回车时的命令阻断检查"""
+
+    def setUp(self):
+        self.parser = TerminalParser()
+        self.sent = []
+        self.blocked = []
+        self.client_command = None
+        self.matcher = FakeMatcher('rm -rf /x')
+        self.guard = CommandGuard(
+            lambda: self.matcher,
+            self.parser,
+            self.sent.append,
+            lambda command, rule: self.blocked.append((command, rule)),
+            get_client_command=lambda: self.client_command,
+        )
+
+    def output(self, text):
+        """模拟 shell 输出，随后输出读空"""
+        self.parser.feed_output(text)
+        self.parser.detect_prompt()
+        self.guard.on_idle()
+
+    def type_line(self, keys, echo):
+        """输入回车前的内容并等待回显，然后按下回车"""
+        self.guard.feed(keys)
+        self.output(echo)
+        self.guard.feed(b'\r')
+
+    def test_default_prompt_blocked(self):
+        self.output('root@h:~# ')
+        self.type_line(b'rm -rf /x', 'rm -rf /x')
+        self.assertEqual(self.sent[-1], b'\x03')
+        self.assertEqual(self.blocked[0][0], 'rm -rf /x')
+
+    def test_allowed_command_forwarded(self):
+        self.output('root@h:~# ')
+        self.type_line(b'ls /x', 'ls /x')
+        self.assertEqual(self.sent[-1], b'\r')
+        self.assertEqual(self.blocked, [])
+
+    def test_custom_prompt_blocked(self):
+        # export PS1='$ ' 之后提示符不再被识别
+        self.output('$ ')
+        self.type_line(b'rm -rf /x', 'rm -rf /x')
+        self.assertNotIn(b'\r', self.sent)
+        self.assertEqual(self.blocked[0][0], 'rm -rf /x')
+
+    def test_custom_prompt_edited_blocked(self):
+        self.output('$ ')
+        self.type_line(b'rm -rf /y\x7fx', 'rm -rf /y\b \bx')
+        self.assertNotIn(b'\r', self.sent)
+        self.assertEqual(self.blocked[0][0], 'rm -rf /x')
+
+    def test_client_command_checked(self):
+        self.output('$ ')
+        self.client_command = '$ rm -rf /x'
+        self.type_line(b'rm -rf /y\x7fx', 'rm -rf /y\b \bx')
+        self.assertEqual(self.blocked[0][0], 'rm -rf /x')
+
+    def test_undetermined_command_rejected(self):
+        # 回车后紧接着输入，提示符未回显，输入经过编辑，客户端未上报命令行
+        self.output('$ ')
+        self.guard.feed(b'\r')
+        self.guard.feed(b'rm -rf /y\x7fx')
+        self.output('\r\n$ rm -rf /y\b \bx')
+        self.guard.feed(b'\r')
+        self.assertEqual(b''.join(self.sent), b'\rrm -rf /y\x7fx')
+        self.assertEqual(self.blocked, [(None, None)])
+
+    def test_pattern_checked_in_background(self):
+        self.matcher = FakeMatcher('rm -rf /x', searched=('rm -rf /x', 'ls'))
+
+        async def run():
+            self.output('root@h:~# ')
+            self.type_line(b'rm -rf /x', 'rm -rf /x')
+            self.guard.feed(b'echo b\r')
+            self.assertEqual(self.sent, [b'rm -rf /x'])
+            await asyncio.sleep(0.01)
+            self.assertEqual(self.sent[-1], b'\x03')
+
+            self.output('^C\r\nroot@h:~# ')
+            self.type_line(b'ls', 'ls')
+            await asyncio.sleep(0.01)
+            self.assertEqual(self.sent[-1], b'\r')
+
+        asyncio.run(run())
+        self.assertEqual(self.blocked[0][0], 'rm -rf /x')
+
+    def test_undetermined_pattern_rejected(self):
+        self.matcher = FakeMatcher(searched=('rm -rf /x',), undetermined=('rm -rf /x',))
+
+        async def run():
+            self.output('root@h:~# ')
+            self.type_line(b'rm -rf /x', 'rm -rf /x')
+            self.guard.feed(b'echo b\r')
+            await asyncio.sleep(0.01)
+
+        asyncio.run(run())
+        self.assertEqual(self.sent, [b'rm -rf /x'])
+        self.assertEqual(self.blocked, [(None, None)])
+        self.assertEqual(self.guard.rejected, 1)
+
+    def test_pattern_timeout_rejected(self):
+        sandbox = RegexSandbox(0.2)
+        self.addCleanup(stop_sandbox, sandbox)
+        with self.assertLogs('log', 'WARNING'):
+            rule = compiled_rule(1, 'fuzzy', r'rm\s+' + SLOW_PATTERN)
+        self.matcher = RuleMatcher([rule], sandbox.search, sandbox.search_async)
+        command = SLOW_COMMAND[:-3]
+
+        async def run():
+            self.output('root@h:~# ')
+            self.type_line(command.encode(), command)
+            for _ in range(500):
+                if self.blocked:
+                    break
+                await asyncio.sleep(0.01)
+
+        with self.assertLogs('log', 'ERROR'):
+            asyncio.run(run())
+        self.assertEqual(self.blocked, [(None, None)])
+        self.assertNotIn(b'\r', self.sent)
+
+    def test_search_error_rejected(self):
+        self.matcher = FakeMatcher(searched=('ls',))
+
+        async def fail(command):
+            raise OSError('sandbox unavailable')
+        self.matcher.match_async = fail
+
+        async def run():
+            self.output('root@h:~# ')
+            self.type_line(b'ls', 'ls')
+            await asyncio.sleep(0.01)
+
+        asyncio.run(run())
+        self.assertEqual(self.blocked, [(None, None)])
+
+    def test_alt_screen_switch_does_not_bypass(self):
+        # printf '\e[?1049h' 之后仍在 shell 中，提示符出现在备用屏幕里
+        self.output('root@h:~# ')
+        self.type_line(b"printf '\\e[?1049h'", "printf '\\e[?1049h'")
+        self.output("\r\n\x1b[?1049hroot@h:~# ")
+        self.assertTrue(self.parser.alt_screen)
+        self.type_line(b'rm -rf /x', 'rm -rf /x')
+        self.assertEqual(self.sent[-1], b'\x03')
+        self.assertEqual(self.blocked[0][0], 'rm -rf /x')
+
+    def test_full_screen_program_not_checked(self):
+        # vim 等全屏程序中的回车不是命令，直接发送
+        self.output('root@h:~# ')
+        self.type_line(b'vim notes', 'vim notes')
+        self.output('\r\n\x1b[?1049h\x1b[1;1H\x1b[2J~\x1b[2;1H~\x1b[24;1H"notes" [New]\x1b[1;1H')
+        self.type_line(b'rm -rf /x', 'rm -rf /x')
+        self.assertEqual(self.sent[-1], b'\r')
+        self.assertEqual(self.blocked, [])
+
+    def test_input_after_blocked_line_dropped(self):
+        self.output('root@h:~# ')
+        self.type_line(b'echo a', 'echo a')
+        self.output('\r\na\r\nroot@h:~# ')
+        self.guard.feed(b'rm -rf /x')
+        self.output('rm -rf /x')
+        self.guard.feed(b'\recho b\r')
+        self.assertEqual(b''.join(self.sent), b'echo a\rrm -rf /x\x03')
+
+
+class BatchCommandHostTests(SimpleTestCase):
+    """批量执行中单台主机的阻断检查、执行和审计"""
+
+    def setUp(self):
+        self.host = SimpleNamespace(id=uuid.uuid4(), name='web01', network='10.0.0.1', account_type=None)
+        self.consumer = BatchCommandConsumer()
+        self.consumer.user = SimpleNamespace(username='alice')
+        self.consumer.cancelled = threading.Event()
+        self.messages = []
+
+        async def send(text_data):
+            self.messages.append(json.loads(text_data))
+        self.consumer.send = send
+        self.executed = []
+        self.result = {'stdout': 'ok', 'stderr': '', 'exit_code': 0, 'error': None, 'truncated': False, 'duration': 0,
+                       'executed': True}
+        self.patch('apps.views.batch_command_consumer.run_host_command', self.run_host_command)
+        self.dispatcher = self.patch('apps.views.batch_command_consumer.alert_dispatcher')
+        self.log_writer = self.patch('apps.views.batch_command_consumer.command_log_writer')
+        self.check_alert = self.patch('apps.views.batch_command_consumer.check_command_alert', mock.AsyncMock(return_value=False))
+
+    def patch(self, target, new=mock.DEFAULT):
+        patcher = mock.patch(target, new)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def run_host_command(self, host, credential, command, timeout, max_output, cancelled):
+        self.executed.append(command)
+        return dict(self.result)
+
+    def run_on_host(self, matcher, command):
+        cache = SimpleNamespace(get_blocking_matcher=lambda host_id: matcher)
+        with mock.patch('apps.views.batch_command_consumer.alert_rule_cache', cache):
+            return asyncio.run(self.consumer.run_on_host(self.host, command, 5, asyncio.Semaphore(1)))
+
+    def test_blocked(self):
+        with self.assertLogs('log', 'WARNING'):
+            result = self.run_on_host(FakeMatcher('rm -rf /x'), 'rm -rf /x')
+        self.assertEqual(result['error'], '命令触发规则「block」，已阻断')
+        self.assertEqual(self.executed, [])
+        self.dispatcher.enqueue.assert_called_once()
+
+    def test_undetermined_rejected(self):
+        with self.assertLogs('log', 'WARNING'):
+            result = self.run_on_host(FakeMatcher(undetermined=('rm -rf /x',)), 'rm -rf /x')
+        self.assertEqual(result['error'], '无法确定命令是否触发阻断规则，已拒绝执行')
+        self.assertEqual(self.executed, [])
+        self.assertEqual(self.messages[0]['error'], result['error'])
+
+    def test_allowed(self):
+        result = self.run_on_host(FakeMatcher('rm -rf /x'), 'ls')
+        self.assertEqual(result['exit_code'], 0)
+        self.assertEqual(self.executed, ['ls'])
+        self.assertEqual(self.log_writer.put.call_args[0][0].status, '退出码 0')
+        self.check_alert.assert_awaited_once()
+
+    def test_cancelled_before_start(self):
+        self.consumer.cancelled.set()
+        result = self.run_on_host(None, 'ls')
+        self.assertEqual(result['error'], '已取消')
+        self.assertEqual(self.executed, [])
+        self.log_writer.put.assert_not_called()
+        self.check_alert.assert_not_awaited()
+
+    def test_cancelled_after_sent_audited(self):
+        # 命令已在主机上执行，之后取消
+        self.result.update(exit_code=None, error='已取消')
+        result = self.run_on_host(None, 'rm -rf /tmp/x')
+        self.assertEqual(result['error'], '已取消')
+        record = self.log_writer.put.call_args[0][0]
+        self.assertEqual((record.command, record.status), ('rm -rf /tmp/x', '已取消'))
+        self.check_alert.assert_awaited_once()
+
+    def test_timeout_after_sent_audited(self):
+        self.result.update(exit_code=None, error='执行超时 (5秒)')
+        self.run_on_host(None, 'sleep 60')
+        self.assertEqual(self.log_writer.put.call_args[0][0].status, '执行超时 (5秒)')
+
+    def test_not_sent_not_audited(self):
+        self.result.update(exit_code=None, error='Authentication failed.', executed=False)
+        self.run_on_host(None, 'ls')
+        self.log_writer.put.assert_not_called()
+        self.check_alert.assert_not_awaited()
+
+
+class FakeExecChannel:
+    """一直不结束的命令的通道，事件管道从不可读"""
+
+    def __init__(self):
+        self._read_fd, self._write_fd = os.pipe()
+        self.eof_received = False
+        self.status_event = threading.Event()
+
+    def fileno(self):
+        return self._read_fd
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv_ready(self):
+        return False
+
+    recv_stderr_ready = exit_status_ready = recv_ready
+
+    def close(self):
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+
+class RunHostCommandTests(SimpleTestCase):
+    """单台主机执行命令时区分命令是否已发送"""
+
+    def setUp(self):
+        self.host = SimpleNamespace(name='web01', network='10.0.0.1', port=22)
+        self.credential = SimpleNamespace(name='root')
+        self.channel = FakeExecChannel()
+        self.addCleanup(self.channel.close)
+        self.client = mock.Mock()
+        self.client.exec_command.return_value = (None, SimpleNamespace(channel=self.channel), None)
+
+    def run_command(self, acquire, cancel_after=None, timeout=5):
+        cancelled = threading.Event()
+        if cancel_after is not None:
+            timer = threading.Timer(cancel_after, cancelled.set)
+            timer.start()
+            self.addCleanup(timer.cancel)
+        with mock.patch('apps.ssh_utils.batch_executor.transport_pool') as pool:
+            pool.acquire.side_effect = acquire
+            return run_host_command(self.host, self.credential, 'sleep 60', timeout, 1024, cancelled)
+
+    def test_cancelled_after_sent(self):
+        result = self.run_command(lambda host, credential: self.client, cancel_after=0.1)
+        self.assertEqual((result['error'], result['executed']), ('已取消', True))
+        self.client.close.assert_called_once()
+
+    def test_timeout_after_sent(self):
+        result = self.run_command(lambda host, credential: self.client, timeout=0.1)
+        self.assertEqual((result['error'], result['executed']), ('执行超时 (0.1秒)', True))
+
+    def test_connect_failed(self):
+        def acquire(host, credential):
+            raise OSError('Connection refused')
+        result = self.run_command(acquire)
+        self.assertEqual((result['error'], result['executed']), ('Connection refused', False))
+
+
+class TerminalParserTests(SimpleTestCase):
+    """跨多次读取的终端输出解析"""
+
+    def run_command(self, *chunks):
+        """在提示符后按下回车，依次输入 shell 输出，返回提交的命令"""
+        parser = TerminalParser()
+        parser.feed_output('user@h:~$ ')
+        parser.detect_prompt()
+        parser.feed_input(b'\r')
+        commands = []
+        for chunk in chunks:
+            commands += parser.feed_output(chunk)
+        return commands
+
+    def test_split_csi(self):
+        self.assertEqual(self.run_command('ls\x1b[0', '1;31mX\r\n'), ['lsX'])
+
+    def test_split_esc(self):
+        self.assertEqual(self.run_command('ls\x1b', '[K -l\r\n'), ['ls -l'])
+
+    def test_split_osc_title(self):
+        parser = TerminalParser()
+        parser.feed_output('user@h:~$ \x1b]0;ti')
+        parser.feed_output('tle\x07')
+        self.assertTrue(parser.detect_prompt())
+        self.assertEqual(parser.line, 'user@h:~$ ')
+
+    def test_alt_screen_prompt_commands_captured(self):
+        parser = TerminalParser()
+        parser.feed_output('\x1b[?1049huser@h:~$ ')
+        parser.feed_input(b'\r')
+        self.assertEqual(parser.feed_output('whoami\r\n'), ['whoami'])
+
+    def test_full_screen_program_ignored(self):
+        parser = TerminalParser()
+        parser.feed_output('user@h:~$ vim\r\n\x1b[?1049h\x1b[1;1H~\x1b[2;1H~')
+        self.assertIsNone(parser.pending_command())
+        parser.feed_input(b'\r')
+        self.assertEqual(parser.feed_output('\r\n~'), [])
+
+    def test_split_at_every_position(self):
+        output = 'l\x1b]0;user@h: ~\x1b\\s \x1b[01;34m-\x1bPq#0\x1b\\la\x1b[0m\x1b[K\r\n'
+        for index in range(len(output) + 1):
+            self.assertEqual(self.run_command(output[:index], output[index:]), ['ls -la'], index)
+
+
+class RuleMatcherTests(SimpleTestCase):
+    """精确匹配、字面量过滤和正则结果的合并"""
+
+    def setUp(self):
+        self.searched = []
+        self.rules = [compiled_rule(1, 'exact', 'reboot'), compiled_rule(2, 'fuzzy', r'rm\s+-rf'),
+                      compiled_rule(3, 'fuzzy', r'shutdown', r'init\s+0')]
+
+    def search(self, command, patterns):
+        self.searched.append([pattern.pattern for pattern in patterns])
+        return [index for index, pattern in enumerate(patterns) if pattern.search(command)], []
+
+    def test_exact_and_fuzzy(self):
+        matcher = RuleMatcher(self.rules, self.search)
+        self.assertEqual(matcher.match('reboot'), ([self.rules[0]], []))
+        self.assertEqual(matcher.match('rm  -rf /'), ([self.rules[1]], []))
+        self.assertEqual(matcher.match('init 0'), ([self.rules[2]], []))
+
+    def test_literal_filter_skips_search(self):
+        matcher = RuleMatcher(self.rules, self.search)
+        self.assertEqual(matcher.match('ls -la'), ([], []))
+        self.assertEqual(matcher.match_exact('ls -la'), ([], False))
+        self.assertEqual(self.searched, [])
+        self.assertEqual(matcher.match_exact('rm -rf /'), ([], True))
+
+    def test_undetermined_rules(self):
+        matcher = RuleMatcher(self.rules, lambda command, patterns: ([], list(range(len(patterns)))))
+        self.assertEqual(matcher.match('rm -rf /'), ([], [self.rules[1]]))
+
+        # 同一规则的另一个正则已匹配时按匹配处理
+        def search(command, patterns):
+            return [1], [0]
+        matcher = RuleMatcher(self.rules, search)
+        self.assertEqual(matcher.match('shutdown; init 0'), ([self.rules[2]], []))
+
+    def test_match_async(self):
+        async def search_async(command, patterns):
+            return [], [0]
+        matcher = RuleMatcher(self.rules, self.search, search_async)
+        self.assertEqual(asyncio.run(matcher.match_async('rm -rf /')), ([], [self.rules[1]]))
+        self.assertEqual(asyncio.run(matcher.match_async('reboot')), ([self.rules[0]], []))
+
+
+class CheckPatternTests(SimpleTestCase):
+    """保存规则时拒绝可能灾难性回溯的正则"""
+
+    def test_rejected(self):
+        for rule in (r'(a+)+$', r'(\w+\s?)*$', r'(.*,)*x', r'(.*a){20}', r'(a{1,10}){1,10}$', r'((a{1,3}){1,3}){1,3}$',
+                     r'\s*\s*\s*$', r'(\s*)(\s*)$', r'\s*x?\s*$', r'\d+\w+x', r'rm\s+.*\.sh',
+                     r'(a|ab)*c', r'(a)(b\1)*'):
+            self.assertIsNotNone(check_pattern(rule), rule)
+
+    def test_accepted(self):
+        for rule in (r'rm\s+-rf\s+/', r'rm\s+-rf\s+.*', r'.*foo.*', r'( -\w+)*', r'(\w+,)*', r'(\d+\.){3}\d+',
+                     r'(ab{1,3}){2}', r'a{1,5}a{1,5}$', r'\s*\w+$', r'[a-z]+\d+$', r'^(sudo\s+)?rm\s',
+                     r'curl\s+\S+\s*\|\s*(ba)?sh', r'(?i)drop\s+table', r'chmod\s+[0-7]*777'):
+            self.assertIsNone(check_pattern(rule), rule)
+
+    def test_invalid_or_too_long(self):
+        self.assertIn('无效', check_pattern('rm ('))
+        self.assertIn('长度', check_pattern('a' * 1001))
+
+
+class RegexSandboxTests(SimpleTestCase):
+    """子进程中执行正则的超时处理"""
+
+    def setUp(self):
+        self.sandbox = RegexSandbox(0.3)
+
+    def tearDown(self):
+        stop_sandbox(self.sandbox)
+
+    def test_search(self):
+        patterns = [re.compile(r'rm\s'), re.compile('shutdown'), re.compile('ls$')]
+        self.assertEqual(self.sandbox.search('rm -rf / && ls', patterns), ([0, 2], []))
+
+    def test_timeout_keeps_other_results(self):
+        patterns = [re.compile(r'rm\s'), re.compile(SLOW_PATTERN), re.compile('ls$'), re.compile('mkfs')]
+        with self.assertLogs('log', 'ERROR'):
+            self.assertEqual(self.sandbox.search(SLOW_COMMAND, patterns), ([0, 2], [1]))
+        self.assertEqual(self.sandbox.counters['timeouts'], 1)
+
+        # 降级期间不再执行，结果仍为无法确定
+        self.assertEqual(self.sandbox.search(SLOW_COMMAND, patterns), ([0, 2], [1]))
+        self.assertEqual(self.sandbox.counters['timeouts'], 1)
+        self.assertEqual(self.sandbox.search('ls', patterns), ([2], [1]))
+
+    def test_degrade_expires(self):
+        self.sandbox.degrade_seconds = 0
+        patterns = [re.compile(SLOW_PATTERN)]
+        with self.assertLogs('log', 'ERROR'):
+            self.assertEqual(self.sandbox.search(SLOW_COMMAND, patterns), ([], [0]))
+        self.assertEqual(self.sandbox.search('aaa', patterns), ([0], []))
+        self.assertEqual(self.sandbox.get_stats()['degraded'], [])
+
+    def test_search_async(self):
+        patterns = [re.compile('ls'), re.compile(SLOW_PATTERN)]
+        with self.assertLogs('log', 'ERROR'):
+            self.assertEqual(asyncio.run(self.sandbox.search_async(SLOW_COMMAND, patterns)), ([0], [1]))
+
+
+class TerminalSessionStatsViewTests(SimpleTestCase):
+    """终端会话统计只对管理员返回全部会话和全局统计"""
+
+    def setUp(self):
+        sessions = [{'username': 'alice', 'host': 'web01', 'shadow_id': 'a'},
+                    {'username': 'bob', 'host': 'db01', 'shadow_id': 'b'}]
+        patcher = mock.patch('apps.views.terminal_sessions.session_registry')
+        self.addCleanup(patcher.stop)
+        patcher.start().snapshot.side_effect = lambda: [dict(session) for session in sessions]
+        patcher = mock.patch('apps.views.terminal_sessions.alert_dispatcher')
+        self.addCleanup(patcher.stop)
+        patcher.start().get_stats.return_value = {}
+
+    def get(self, username, admin):
+        request = APIRequestFactory().get('/api/terminal/sessions/')
+        force_authenticate(request, user=SimpleNamespace(username=username, is_authenticated=True))
+        with mock.patch('apps.views.terminal_sessions.user_is_admin', return_value=admin):
+            return TerminalSessionStatsView.as_view()(request).data
+
+    def test_user_sees_own_sessions_only(self):
+        data = self.get('alice', False)
+        self.assertEqual(data, {'count': 1, 'results': [{'username': 'alice', 'host': 'web01', 'shadow_id': 'a'}]})
+
+    def test_admin_sees_all(self):
+        data = self.get('root', True)
+        self.assertEqual([session['username'] for session in data['results']], ['alice', 'bob'])
+        self.assertIn('transport_pool', data)
+        self.assertIn('alert_dispatcher', data)
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None, text=None):
+        self.status_code = status_code
+        self.body = body
+        self.text = text if text is not None else json.dumps(body)
+
+    def json(self):
+        if self.body is None:
+            raise ValueError(self.text)
+        return self.body
+
+
+class WebhookClientTests(SimpleTestCase):
+    """Webhook 客户端的熔断和日志脱敏"""
+
+    URL = 'https://oapi.dingtalk.com/robot/send?access_token=secret-token'
+
+    def setUp(self):
+        self.client = WebhookClient({'BREAKER_THRESHOLD': 2, 'BREAKER_COOLDOWN': 60,
+                                     'POOL_CONNECTIONS': 1, 'POOL_MAXSIZE': 1})
+        self.addCleanup(self.client.session.close)
+
+    def post(self, *responses):
+        with mock.patch.object(self.client.session, 'post', side_effect=responses):
+            for _ in responses:
+                self.client.post(self.URL, {}, 1)
+
+    def test_redact_url(self):
+        redacted = redact_url(self.URL)
+        self.assertTrue(redacted.startswith('https://oapi.dingtalk.com#'))
+        self.assertNotIn('secret-token', redacted)
+        self.assertNotEqual(redacted, redact_url(self.URL + '2'))
+
+    def test_platform_error_opens_breaker(self):
+        with self.assertLogs('log', 'WARNING') as logs:
+            self.post(FakeResponse(body={'errcode': 310000, 'errmsg': 'keywords not in content'}),
+                      FakeResponse(body={'errcode': 310000, 'errmsg': 'keywords not in content'}))
+        self.assertNotIn('secret-token', '\n'.join(logs.output))
+        self.assertIn('熔断', logs.output[0])
+        with self.assertRaises(CircuitOpenError):
+            self.client.post(self.URL, {}, 1)
+
+    def test_http_and_json_errors_count_as_failures(self):
+        with self.assertLogs('log', 'WARNING'):
+            self.post(FakeResponse(status_code=502, text='bad gateway'), FakeResponse(text='<html>'))
+        self.assertEqual(self.client.get_stats(), {'webhooks': 1, 'failing': 1, 'open': 1})
+
+    def test_success_resets_failures(self):
+        self.post(FakeResponse(body={'errcode': 1}), FakeResponse(body={'errcode': 0, 'errmsg': 'ok'}),
+                  FakeResponse(body={'code': 9499}), FakeResponse(body={'StatusCode': 0}))
+        self.assertEqual(self.client.get_stats(), {'webhooks': 1, 'failing': 0, 'open': 0})
+
+
+class FakeRedis:
+    """告警分发用到的 Redis 命令的内存实现，fail_xadd 次 XADD 抛出连接错误"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.streams = {}
+        self.sorted_sets = {}
+        self.fail_xadd = 0
+        self.acked = []
+
+    def pipeline(self, transaction=True):
+        client = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+            def execute(self):
+                return [getattr(client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+        return Pipeline()
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = str(value)
+
+    def expire(self, key, seconds):
+        return key in self.hashes
+
+    def xadd(self, stream, fields, maxlen=None, approximate=True):
+        if self.fail_xadd:
+            self.fail_xadd -= 1
+            raise redis.ConnectionError('connection refused')
+        self.streams.setdefault(stream, []).append(fields)
+
+    def zadd(self, key, mapping):
+        self.sorted_sets.setdefault(key, {}).update(mapping)
+
+    def xack(self, stream, group, message_id):
+        self.acked.append(message_id)
+
+    def xdel(self, stream, message_id):
+        pass
+
+    def jobs(self, stream):
+        return [json.loads(fields['job']) for fields in self.streams.get(stream, [])]
+
+
+class AlertDispatcherTests(SimpleTestCase):
+    """告警任务重试时不重复记录告警历史和生成通知，失败的任务按退避重试或写入死信"""
+
+    def setUp(self):
+        self.dispatcher = AlertDispatcher(settings.ALERT_DISPATCH)
+        self.client = FakeRedis()
+        self.histories = []
+        patcher = mock.patch('apps.alert_utils.alert_dispatcher.build_alert_deliveries', side_effect=self.build)
+        self.addCleanup(patcher.stop)
+        self.build_mock = patcher.start()
+        patcher = mock.patch('apps.alert_utils.alert_dispatcher.close_old_connections')
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+    def build(self, command_alert_id, command, username, host_id, hostname, history_id=None):
+        if history_id is None:
+            self.histories.append(command)
+            history_id = len(self.histories)
+        return history_id, [{'contact': 'ops', 'notify_type': '钉钉', 'webhook': 'https://example.com', 'payload': {}}]
+
+    def alert_job(self):
+        return {'id': uuid.uuid4().hex, 'kind': 'alert', 'attempt': 0, 'created': 0,
+                'data': {'command_alert_id': 1, 'command': 'rm -rf /', 'username': 'alice',
+                         'host_id': '1', 'hostname': 'web01', 'window': 0}}
+
+    def process(self, job):
+        with self.assertLogs('log', 'WARNING') if self.client.fail_xadd else contextlib.nullcontext():
+            self.dispatcher._process(self.client, '1-0', {'job': json.dumps(job)})
+
+    def test_alert_retry_reuses_history(self):
+        job = self.alert_job()
+        self.client.fail_xadd = 1
+        self.process(job)
+        retried = json.loads(next(iter(self.client.sorted_sets[self.dispatcher.retry_key])))
+        self.assertEqual(retried['attempt'], 1)
+        self.process(retried)
+        self.assertEqual(self.histories, ['rm -rf /'])
+        self.assertEqual(self.build_mock.call_args.kwargs['history_id'], 1)
+        self.assertEqual([job['kind'] for job in self.client.jobs(self.dispatcher.stream)], ['webhook'])
+        self.assertEqual(self.client.acked, ['1-0', '1-0'])
+
+    def test_alert_redelivered_after_queued(self):
+        job = self.alert_job()
+        self.process(job)
+        self.process(job)
+        self.assertEqual(self.histories, ['rm -rf /'])
+        self.assertEqual(len(self.client.jobs(self.dispatcher.stream)), 1)
+
+    def test_webhook_failures_back_off_then_dead_letter(self):
+        job = {'id': 'a-0', 'kind': 'webhook', 'attempt': 0, 'created': 0,
+               'data': {'contact': 'ops', 'notify_type': '钉钉', 'webhook': 'https://example.com', 'payload': {}}}
+        error = CircuitOpenError('Webhook 已熔断', 120)
+        with mock.patch('apps.alert_utils.alert_dispatcher.post_webhook', side_effect=error), \
+                mock.patch('apps.alert_utils.alert_dispatcher.time.time', return_value=1000):
+            with self.assertLogs('log', 'WARNING'):
+                self.dispatcher._process(self.client, '1-0', {'job': json.dumps(job)})
+            (retried, due), = self.client.sorted_sets[self.dispatcher.retry_key].items()
+            self.assertGreaterEqual(due, 1000 + 120)
+            job = json.loads(retried)
+            job['attempt'] = self.dispatcher.max_attempts - 1
+            with self.assertLogs('log', 'ERROR'):
+                self.dispatcher._process(self.client, '2-0', {'job': json.dumps(job)})
+        dead = self.client.jobs(self.dispatcher.dead_letter)
+        self.assertEqual([job['attempt'] for job in dead], [self.dispatcher.max_attempts])
+        self.assertEqual(self.dispatcher.counters['dead_lettered'], 1)
+        self.assertEqual(self.dispatcher.counters['short_circuited'], 1)
+
+
+class FakeTransport:
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+    def is_authenticated(self):
+        return True
+
+    def send_ignore(self):
+        pass
+
+    def close(self):
+        self.active = False
+
+
+class TransportPoolTests(SimpleTestCase):
+    """SSH 连接池的复用、通道上限、空闲回收和同一 key 的握手互斥"""
+
+    host = SimpleNamespace(network='10.0.0.1', port=22)
+    credential = SimpleNamespace(id=1, account='root', password='secret', key=None, key_password=None)
+
+    def make_pool(self, connect=None, **kwargs):
+        pool = TransportPool(connect or (lambda host, credential: FakeTransport()), **kwargs)
+        pool._reaper = object()  # 测试中不启动回收线程
+        return pool
+
+    def test_reuse_and_channel_limits(self):
+        pool = self.make_pool(max_channels_per_transport=2, max_channels_per_host=3)
+        clients = [pool.acquire(self.host, self.credential) for _ in range(3)]
+        self.assertEqual(pool.get_stats(), {'transports': 2, 'channels_in_use': 3, 'handshakes': 2, 'reuses': 1})
+        with self.assertRaises(TransportPoolExhausted):
+            pool.acquire(self.host, self.credential)
+        for client in clients:
+            client.close()
+        clients[0].close()
+        self.assertEqual(pool.get_stats()['channels_in_use'], 0)
+
+    def test_reap_idle_and_dead_transports(self):
+        pool = self.make_pool(idle_timeout=0)
+        pool.acquire(self.host, self.credential).close()
+        key = pool.make_key(self.host, self.credential)
+        self.assertIn(key, pool._key_locks)
+        pool.reap()
+        self.assertEqual(pool.get_stats()['transports'], 0)
+        self.assertEqual(pool._key_locks, {})
+
+    def test_failed_handshake_keeps_lock_for_waiters(self):
+        started = threading.Semaphore(0)
+        proceed = threading.Event()
+        state = {'active': 0, 'max_active': 0, 'calls': 0}
+        state_lock = threading.Lock()
+
+        def connect(host, credential):
+            with state_lock:
+                state['calls'] += 1
+                state['active'] += 1
+                state['max_active'] = max(state['max_active'], state['active'])
+                first = state['calls'] == 1
+            started.release()
+            proceed.wait(5)
+            with state_lock:
+                state['active'] -= 1
+            if first:
+                raise OSError('handshake failed')
+            return FakeTransport()
+
+        pool = self.make_pool(connect)
+        key = pool.make_key(self.host, self.credential)
+        results = []
+
+        def acquire():
+            try:
+                results.append(pool.acquire(self.host, self.credential))
+            except OSError as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=acquire) for _ in range(3)]
+        threads[0].start()
+        self.assertTrue(started.acquire(timeout=5))
+        threads[1].start()
+        while pool._key_lock_users.get(key) != 2:
+            threading.Event().wait(0.01)
+        # 第一个线程握手失败时第二个线程仍在等待握手锁，第三个线程必须等待同一把锁
+        proceed.set()
+        threads[0].join(5)
+        threads[2].start()
+        for thread in threads[1:]:
+            thread.join(5)
+        self.assertEqual(state['max_active'], 1)
+        self.assertEqual(state['calls'], 2)
+        self.assertIsInstance(results[0], OSError)
+        self.assertEqual(pool.get_stats()['handshakes'], 1)
+        self.assertEqual(pool._key_lock_users[key], 0)
+
+
+class SystemSettingsViewTests(SimpleTestCase):
+    """无效的终端输出速率上限返回 400，不修改任何设置"""
+
+    def test_invalid_output_rate_limit_rejected(self):
+        for value in ('fast', -1, 1.5):
+            request = APIRequestFactory().post('/api/system_settings/', {'terminal_output_rate_limit': value}, format='json')
+            with mock.patch('apps.views.system_settings.SystemSettings') as model:
+                response = SystemSettingsView.as_view()(request)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('terminal_output_rate_limit', response.data)
+            model.objects.first.assert_not_called()
+
+
+class SSHConsumerOutputTests(SimpleTestCase):
+    """终端输出按字节计入流量控制，恢复会话时输入输出格式需与原会话一致"""
+
+    def make_consumer(self, binary_output, binary_input=True):
+        consumer = SSHConsumer()
+        consumer.binary_output = binary_output
+        consumer.binary_input = binary_input
+        consumer.flow_control = OutputFlowControl(1024 * 1024, 0)
+        consumer.send = mock.AsyncMock()
+        consumer.accept = mock.AsyncMock()
+        consumer.user = SimpleNamespace(id=1)
+        consumer.host = SimpleNamespace(id=1, name='web01')
+        consumer.username = 'alice'
+        consumer.host_id = '1'
+        return consumer
+
+    def test_text_output_counts_encoded_bytes(self):
+        consumer = self.make_consumer(False)
+        asyncio.run(consumer.send_output('中文'))
+        consumer.send.assert_awaited_once_with(text_data='中文')
+        self.assertEqual(consumer.flow_control.unacked_bytes, 6)
+
+    def test_binary_output_counts_bytes(self):
+        consumer = self.make_consumer(True)
+        asyncio.run(consumer.send_output('中文'.encode('utf-8')))
+        self.assertEqual(consumer.flow_control.unacked_bytes, 6)
+
+    def test_resume_rejects_other_format(self):
+        session = self.make_consumer(True)
+        session.terminated = False
+        session.attach = mock.AsyncMock()
+        token = uuid.uuid4().hex
+        resumable_sessions.register(token, session)
+        self.addCleanup(resumable_sessions.unregister, token)
+        for binary_output, binary_input in ((False, True), (True, False)):
+            client = self.make_consumer(binary_output, binary_input)
+            with self.assertLogs('log', 'INFO'):
+                self.assertFalse(asyncio.run(client.resume_session(token, '0')))
+            client.accept.assert_not_awaited()
+        client = self.make_consumer(True)
+        self.assertTrue(asyncio.run(client.resume_session(token, '10')))
+        session.attach.assert_awaited_once_with(client, 10)
+
+    def test_attach_replays_scrollback_after_offset(self):
+        session = self.make_consumer(True)
+        del session.send  # 会话的 send 转发到当前接入的连接
+        session.client = None
+        session.resume_token = 'token'
+        session.scrollback = ScrollbackBuffer(8)
+        session.scrollback.append(b'abcdefghij')
+        session.flow_control.on_sent(100)
+        for offset, expected, lost in ((4, b'efghij', False), (0, b'cdefghij', True), (10, b'', False)):
+            client = self.make_consumer(True)
+            with self.assertLogs('log', 'INFO'):
+                asyncio.run(session.attach(client, offset))
+            self.assertIs(session.client, client)
+            self.assertEqual(session.flow_control.unacked_bytes, 0)
+            info = json.loads(client.send.await_args_list[0].kwargs['text_data'])
+            self.assertEqual(info, {'type': 'session', 'resume_token': 'token', 'offset': 10 - len(expected), 'lost': lost})
+            sent = [call.kwargs['bytes_data'] for call in client.send.await_args_list[1:]]
+            self.assertEqual(sent, [expected] if expected else [])
+            session.client = None
+
+
+class ScrollbackBufferTests(SimpleTestCase):
+    """输出环形缓冲区写满后覆盖最旧的数据，按偏移读取之后的输出"""
+
+    def test_wraps_and_reads_from_offset(self):
+        buffer = ScrollbackBuffer(6)
+        for chunk in (b'abcd', b'efg', b'hi'):
+            buffer.append(chunk)
+        self.assertEqual(len(buffer), 6)
+        self.assertEqual(buffer.total, 9)
+        self.assertEqual(buffer.read_from(5), (b'fghi', False))
+        self.assertEqual(buffer.read_from(1), (b'defghi', True))
+        self.assertEqual(buffer.read_from(9), (b'', False))
+        self.assertEqual(buffer.read_from(20), (b'', False))
+
+    def test_chunk_larger_than_capacity(self):
+        buffer = ScrollbackBuffer(4)
+        buffer.append(b'ab')
+        buffer.append(b'0123456789')
+        self.assertEqual(buffer.read_from(0), (b'6789', True))
+        buffer.append(b'x')
+        self.assertEqual(buffer.read_from(9), (b'789x', False))
+
+
+class SessionRecorderTests(SimpleTestCase):
+    """录像分段写入后整体解压为 asciicast v2 文件，按时间索引读取部分事件"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, '20261018', f'1{RECORDING_SUFFIX}')
+
+    def record(self, *outputs, **kwargs):
+        async def run():
+            recorder = SessionRecorder(self.path, title='web01', **kwargs)
+            recorder.record_resize(120, 40)
+            for output in outputs:
+                recorder.record_output(output)
+                await asyncio.sleep(0)
+            recorder.record_resize(100, 30)
+            await recorder.close()
+            recorder.record_output('after close')
+            return recorder
+        return asyncio.run(run())
+
+    def test_segments_form_asciicast_file(self):
+        recorder = self.record('ls\r\n', '中文输出', '$ ', segment_bytes=4)
+        with open(self.path, 'rb') as f:
+            lines = gzip.decompress(f.read()).decode('utf-8').splitlines()
+        header = json.loads(lines[0])
+        self.assertEqual((header['version'], header['width'], header['height'], header['title']), (2, 120, 40, 'web01'))
+        events = [json.loads(line) for line in lines[1:]]
+        self.assertEqual([event[1:] for event in events],
+                         [['o', 'ls\r\n'], ['o', '中文输出'], ['o', '$ '], ['r', '100x30']])
+        self.assertEqual([event[0] for event in events], sorted(event[0] for event in events))
+        stats = recorder.get_stats()
+        self.assertEqual((stats['recording_segments'], stats['recording_events']), (3, 4))
+        self.assertEqual(stats['recording_file_bytes'], os.path.getsize(self.path))
+
+    def test_read_recording_by_time(self):
+        self.record('a' * 4, 'b' * 4, 'c' * 4, segment_bytes=4)
+        full = read_recording(self.path)
+        # 分段写完之前的窗口大小变化记录为事件，不改写录像头
+        self.assertEqual((full['header']['width'], full['header']['height']), (120, 40))
+        self.assertEqual([event[2] for event in full['events']], ['aaaa', 'bbbb', 'cccc', '100x30'])
+        self.assertEqual(full['duration'], full['events'][-1][0])
+        second = full['events'][1][0]
+        part = read_recording(self.path, start=second)
+        self.assertEqual([event[2] for event in part['events']], ['bbbb', 'cccc', '100x30'])
+        part = read_recording(self.path, start=0, duration=second)
+        self.assertEqual([event[2] for event in part['events']], ['aaaa'])
@@ -115,6 +115,42 @@ class CustomTokenAuthentication(BaseAuthentication):
         user.is_authenticated = True
         return (user, None)
 
+def get_node_children():
+    """
+    一次取出全部节点的父子关系（阻塞调用）
+
+    Returns:
+        dict: 父节点ID -> 子节点ID列表，根节点的父节点ID为 None
+    """
+    children = {}
+    for node_id, parent_id in Node.objects.values_list('id', 'parent_id'):
+        children.setdefault(parent_id, []).append(node_id)
+    return children
+
+def get_node_subtree(node_ids, children=None):
+    """
+    获取节点及其所有子节点的ID（阻塞调用）
+
+    在内存中展开子树，不逐层查询。
+
+    Args:
+        node_ids: 节点ID列表
+        children: get_node_children() 的结果，为空时查询
+
+    Returns:
+        set: 节点ID集合，包含传入的节点
+    """
+    if children is None:
+        children = get_node_children()
+    subtree, pending = set(), list(node_ids)
+    while pending:
+        current = pending.pop()
+        if current in subtree:
+            continue
+        subtree.add(current)
+        pending.extend(children.get(current, []))
+    return subtree
+
 # 检查用户权限函数
 def user_has_view_permission(user):
     role_permissions = RolePermission.objects.filter(user_id=user.id)
@@ -123,6 +159,10 @@ def user_has_view_permission(user):
             return True
     return False
 
+# 检查用户是否为管理员
+def user_is_admin(user):
+    return RolePermission.objects.filter(user_id=user.id, role__role_name__iexact='administrator').exists()
+
 @database_sync_to_async
 def get_user(token_key):
     auth = CustomTokenAuthentication()
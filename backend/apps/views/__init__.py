@@ -18,4 +18,6 @@ from .mfa_auth import MFAUtil
 from .dashboard import dashboard_statistics, login_statistics
 from .host_monitor import HostMonitorTask
 from .alert_history import AlertHistoryLogView
+from .terminal_sessions import TerminalSessionStatsView
+from .session_recording import SessionRecordingView, SessionRecordingPlaybackView
 # from .session import SessionManager
\ No newline at end of file
@@ -1,3 +1,4 @@
+import json
 from apps.utils import (
     APIView, AlertHistoryLog, CustomTokenAuthentication, 
     IsAuthenticated, status, Paginator, Response
@@ -37,6 +38,9 @@ class AlertHistoryLogView(APIView):
                 'match_type': log.match_type,
                 'command': log.command,
                 'alert_rule': log.alert_rule,
+                'count': log.count,  # 聚合窗口内的触发次数
+                'sample_commands': json.loads(log.sample_commands) if log.sample_commands else [],
+                'last_time': log.last_time.strftime('%Y-%m-%d %H:%M:%S') if log.last_time else None,
                 'create_time': log.create_time.strftime('%Y-%m-%d %H:%M:%S'),
             })
         
@@ -0,0 +1,204 @@
+import json
+import time
+import uuid
+import asyncio
+import datetime
+import threading
+import urllib.parse
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+from django.conf import settings
+from apps.models import Token, CommandLog
+from apps.utils import user_has_view_permission
+from apps.alert_utils.command_alert_handler import check_command_alert
+from apps.alert_utils.alert_rule_cache import alert_rule_cache
+from apps.alert_utils.alert_dispatcher import alert_dispatcher
+from apps.ssh_utils.command_log_writer import command_log_writer
+from apps.ssh_utils.batch_executor import batch_executor, resolve_hosts, run_host_command
+import logging
+
+logger = logging.getLogger('log')
+
+
+class BatchCommandConsumer(AsyncWebsocketConsumer):
+    """
+    批量命令执行消费者
+
+    客户端发送 {"type": "run", "command": ..., "hosts": [主机ID...], "node": 节点ID,
+    "timeout": 单台主机超时(秒), "concurrency": 并发数}，hosts 和 node 至少提供一个：
+    1. 先返回 start 消息，包含解析出的主机列表
+    2. 按并发上限在各主机上执行命令，每台主机完成后立即返回一条 result 消息
+    3. 全部完成后返回 done 消息；客户端发送 {"type": "cancel"} 或断开连接时取消未完成的主机
+    4. 命令发送到主机后（包括之后被取消或超时）记录命令日志和执行状态，并检查命令告警
+    """
+
+    async def connect(self):
+        self.task = None
+        self.cancelled = threading.Event()
+
+        query_string = self.scope['query_string'].decode('utf-8')
+        query_params = urllib.parse.parse_qs(query_string)
+        token = query_params.get('token', [None])[0]
+
+        if not token:
+            await self.close()
+            return
+
+        try:
+            token_obj = await database_sync_to_async(Token.objects.select_related('user').get)(token=token)
+            self.user = token_obj.user
+        except Token.DoesNotExist:
+            await self.close()
+            return
+
+        # 只读用户不能执行命令
+        if await database_sync_to_async(user_has_view_permission)(self.user):
+            await self.close()
+            return
+
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        self.cancelled.set()
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or '')
+        except json.JSONDecodeError:
+            await self.send_error('无效的消息格式')
+            return
+
+        if message.get('type') == 'cancel':
+            self.cancelled.set()
+            return
+
+        if message.get('type') != 'run':
+            return
+
+        if self.task and not self.task.done():
+            await self.send_error('已有批量任务正在执行')
+            return
+
+        config = settings.BATCH_COMMAND
+        command = (message.get('command') or '').strip()
+        if not command:
+            await self.send_error('命令不能为空')
+            return
+        try:
+            host_ids = [uuid.UUID(str(host_id)) for host_id in message.get('hosts') or []]
+            node_id = uuid.UUID(str(message['node'])) if message.get('node') else None
+            timeout = float(message.get('timeout') or config['DEFAULT_TIMEOUT'])
+            concurrency = int(message.get('concurrency') or config['DEFAULT_CONCURRENCY'])
+        except (TypeError, ValueError):
+            await self.send_error('无效的参数')
+            return
+        if not host_ids and node_id is None:
+            await self.send_error('请选择主机或节点')
+            return
+
+        timeout = min(max(timeout, 1), config['MAX_TIMEOUT'])
+        concurrency = min(max(concurrency, 1), config['MAX_CONCURRENCY'])
+        self.cancelled = threading.Event()
+        self.task = asyncio.create_task(self.run_batch(command, host_ids, node_id, timeout, concurrency))
+
+    async def run_batch(self, command, host_ids, node_id, timeout, concurrency):
+        """解析目标主机并并发执行命令"""
+        hosts = await database_sync_to_async(resolve_hosts)(host_ids, node_id)
+        if not hosts:
+            await self.send_error('没有找到目标主机')
+            return
+        if len(hosts) > settings.BATCH_COMMAND['MAX_HOSTS']:
+            await self.send_error(f"主机数量超过上限 {settings.BATCH_COMMAND['MAX_HOSTS']}")
+            return
+
+        logger.info(f"用户 {self.user.username} 在 {len(hosts)} 台主机上批量执行命令: {command}")
+        await self.send(text_data=json.dumps({
+            'type': 'start',
+            'command': command,
+            'total': len(hosts),
+            'hosts': [{'id': str(host.id), 'name': host.name, 'network': host.network} for host in hosts],
+        }))
+
+        await alert_rule_cache.ensure_loaded()
+        started = time.monotonic()
+        semaphore = asyncio.Semaphore(concurrency)
+        results = await asyncio.gather(
+            *(self.run_on_host(host, command, timeout, semaphore) for host in hosts))
+        succeeded = sum(1 for result in results if result['error'] is None and result['exit_code'] == 0)
+
+        await self.send(text_data=json.dumps({
+            'type': 'done',
+            'total': len(hosts),
+            'succeeded': succeeded,
+            'failed': len(hosts) - succeeded,
+            'cancelled': self.cancelled.is_set(),
+            'duration': round(time.monotonic() - started, 3),
+        }))
+
+    async def run_on_host(self, host, command, timeout, semaphore):
+        """在单台主机上执行命令，完成后立即推送结果"""
+        credential = host.account_type
+        blocking_matcher = alert_rule_cache.get_blocking_matcher(host.id)
+        blocked, undetermined = await blocking_matcher.match_async(command) if blocking_matcher else ([], [])
+        if blocked or undetermined:
+            # 触发阻断执行的规则，或正则超时、已降级而无法确定是否触发，不在该主机上执行
+            error = f'命令触发规则「{blocked[0].name}」，已阻断' if blocked else '无法确定命令是否触发阻断规则，已拒绝执行'
+            result = {'stdout': '', 'stderr': '', 'exit_code': None, 'error': error,
+                      'truncated': False, 'duration': 0, 'executed': False}
+        else:
+            async with semaphore:
+                if self.cancelled.is_set():
+                    result = {'stdout': '', 'stderr': '', 'exit_code': None, 'error': '已取消',
+                              'truncated': False, 'duration': 0, 'executed': False}
+                else:
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(
+                        batch_executor, run_host_command, host, credential, command, timeout,
+                        settings.BATCH_COMMAND['MAX_OUTPUT_BYTES'], self.cancelled)
+
+        await self.send(text_data=json.dumps({
+            'type': 'result',
+            'host_id': str(host.id),
+            'host': host.name,
+            'network': host.network,
+            **result,
+        }))
+
+        if blocked:
+            rule = blocked[0]
+            logger.warning(f'命令已阻断: 用户={self.user.username}, 主机={host.name}, 规则={rule.name}, 命令={command}')
+            alert_dispatcher.enqueue(rule.id, command, self.user.username, host.id, host.name, rule.suppress_window)
+        elif undetermined:
+            names = ', '.join(rule.name for rule in undetermined)
+            logger.warning(f'无法确定命令是否触发阻断规则，已拒绝执行: 用户={self.user.username}, 主机={host.name}, '
+                           f'规则={names}, 命令={command}')
+        elif result['executed']:
+            # 命令已在主机上执行，即使之后被取消或超时也要审计
+            status = result['error'] or f"退出码 {result['exit_code']}"
+            try:
+                await self.save_command_log(host, credential, command, status)
+                await self.check_command_alert(host, command)
+            except Exception as e:
+                logger.error(f"记录批量命令时出错: 主机={host.name}, 错误={str(e)}")
+        return result
+
+    async def save_command_log(self, host, credential, command, status):
+        """记录命令日志和执行状态，由命令日志写入器批量写入"""
+        command_log_writer.put(CommandLog(
+            username=self.user.username,
+            command=command,
+            hosts=host.name,
+            network=host.network,
+            credential=credential.name if credential else '',
+            status=status,
+            create_time=datetime.datetime.now()
+        ))
+
+    async def check_command_alert(self, host, command):
+        if await check_command_alert(host.id, command, self.user.username, host.name):
+            logger.warning(f'命令告警触发: 用户={self.user.username}, 主机={host.name}, 命令={command}')
+
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({'type': 'error', 'message': message}))
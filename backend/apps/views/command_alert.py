@@ -1,53 +1,69 @@
-from apps.utils import APIView, Response, status, Paginator, EmptyPage, PageNotAnInteger, CustomTokenAuthentication, IsAuthenticated, CommandAlert, Host, AlertContact
+from apps.utils import APIView, Response, status, Paginator, EmptyPage, PageNotAnInteger, CustomTokenAuthentication, IsAuthenticated, CommandAlert, Host, Node, AlertContact
+from django.db.models import Q
 from rest_framework import serializers
 from django.shortcuts import get_object_or_404
+from apps.alert_utils.rule_matcher import check_pattern
 import json
 
 class CommandAlertSerializer(serializers.ModelSerializer):
-    hosts = serializers.ListField(child=serializers.CharField(), required=False)
+    hosts = serializers.PrimaryKeyRelatedField(many=True, queryset=Host.objects.all(), required=False)
+    nodes = serializers.PrimaryKeyRelatedField(many=True, queryset=Node.objects.all(), required=False)
     alert_contacts = serializers.CharField(required=False)
     command_rule = serializers.ListField(child=serializers.CharField(), required=False)
     host_names = serializers.SerializerMethodField()
+    node_names = serializers.SerializerMethodField()
     alert_contact_names = serializers.SerializerMethodField()
     match_type = serializers.ChoiceField(choices=[('exact', '精准匹配'), ('fuzzy', '模糊匹配')], default='exact')
+    suppress_window = serializers.IntegerField(min_value=0, max_value=86400, required=False)
 
     class Meta:
         model = CommandAlert
-        fields = ['id', 'name', 'command_rule', 'hosts', 'alert_contacts', 'is_active', 'create_time', 'host_names', 'alert_contact_names', 'match_type']
+        fields = ['id', 'name', 'command_rule', 'hosts', 'nodes', 'alert_contacts', 'is_active', 'create_time', 'host_names', 'node_names', 'alert_contact_names', 'match_type', 'suppress_window', 'action']
 
     def get_host_names(self, obj):
-        host_ids = obj.hosts.split(',') if obj.hosts else []
-        hosts = Host.objects.filter(id__in=host_ids)
-        return [host.name for host in hosts]
+        # 列表查询时已预取关联主机
+        return [host.name for host in obj.hosts.all()]
+
+    def get_node_names(self, obj):
+        return [node.name for node in obj.nodes.all()]
 
     def get_alert_contact_names(self, obj):
         contact_ids = obj.alert_contacts.split(',') if obj.alert_contacts else []
+        contact_names = self.context.get('contact_names')
+        if contact_names is not None:
+            return [contact_names[contact_id] for contact_id in contact_ids if contact_id in contact_names]
         contacts = AlertContact.objects.filter(id__in=contact_ids)
         return [contact.name for contact in contacts]
 
+    def validate(self, attrs):
+        # 模糊匹配的正则在保存时校验，拒绝无效或可能灾难性回溯的写法
+        match_type = attrs.get('match_type', self.instance.match_type if self.instance else 'exact')
+        if match_type == 'fuzzy':
+            command_rules = attrs.get('command_rule')
+            if command_rules is None:
+                command_rules = json.loads(self.instance.command_rule) if self.instance and self.instance.command_rule else []
+            errors = []
+            for rule in command_rules:
+                risk = check_pattern(rule.strip())
+                if risk:
+                    errors.append(f"{rule}: {risk}")
+            if errors:
+                raise serializers.ValidationError({'command_rule': errors})
+        return attrs
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['hosts'] = instance.hosts.split(',') if instance.hosts else []
         representation['alert_contacts'] = instance.alert_contacts
         representation['command_rule'] = json.loads(instance.command_rule) if instance.command_rule else []
         return representation
 
     def create(self, validated_data):
-        hosts = validated_data.pop('hosts', [])
-        validated_data['hosts'] = ','.join(str(host) for host in hosts)
-        
-        
         command_rules = validated_data.get('command_rule', [])
         validated_data['command_rule'] = json.dumps(command_rules)
         
         return super().create(validated_data)
 
     def update(self, instance, validated_data):
-        if 'hosts' in validated_data:
-            hosts = validated_data.pop('hosts')
-            validated_data['hosts'] = ','.join(str(host) for host in hosts)
-        
-        
         if 'command_rule' in validated_data:
             command_rules = validated_data['command_rule']
             validated_data['command_rule'] = json.dumps(command_rules)
@@ -74,11 +90,20 @@ class CommandAlertView(APIView):
             host = request.GET.get('host', '')
             name = request.GET.get('name', '')
 
-            command_alerts = CommandAlert.objects.all().order_by('-create_time')
+            command_alerts = CommandAlert.objects.prefetch_related('hosts', 'nodes').order_by('-create_time')
 
             if host:
-                host_ids = Host.objects.filter(name__icontains=host).values_list('id', flat=True)
-                command_alerts = command_alerts.filter(hosts__in=host_ids)
+                # 直接关联主机的规则，以及关联主机所在节点或其上级节点的规则
+                matched_hosts = list(Host.objects.filter(name__icontains=host).values_list('id', 'node_id'))
+                parents = dict(Node.objects.values_list('id', 'parent_id'))
+                node_ids = set()
+                for _, node_id in matched_hosts:
+                    while node_id and node_id not in node_ids:
+                        node_ids.add(node_id)
+                        node_id = parents.get(node_id)
+                command_alerts = command_alerts.filter(
+                    Q(hosts__in=[host_id for host_id, _ in matched_hosts]) | Q(nodes__in=node_ids)
+                ).distinct()
             if name:
                 command_alerts = command_alerts.filter(name__icontains=name)
 
@@ -94,7 +119,12 @@ class CommandAlertView(APIView):
             except EmptyPage:
                 current_page_data = paginator.page(paginator.num_pages)
 
-            serializer = CommandAlertSerializer(current_page_data, many=True)
+            # 一次查询当前页所有规则的告警联系人名称
+            contact_ids = {contact_id for command_alert in current_page_data
+                           for contact_id in (command_alert.alert_contacts or '').split(',') if contact_id}
+            contact_names = {str(contact_id): name for contact_id, name in
+                             AlertContact.objects.filter(id__in=contact_ids).values_list('id', 'name')}
+            serializer = CommandAlertSerializer(current_page_data, many=True, context={'contact_names': contact_names})
 
             pagination = {
                 'current_page': current_page_data.number,
@@ -37,6 +37,7 @@ class CommandLogView(APIView):
             'hosts': log.hosts,
             'network': log.network,
             'credential': log.credential,
+            'status': log.status,
             'create_time': log.create_time.strftime('%Y-%m-%d %H:%M:%S')
         } for log in current_page]
 
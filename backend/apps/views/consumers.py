@@ -1,17 +1,36 @@
 import paramiko
 import asyncio
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.shortcuts import get_object_or_404
-from apps.models import Host, Credential, Token, User, CommandLog, CommandAlert
+from apps.models import Host, Token, CommandLog, CommandAlert, SessionRecording
 from asgiref.sync import sync_to_async
-import io
 import logging
 import json
 import re
 from apps.alert_utils.command_alert_handler import check_command_alert
+from apps.alert_utils.alert_rule_cache import alert_rule_cache
+from apps.alert_utils.alert_dispatcher import alert_dispatcher
+from apps.ssh_utils.output_batcher import OutputBatcher
+from apps.ssh_utils.flow_control import OutputFlowControl
+from apps.ssh_utils.ssh_connector import ssh_connect_executor, open_shell_channel
+from apps.ssh_utils.session_registry import session_registry
+from apps.ssh_utils.terminal_parser import TerminalParser, DEFAULT_PROMPT_PATTERNS
+from apps.ssh_utils.command_guard import CommandGuard
+from apps.ssh_utils.session_recorder import create_recorder
+from apps.ssh_utils.command_log_writer import command_log_writer
+from apps.ssh_utils.idle_reaper import idle_reaper
+from apps.ssh_utils.session_bootstrap import load_session_context
+from apps.ssh_utils.session_resume import ScrollbackBuffer, resumable_sessions
+from apps.ssh_utils.session_shadow import ShadowPublisher
+from apps.ssh_utils import terminal_protocol as protocol
+from django.core.exceptions import ValidationError
+from django.conf import settings
 import socket
 import datetime
 import urllib
+import codecs
+import uuid
+import time
+import secrets
 
 # 获取日志记录器实例
 logger = logging.getLogger('log')
@@ -31,29 +50,65 @@ class SSHConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # 命令处理相关组件
-        self.command_handler = CommandHandler()      # 命令处理器
-        self.shell_detector = ShellPromptDetector()  # Shell提示符检测器
+        self.terminal_parser = TerminalParser()      # 终端解析器，从输出中还原命令行并检测提示符
         
         # 命令状态标记
-        self.last_input_char = None        # 最后输入的字符
-        self.command_buffer = ''           # 命令缓冲区
-        self.is_command_executed = False   # 命令是否已执行
         self.in_shell_prompt = False       # 是否在shell提示符状态
         self.in_editor = False             # 是否在编辑器模式
-        self.in_history_search = False     # 是否在历史搜索模式
-        self.history_search_buffer = ''    # 历史搜索缓冲区
-        self.actual_command = ''           # 实际要执行的命令
-        
-        # 转义序列处理
-        self.in_escape_sequence = False    # 是否在处理转义序列
-        self.escape_buffer = ''            # 转义序列缓冲区
+        self.client_command = None         # 客户端上报的命令行，服务端未能识别命令时使用
+        self.command_guard = None          # 回车时检查阻断执行的规则，连接后创建
         
         # 会话管理
-        self.last_activity = None          # 最后活动时间
-        self.timeout_task = None           # 超时检查任务
-        self.TIMEOUT_SECONDS = 3600        # 超时时间(1小时)
+        self.idle_timeout = settings.SSH_TERMINAL['IDLE_TIMEOUT']  # 空闲超时(秒)，由进程内的回收器统一检查
+
+        # 连接各阶段耗时(毫秒)，从收到连接请求到首个输出字节
+        self.connect_timings = {}
+        self._phase_started = None
+
+        # 输出合并
+        self.output_batcher = OutputBatcher(
+            self.send_output,
+            flush_interval=settings.SSH_TERMINAL['OUTPUT_FLUSH_INTERVAL'],
+            flush_bytes=settings.SSH_TERMINAL['OUTPUT_FLUSH_BYTES'],
+        )
+        self.connected_at = None           # 会话建立时间
+
+        # 输出模式: binary 时原始字节以二进制帧发送，text 为兼容模式
+        self.binary_output = False
+        # 增量 UTF-8 解码器，正确处理跨两次读取的多字节字符
+        self.output_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+        # 输入: 客户端协商 input=binary 后以带操作码的二进制帧发送，文本帧为 JSON 兼容模式
+        self.binary_input = False
+        self.input_pending = bytearray()   # SSH 窗口已满时暂存的输入
+        self.input_task = None             # 暂存输入的写入任务
+
+        # 输出流量控制
+        self.flow_control = None           # 背压和限速控制器
+        self.output_readable = None        # SSH 通道可读事件
+        self.ssh_channel_fd = None         # SSH 通道事件管道描述符
+        self.rate_limit_timer = None       # 限速恢复定时器
+        self.receive_task = None           # SSH 输出读取任务
+
+        # 会话录像
+        self.recording = None              # 录像记录
+        self.recorder = None               # 录像器，未开启录像时为空
+
+        # 会话恢复: WebSocket 异常断开后在宽限期内保留 SSH 通道，客户端凭恢复令牌重新接入
+        self.client = self                 # 当前接收输出的 WebSocket 连接，断开等待恢复时为空
+        self.session = None                # 恢复连接时接入的原会话
+        self.resume_token = None           # 恢复令牌，仅二进制输出模式下提供
+        self.scrollback = None             # 输出环形缓冲区，用于断线恢复补发和观看者的快照
+        self.resume_timer = None           # 宽限期定时器
+        self.closing = False               # WebSocket 是否由服务端主动关闭
+        self.terminated = False            # 会话是否已结束
+
+        # 会话观看: 输出经通道层分发给只读观看者
+        self.shadow = None
 
     async def connect(self):
+        self._phase_started = time.perf_counter()
+
         # 从 URL 中获取主机 ID
         self.host_id = self.scope['url_route']['kwargs']['host_id']
         logger.debug(f"尝试连接到主机ID: {self.host_id}")
@@ -62,6 +117,10 @@ class SSHConsumer(AsyncWebsocketConsumer):
         query_string = self.scope['query_string'].decode('utf-8')
         query_params = urllib.parse.parse_qs(query_string)
         token = query_params.get('token', [None])[0]
+        self.binary_output = query_params.get('output', ['text'])[0] == 'binary'
+        self.binary_input = query_params.get('input', ['text'])[0] == 'binary'
+        resume_token = query_params.get('resume', [None])[0]
+        flow_control_enabled = query_params.get('flow_control', ['0'])[0] == '1'
 
         if not token:
             logger.warning("连接失败: 未提供令牌")
@@ -69,10 +128,10 @@ class SSHConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        # 验证令牌并获取用户名
+        # 验证令牌，获取用户、主机、凭据和系统设置，一次线程切换完成
         try:
-            token_obj = await sync_to_async(Token.objects.get)(token=token)
-            self.user = await sync_to_async(User.objects.get)(id=token_obj.user_id)
+            self.user, self.host, self.credential, system_settings = await sync_to_async(load_session_context)(
+                token, self.host_id)
             self.username = self.user.username
             logger.debug(f"用户 {self.username} 认证成功")
         except Token.DoesNotExist:
@@ -80,242 +139,575 @@ class SSHConsumer(AsyncWebsocketConsumer):
             await self.send_text_data('认证失败：无效的令牌。\n')
             await self.close()
             return
-        except User.DoesNotExist:
-            logger.warning(f"连接失败: 用户不存在 (令牌: {token})")
-            await self.send_text_data('认证失败：用户不存在。\n')
+        except (Host.DoesNotExist, ValidationError):
+            logger.warning(f"连接失败: 主机不存在 (主机ID={self.host_id})")
+            await self.send_text_data('主机不存在。\n')
             await self.close()
             return
 
-        # 异步获取主机和凭据信息
-        self.host = await sync_to_async(get_object_or_404)(Host, id=self.host_id)
-        self.credential_id = await sync_to_async(lambda: self.host.account_type.id)()
-        self.credential = await sync_to_async(get_object_or_404)(Credential, id=self.credential_id)
+        if self.credential is None:
+            logger.warning(f"连接失败: 主机未关联凭据 (主机ID={self.host_id})")
+            await self.send_text_data('主机未关联凭据。\n')
+            await self.close()
+            return
+        self.credential_id = self.credential.id
         logger.debug(f"获取到主机信息: {self.host.name}, 凭据ID: {self.credential_id}")
+        self.mark_connect_phase('bootstrap')
+
+        # 携带恢复令牌时接入断线前的会话，会话已结束则按新会话处理
+        if resume_token and await self.resume_session(resume_token, query_params.get('offset', ['0'])[0]):
+            return
+
+        # 主机配置了自定义提示符时优先使用
+        if self.host.prompt_pattern:
+            try:
+                self.terminal_parser = TerminalParser((self.host.prompt_pattern,) + DEFAULT_PROMPT_PATTERNS)
+            except re.error as e:
+                logger.warning(f"主机 {self.host.name} 的提示符正则无效，使用默认规则: {str(e)}")
+
+        # 回车时检查阻断执行的规则，规则在进程内缓存，之后按键路径上不访问数据库
+        await alert_rule_cache.ensure_loaded()
+        self.command_guard = CommandGuard(
+            lambda: alert_rule_cache.get_blocking_matcher(self.host.id),
+            self.terminal_parser,
+            self.forward_input,
+            self.block_command,
+            get_client_command=lambda: self.client_command,
+            echo_timeout=settings.COMMAND_ALERT['BLOCK_ECHO_TIMEOUT'],
+        )
+
+        # 初始化输出流量控制，限速由系统设置配置(KB/s)
+        rate_limit = system_settings.terminal_output_rate_limit if system_settings else 0
+        self.flow_control = OutputFlowControl(
+            high_water=settings.SSH_TERMINAL['OUTPUT_HIGH_WATER_MARK'],
+            low_water=settings.SSH_TERMINAL['OUTPUT_LOW_WATER_MARK'],
+            rate_limit=rate_limit * 1024,
+            enabled=flow_control_enabled,
+        )
 
         # 接受 WebSocket 连接
         await self.accept()
         logger.debug(f"WebSocket 连接已接受")
+        self.mark_connect_phase('accept')
+
+        self.connected_at = datetime.datetime.now()
+
+        # 注册会话，用于统计
+        session_registry.register(self.channel_name, self)
+
+        # 保留最近的输出
+        self.scrollback = ScrollbackBuffer(settings.SSH_TERMINAL['SCROLLBACK_BYTES'])
 
-        # 初始化最后活动时间
-        self.last_activity = datetime.datetime.now()
+        # 二进制输出模式下下发恢复令牌，断线后客户端按已接收的字节偏移恢复
+        if self.binary_output and settings.SSH_TERMINAL['RESUME_GRACE_PERIOD']:
+            self.resume_token = secrets.token_urlsafe(24)
+            resumable_sessions.register(self.resume_token, self)
+            await self.send_session_info(0)
+
+        # 加入会话控制组，允许管理员通过会话统计中的 shadow_id 只读观看
+        if self.channel_layer is not None:
+            self.shadow = ShadowPublisher(
+                self.channel_layer, uuid.uuid4().hex, settings.SSH_TERMINAL['SHADOW_MAX_PENDING'])
+            await self.shadow.attach(self.channel_name)
         
-        # 启动超时检查任务
-        self.timeout_task = asyncio.create_task(self.check_timeout())
+        # 开始空闲超时跟踪，用户或主机配置了超时(分钟)时取较严格的一个
+        configured = [t for t in (self.user.terminal_idle_timeout, self.host.terminal_idle_timeout) if t]
+        if configured:
+            self.idle_timeout = min(configured) * 60
+        idle_reaper.track(self.channel_name, self.idle_timeout, self.on_idle_timeout)
         
         # 初始化 SSH 连接
         await self.establish_ssh_connection()
 
     async def disconnect(self, close_code):
-        # 取消超时检查任务
-        if self.timeout_task:
-            self.timeout_task.cancel()
-            try:
-                await self.timeout_task
-            except asyncio.CancelledError:
-                pass
+        logger.info(f"WebSocket 连接已断开 (close_code={close_code})")
+        session = self.session or self
+        await session.client_disconnected(self, close_code)
+
+    async def client_disconnected(self, client, close_code):
+        """
+        会话的 WebSocket 连接断开
+
+        客户端正常关闭(1000)或服务端主动关闭时结束会话；异常断开时保留 SSH 通道，
+        输出继续写入环形缓冲区，宽限期内客户端未恢复则结束会话。
+
+        Args:
+            client: 断开的连接
+            close_code: 关闭代码
+        """
+        if client is not self.client:
+            # 已被新的连接取代
+            return
+        if self.shadow:
+            await self.shadow.detach(client.channel_name)
+
+        grace_period = settings.SSH_TERMINAL['RESUME_GRACE_PERIOD']
+        if client.closing or close_code == 1000 or not self.resume_token or self.terminated:
+            await self.terminate()
+            return
+
+        self.client = None
+        # 断开前发送的输出不会再被确认，清零后继续读取，输出写入环形缓冲区
+        self.flow_control.reset()
+        self.resume_output(OutputFlowControl.BACKPRESSURE)
+        self.resume_timer = asyncio.get_running_loop().call_later(
+            grace_period, lambda: asyncio.ensure_future(self.terminate()))
+        logger.info(f"终端会话等待恢复: 用户={self.username}, 主机={self.host.name}, 宽限期={grace_period}秒")
+
+    async def resume_session(self, resume_token, offset):
+        """
+        接入断线前的会话
+
+        Args:
+            resume_token: 恢复令牌
+            offset: 客户端已接收的输出字节数
+
+        Returns:
+            bool: 是否已接入，会话不存在、已结束、不属于当前用户和主机，或输入输出格式与会话不同时返回 False
+        """
+        session = resumable_sessions.get(resume_token)
+        if (session is None or session.terminated
+                or session.user.id != self.user.id or session.host.id != self.host.id):
+            logger.info(f"恢复令牌无效或会话已结束，建立新会话 (主机ID={self.host_id})")
+            return False
+        if session.binary_output != self.binary_output or session.binary_input != self.binary_input:
+            # 会话按建立时的格式发送输出和解析输入，格式不同的客户端无法接入
+            logger.info(f"客户端的输入输出格式与断线前的会话不同，建立新会话 (主机ID={self.host_id})")
+            return False
+        try:
+            offset = int(offset)
+        except ValueError:
+            offset = 0
+
+        await self.accept()
+        self.session = session
+        await session.attach(self, offset)
+        return True
+
+    async def attach(self, client, offset):
+        """
+        把会话切换到新的 WebSocket 连接，补发客户端未收到的输出
+
+        Args:
+            client: 新的连接
+            offset: 客户端已接收的输出字节数
+        """
+        previous = self.client
+        if previous is not None:
+            # 原连接尚未察觉断线，由新连接取代
+            await previous.close_websocket(4001)
+        if self.resume_timer:
+            self.resume_timer.cancel()
+            self.resume_timer = None
+
+        data, lost = self.scrollback.read_from(offset)
+        self.client = client
+        if self.shadow:
+            await self.shadow.attach(client.channel_name)
+        self.flow_control.reset()
+        self.resume_output(OutputFlowControl.BACKPRESSURE)
+
+        await self.send_session_info(self.scrollback.total - len(data), lost)
+        if data:
+            await self.send(bytes_data=data)
+        logger.info(f"终端会话已恢复: 用户={self.username}, 主机={self.host.name}, "
+                    f"补发 {len(data)} 字节{'，部分输出已丢失' if lost else ''}")
+
+    async def send_session_info(self, offset, lost=False):
+        """
+        向客户端下发恢复令牌和之后输出的起始字节偏移
+        """
+        await self.send(text_data=json.dumps({
+            'type': 'session',
+            'resume_token': self.resume_token,
+            'offset': offset,
+            'lost': lost,
+        }))
+
+    async def terminate(self):
+        """
+        结束会话，释放 SSH 连接和相关资源
+        """
+        if self.terminated:
+            return
+        self.terminated = True
+        self.client = None
+
+        session_registry.unregister(self.channel_name)
+        if self.resume_token:
+            resumable_sessions.unregister(self.resume_token)
+        if self.resume_timer:
+            self.resume_timer.cancel()
+        if self.shadow:
+            await self.shadow.close()
+
+        # 停止空闲超时跟踪
+        idle_reaper.untrack(self.channel_name)
+
+        # 停止读取 SSH 输出（读取可能因背压暂停，不会自行感知通道关闭）
+        if self.receive_task and self.receive_task is not asyncio.current_task():
+            self.receive_task.cancel()
+        if self.input_task:
+            self.input_task.cancel()
+        if self.command_guard:
+            self.command_guard.cancel()
+
+        # 写完剩余录像
+        await self.stop_recording()
 
         # 关闭 SSH 连接
         if hasattr(self, 'ssh_client'):
             self.ssh_client.close()
 
-        logger.info(f"WebSocket 连接已断开 (close_code={close_code})")
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        """
+        发送到会话当前的 WebSocket 连接，等待恢复时丢弃
+        """
+        client = self.client
+        if client is self:
+            await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+        elif client is not None:
+            await client.send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+    async def close(self, code=None):
+        """
+        关闭会话当前的 WebSocket 连接，等待恢复时直接结束会话
+        """
+        client = self.client
+        if client is self:
+            await self.close_websocket(code)
+        elif client is not None:
+            await client.close(code)
+        else:
+            await self.terminate()
+
+    async def close_websocket(self, code=None):
+        """
+        关闭本连接，断开后结束会话
+        """
+        self.closing = True
+        await super().close(code)
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """
         处理接收到的WebSocket消息
-        
+
+        二进制帧按输入协议解析，文本帧为兼容模式:
         1. 命令记录消息
-        2. 终端大小调整消息
-        3. 普通文本输入
-        
+        2. 输出确认消息
+        3. 终端大小调整消息
+        4. 普通文本输入
+
         Args:
-            text_data: WebSocket消息内容
+            text_data: 文本消息内容
+            bytes_data: 二进制消息内容
         """
-        # 更新最后活动时间
-        self.last_activity = datetime.datetime.now()
-        
+        if self.session is not None:
+            # 恢复的连接，交给原会话处理
+            await self.session.receive(text_data, bytes_data)
+            return
+
         try:
-            # 尝试解析JSON数据
-            try:
-                data = json.loads(text_data)
+            if bytes_data is not None:
+                await self.receive_frame(bytes_data)
+                return
+
+            # 只有以 { 开头的消息才可能是控制消息，普通按键不做 JSON 解析
+            if text_data.startswith('{'):
+                try:
+                    data = json.loads(text_data)
+                except json.JSONDecodeError:
+                    data = None
                 if isinstance(data, dict):
-                    if 'type' in data and data['type'] == 'command':
-                        # 处理命令记录
-                        await self.handle_command_record(data['command'])
+                    if data.get('type') == 'command':
+                        # 客户端上报的命令行，回车回显时由服务端解析结果为准
+                        idle_reaper.touch(self.channel_name)
+                        self.client_command = data['command']
+                        return
+                    elif data.get('type') == 'ack':
+                        # 客户端确认已渲染的输出字节数
+                        self.handle_ack(int(data.get('bytes', 0)))
                         return
                     elif 'cols' in data and 'rows' in data:
                         # 处理终端大小调整
-                        self.ssh_channel.resize_pty(width=data['cols'], height=data['rows'])
+                        idle_reaper.touch(self.channel_name)
+                        self.resize_terminal(data['cols'], data['rows'])
                         return
-            except json.JSONDecodeError:
-                pass
 
             # 处理普通文本输入
-            if hasattr(self, 'ssh_channel'):
-                self.ssh_channel.send(text_data)
+            idle_reaper.touch(self.channel_name)
+            self.write_input(text_data.encode('utf-8'))
 
         except Exception as e:
             logger.error(f"处理WebSocket数据时出错: {str(e)}")
             await self.close()
 
+    async def receive_frame(self, frame):
+        """
+        处理二进制协议帧，首字节为操作码
+
+        Args:
+            frame: 二进制帧内容
+        """
+        if not frame:
+            return
+        opcode = frame[0]
+        if opcode == protocol.OP_INPUT:
+            # 按键直接写入 SSH 通道，不做任何解析
+            idle_reaper.touch(self.channel_name)
+            self.write_input(frame[1:])
+        elif opcode == protocol.OP_ACK:
+            self.handle_ack(protocol.parse_ack(frame))
+        elif opcode == protocol.OP_RESIZE:
+            idle_reaper.touch(self.channel_name)
+            self.resize_terminal(*protocol.parse_resize(frame))
+        elif opcode == protocol.OP_COMMAND:
+            idle_reaper.touch(self.channel_name)
+            self.client_command = frame[1:].decode('utf-8', errors='replace')
+        elif opcode == protocol.OP_PING:
+            await self.send(text_data=protocol.PONG)
+        else:
+            logger.warning(f"未知的终端协议操作码: {opcode} (主机ID={self.host_id})")
+
+    def write_input(self, data):
+        """
+        处理用户输入，主机有阻断执行的规则时由命令检查器决定回车是否发送
+
+        Args:
+            data: 输入的原始字节
+        """
+        if not hasattr(self, 'ssh_channel') or not data:
+            return
+        self.output_batcher.mark_input()
+        if self.command_guard is not None:
+            self.command_guard.feed(data)
+        else:
+            self.forward_input(data)
+
+    def forward_input(self, data):
+        """
+        把用户输入写入 SSH 通道
+
+        通道超时为 0，单次 send 最多写入远端窗口剩余的字节数，窗口已满时抛出 socket.timeout。
+        未写完的部分按顺序暂存，由后台任务在窗口恢复后继续写入，大段粘贴不会被截断，
+        也不会在等待窗口时阻塞输出确认消息的处理。
+
+        Args:
+            data: 输入的原始字节
+        """
+        self.terminal_parser.feed_input(data)
+
+        if not self.input_pending:
+            sent = self._send_input(data)
+            if sent == len(data):
+                return
+            data = data[sent:]
+
+        if len(self.input_pending) + len(data) > settings.SSH_TERMINAL['INPUT_BUFFER_LIMIT']:
+            logger.warning(f"终端输入积压超过上限，丢弃 {len(data)} 字节 (主机ID={self.host_id})")
+            return
+        self.input_pending += data
+        if self.input_task is None or self.input_task.done():
+            self.input_task = asyncio.create_task(self.drain_input())
+
+    def _send_input(self, data):
+        """
+        按块写入输入，直到写完或窗口已满
+
+        Returns:
+            int: 已写入的字节数
+        """
+        chunk_size = settings.SSH_TERMINAL['INPUT_CHUNK_SIZE']
+        offset = 0
+        while offset < len(data):
+            try:
+                sent = self.ssh_channel.send(bytes(data[offset:offset + chunk_size]))
+            except socket.timeout:
+                break
+            if not sent:
+                break
+            offset += sent
+        return offset
+
+    async def drain_input(self):
+        """
+        窗口恢复后继续写入暂存的输入
+        """
+        try:
+            while self.input_pending:
+                del self.input_pending[:self._send_input(self.input_pending)]
+                if self.input_pending:
+                    await asyncio.sleep(0.005)
+        except Exception as e:
+            logger.error(f"写入终端输入时出错: {str(e)} (主机ID={self.host_id})")
+            await self.close()
+
+    def handle_ack(self, acked):
+        """
+        客户端确认已渲染的输出字节数，未确认数据降到低水位时恢复读取
+        """
+        if self.flow_control.on_ack(acked):
+            self.resume_output(OutputFlowControl.BACKPRESSURE)
+
+    def resize_terminal(self, cols, rows):
+        """
+        调整终端大小
+        """
+        self.ssh_channel.resize_pty(width=cols, height=rows)
+        if self.recorder:
+            self.recorder.record_resize(cols, rows)
+        if self.shadow:
+            self.shadow.resize(cols, rows)
+
+    async def shadow_join(self, event):
+        """
+        观看者加入，检查权限后发送当前输出快照，之后的输出发布到观看组
+        """
+        session = self.session or self
+        if session.shadow is None or session.terminated:
+            return
+        if not event.get('admin') and event['username'] != session.username:
+            # 只有管理员和会话所属用户可以观看
+            await self.channel_layer.send(event['watcher'], {'type': 'shadow.denied'})
+            return
+        data, lost = session.scrollback.read_from(0)
+        if lost:
+            # 快照从输出中间截断，从下一行开始
+            data = data[data.find(b'\n') + 1:]
+        session.shadow.add_watcher(event['watcher'])
+        await session.shadow.send_snapshot(
+            event['watcher'], data, session.scrollback.total,
+            username=session.username, host=session.host.name)
+        logger.info(f"用户 {event['username']} 开始观看终端会话: 用户={session.username}, 主机={session.host.name}")
+
+    async def shadow_leave(self, event):
+        """
+        观看者离开
+        """
+        session = self.session or self
+        if session.shadow:
+            session.shadow.remove_watcher(event['watcher'])
+
     async def handle_command_record(self, command):
         """
         处理命令记录
         
-        1. 清理命令文本
+        1. 服务端未能从回显中识别命令时，使用客户端上报的命令行
         2. 记录到数据库
         3. 检查命令告警
         4. 处理编辑器模式
         
         Args:
-            command: 原始命令文本
+            command: 终端解析器提交的命令，可能为空
         """
         try:
+            client_command, self.client_command = self.client_command, None
+
             # 检查是否在编辑器中
             if self.in_editor:
                 return
 
-            # 清理命令
-            clean_command = self.command_handler.clean_command(command)
-            if clean_command:
+            if not command and client_command:
+                command = self.terminal_parser.clean_line(client_command)
+
+            if command:
                 # 记录命令到数据库
-                await self.save_command_log(clean_command)
+                await self.save_command_log(command)
                 # 检查命令告警
-                await self.check_command_alert(clean_command)
+                await self.check_command_alert(command)
 
                 # 检查是否进入编辑器
-                if clean_command.startswith(('vi ', 'vim ')):
+                if command.startswith(('vi ', 'vim ')):
                     self.in_editor = True
-                    logger.debug(f"进入编辑器模式: {clean_command}")
+                    logger.debug(f"进入编辑器模式: {command}")
 
         except Exception as e:
             logger.error(f"记录命令时出错: {str(e)}")
 
-    async def process_input(self, data):
-        """处理输入数据"""
-        if self.in_editor:
-            return
-
-        for char in data:
-            # 处理特殊按键
-            char_code = ord(char)
-            
-            # 处理 Ctrl+C
-            if char_code == 3:
-                self.command_buffer = ''
-                self.actual_command = ''
-                self.in_history_search = False
-                self.history_search_buffer = ''
-                continue
-
-            # 处理回车键
-            if char in ('\r', '\n'):
-                if self.actual_command:
-                    self.command_buffer = self.actual_command
-                    self.actual_command = ''
-
-                if self.command_buffer.strip():
-                    clean_command = self.command_handler.clean_command(self.command_buffer)
-                    if clean_command:
-                        await self.save_command_log(clean_command)
-                        await self.check_command_alert(clean_command)
-
-                self.command_buffer = ''
-                self.in_shell_prompt = False
-                self.in_history_search = False
-                self.history_search_buffer = ''
-                continue
-
-            # 处理其他输入
-            if not self.in_shell_prompt:
-                continue
-
-            # 更新命令缓冲区
-            if char == '\x7f':  # Backspace
-                if self.in_history_search:
-                    self.history_search_buffer = self.history_search_buffer[:-1]
-                else:
-                    self.command_buffer = self.command_buffer[:-1]
-            else:
-                if self.in_history_search:
-                    self.history_search_buffer += char
-                else:
-                    self.command_buffer += char
-
     async def save_command_log(self, command):
         """
         保存执行的命令到 CommandLog 表中。
+        日志进入进程内队列后由写入器批量写入，不在按键路径上等待数据库。
         """
-        await sync_to_async(CommandLog.objects.create)(
+        command_log_writer.put(CommandLog(
             username=self.username,
             command=command,
             hosts=self.host.name,
             network=self.host.network,
             credential=self.credential.name,
             create_time=datetime.datetime.now()
-        )
+        ))
         logger.info(f'命令已记录: 用户={self.username}, 主机={self.host.name}, 命令={command}')
 
     async def check_command_alert(self, command):
         if command:
             logger.debug(f"开始检查命令告警: 用户={self.username}, 主机={self.host.name}, 命令={command}")
-            alert_result = await check_command_alert(self.host.id, command, self.username)
+            alert_result = await check_command_alert(self.host.id, command, self.username, self.host.name)
             if alert_result:
                 logger.warning(f'命令告警触发: 用户={self.username}, 主机={self.host.name}, 命令={command}')
                 # 告警通知已经在 check_command_alert 函数中发送
             else:
                 logger.debug(f'命令未触发告警: 用户={self.username}, 主机={self.host.name}, 命令={command}')
 
+    def block_command(self, command, rule):
+        """
+        命令触发阻断执行的规则，已由命令检查器取消，提示用户并发送告警；
+        无法确定命令或检查结果时检查器拒绝了回车，只提示用户
+
+        Args:
+            command: 被阻断的命令，无法确定命令时为 None
+            rule: 触发的规则，无法确定命令时为 None
+        """
+        if rule is None:
+            logger.warning(f'无法确定命令或检查结果，已拒绝回车: 用户={self.username}, 主机={self.host.name}')
+        else:
+            self.client_command = None
+            logger.warning(f'命令已阻断: 用户={self.username}, 主机={self.host.name}, 规则={rule.name}, 命令={command}')
+        asyncio.create_task(self.notify_command_blocked(command, rule))
+
+    async def notify_command_blocked(self, command, rule):
+        try:
+            if rule is None:
+                message = '\r\n\x1b[31m[已拦截] 无法确认命令是否允许执行，回车未发送，请按 Ctrl+C 后重新输入\x1b[0m\r\n'
+            else:
+                message = f'\r\n\x1b[31m[已阻断] 命令触发规则「{rule.name}」，未执行: {command}\x1b[0m\r\n'
+            await self.output_batcher.push(message.encode('utf-8') if self.binary_output else message)
+            if self.recorder:
+                self.recorder.record_output(message)
+            if rule is not None:
+                # 告警通知由分发队列在后台聚合和发送，这里只入队
+                alert_dispatcher.enqueue(rule.id, command, self.username, self.host.id, self.host.name, rule.suppress_window)
+        except Exception as e:
+            logger.error(f"发送命令阻断提示时出错: {str(e)}")
+
     async def establish_ssh_connection(self):
         """
         使用主机凭据建立 SSH 连接。
+
+        TCP 连接、密钥交换、认证和打开 shell 都是阻塞操作，放到专用线程池中执行，
+        慢主机或不可达主机不会阻塞同一进程内其他终端会话。
         """
         logger.debug(f"开始建立 SSH 连接到主机: {self.host.name}")
-        self.ssh_client = paramiko.SSHClient()
-        self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
-        try:
-            # 设置传输层参数
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(10)
-            sock.connect((self.host.network, self.host.port))
-            
-            transport = paramiko.Transport(sock)
-            transport.set_keepalive(30)  # 30秒发送一次心跳
-            transport.window_size = 2147483647  # 设置最大窗口大小
-            transport.packetizer.REKEY_BYTES = pow(2, 40)  # 重新生成密钥的字节数
-            transport.packetizer.REKEY_PACKETS = pow(2, 40)  # 重新生成密钥的包数量
-
-            if self.credential.type == '密码':
-                logger.debug(f"使用密码认证连接到主机: {self.host.network}")
-                transport.connect(username=self.credential.account, password=self.credential.password)
-            elif self.credential.type == '密钥':
-                logger.debug(f"使用密钥认证接到主机: {self.host.network}")
-                key_file = io.StringIO(self.credential.key)
-                pkey = paramiko.RSAKey.from_private_key(key_file, password=self.credential.key_password)
-                transport.connect(username=self.credential.account, pkey=pkey)
-            else:
-                logger.error(f"不支持的凭据类型: {self.credential.type}")
-                await self.send_text_data('不支持的凭据类型。\n')
-                await self.close()
-                return
-
-            self.ssh_client._transport = transport
-            logger.debug(f"SSH 连接成功建立")
+        if self.credential.type not in ('密码', '密钥'):
+            logger.error(f"不支持的凭据类型: {self.credential.type}")
+            await self.send_text_data('不支持的凭据类型。\n')
+            await self.close()
+            return
 
-            # 使用更大的终端大小启动 shell
-            self.ssh_channel = self.ssh_client.invoke_shell(
-                term='xterm-256color',
-                width=500,
-                height=2000,
-                width_pixels=0,
-                height_pixels=0
+        try:
+            loop = asyncio.get_running_loop()
+            self.ssh_client, self.ssh_channel = await loop.run_in_executor(
+                ssh_connect_executor, open_shell_channel, self.host, self.credential
             )
-            self.ssh_channel.settimeout(0)
-            self.ssh_channel.set_combine_stderr(True)  # 合并标准错误到标准输出
+            self.mark_connect_phase('ssh')
+
+            # 开始录像
+            await self.start_recording()
+            self.mark_connect_phase('recording')
 
             # 开始从 SSH 服务器读取数据
-            asyncio.create_task(self.receive_ssh_data())
+            self.receive_task = asyncio.create_task(self.receive_ssh_data())
 
         except paramiko.AuthenticationException:
             logger.error(f'SSH 认证失败: 主机ID={self.host_id}')
@@ -334,202 +726,240 @@ class SSHConsumer(AsyncWebsocketConsumer):
         """
         持续从 SSH 通道读取数据并将其发送到 WebSocket。
         同时检测 shell 提示符和处理自动补全的内容。
+
+        通道的 fileno() 是 paramiko 内部的事件管道，有数据到达或通道关闭时变为可读，
+        这里把它注册到事件循环上，空闲会话不再占用任何 CPU（原先每 1ms 轮询一次）。
+
+        客户端跟不上或超出限速时移除该监听、停止读取，通道窗口耗尽后远端即停止发送。
         """
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        channel_fd = self.ssh_channel.fileno()
+        self.output_readable = readable
+        self.ssh_channel_fd = channel_fd
+        loop.add_reader(channel_fd, readable.set)
+
         try:
-            buffer = ''
             BUFFER_SIZE = 1024 * 1024  # 增加到 1MB
-            
+
             while True:
-                # 检查是否有数据可读
-                if self.ssh_channel.recv_ready():
+                # 等待通道可读，空闲时不会唤醒事件循环；有待合并的输出时最多等到合并窗口结束
+                flush_delay = self.output_batcher.time_until_flush()
+                flush_timer = loop.call_later(flush_delay, readable.set) if flush_delay is not None else None
+                await readable.wait()
+                readable.clear()
+                if flush_timer:
+                    flush_timer.cancel()
+                if self.output_batcher.time_until_flush() == 0:
+                    await self.output_batcher.flush()
+
+                # 一次性读空通道缓冲区，通道超时为 0，无数据时抛出 socket.timeout
+                while not self.flow_control.paused:
                     try:
-                        data = self.ssh_channel.recv(BUFFER_SIZE)
-                        if not data:
-                            # 连接已关闭
-                            break
-                            
-                        # 解码并发送数据
-                        text = data.decode('utf-8', errors='replace')
-                        await self.send(text_data=text)
-                        
-                        # 更新buffer用于检测提示符
-                        buffer += text
-                        if len(buffer) > 4096:
-                            buffer = buffer[-4096:]
-                            
-                        # 检测 shell 提示符
-                        if self.shell_detector.detect_prompt(text):
+                        data = self.ssh_channel.recv(self.flow_control.read_size(BUFFER_SIZE))
+                    except socket.timeout:
+                        # 通道已读空，shell 可能在等待输入，此时才检测提示符
+                        if self.terminal_parser.detect_prompt():
                             self.in_shell_prompt = True
-                            buffer = ''
-                            if self.in_editor:
-                                self.in_editor = False
-                                
-                        # 更新命令缓冲区
-                        await self.update_command_buffer_from_ssh(text)
-                            
+                            self.in_editor = False
+                        # 回显已读完，检查等待回显的回车
+                        self.command_guard.on_idle()
+                        break
+
+                    if not data:
+                        # 连接已关闭，发送剩余输出；等待恢复的会话直接结束
+                        await self.output_batcher.flush()
+                        if self.client is None:
+                            await self.terminate()
+                        return
+
+                    if 'first_byte' not in self.connect_timings:
+                        self.mark_connect_phase('first_byte')
+                        logger.info(f"终端连接耗时(毫秒): 主机={self.host.name}, {self.connect_timings}")
+
+                    # 超出限速时暂停读取，令牌补足后恢复
+                    delay = self.flow_control.consume(len(data))
+                    if delay:
+                        self.pause_output(OutputFlowControl.RATE_LIMIT)
+                        self.rate_limit_timer = loop.call_later(
+                            delay, self.resume_output, OutputFlowControl.RATE_LIMIT)
+
+                    try:
+                        # 增量解码仅用于审计（提示符检测和命令捕获）
+                        text = self.output_decoder.decode(data)
+
+                        # 二进制模式直接发送原始字节，兼容模式发送解码后的文本
+                        if self.binary_output:
+                            await self.output_batcher.push(data)
+                        elif text:
+                            await self.output_batcher.push(text)
+
+                        # 录像只在内存中追加，压缩和写文件由录像线程池完成
+                        if self.recorder:
+                            self.recorder.record_output(text)
+
+                        # 解析输出，还原用户回车确认的命令行
+                        for command in self.terminal_parser.feed_output(text):
+                            await self.handle_command_record(command)
+
                     except UnicodeDecodeError:
                         logger.warning("解码 SSH 数据时出错，跳过此部分数")
                         continue
-                else:
-                    # 没有数据时短暂休眠
-                    await asyncio.sleep(0.001)
-                
+
         except Exception as e:
             await self.send_text_data(f'连接错误: {str(e)}\n')
             logger.error('SSH 数据接收错误: %s (主机ID=%s)', str(e), self.host_id)
             await self.close()
+        finally:
+            self.output_readable = None
+            if self.rate_limit_timer:
+                self.rate_limit_timer.cancel()
+            loop.remove_reader(channel_fd)
 
-    async def update_command_buffer_from_ssh(self, data):
+    async def start_recording(self):
         """
-        从 SSH 服务器返回的数据中更新命令缓冲区，处理自动补全的内容。
+        创建录像记录并开始录制会话输出，录像失败不影响终端使用
         """
-        if not data or self.in_editor:
-            return
+        try:
+            recording_id = uuid.uuid4()
+            recorder = create_recorder(recording_id, self.connected_at, title=f'{self.username}@{self.host.name}')
+            if recorder is None:
+                return
+            self.recording = await sync_to_async(SessionRecording.objects.create)(
+                id=recording_id,
+                username=self.username,
+                hosts=self.host.name,
+                network=self.host.network,
+                file_path=recorder.path,
+                start_time=self.connected_at,
+            )
+            self.recorder = recorder
+        except Exception as e:
+            logger.error(f"创建会话录像失败: {str(e)} (主机ID={self.host_id})")
 
-        # 如果之前检测到命令已执行，则置标志
-        if self.is_command_executed:
-            self.is_command_executed = False
+    async def stop_recording(self):
+        """
+        停止录像，等待剩余分段写完并更新录像时长和大小
+        """
+        if not self.recorder:
             return
+        recorder, self.recorder = self.recorder, None
+        try:
+            duration = await recorder.close()
+            self.recording.duration = round(duration, 3)
+            self.recording.size = recorder.get_stats()['recording_file_bytes']
+            self.recording.end_time = datetime.datetime.now()
+            await sync_to_async(self.recording.save)(update_fields=['duration', 'size', 'end_time'])
+        except Exception as e:
+            logger.error(f"保存会话录像失败: {str(e)} (录像ID={self.recording.id})")
 
-        ansi_escape = re.compile(r'\x1B\[[0-?]*[ -/]*[@-~]')
-        clean_data = ansi_escape.sub('', data)
-
-        # 检否包含历史命令的完整输出
-        if self.in_history_search:
-            # 尝试从输出中提取完整的命令
-            # 使用正则表达式匹配 reverse-i-search 后的实际命令
-            search_pattern = r'\(reverse-i-search\).*?: (.+?)(?=\r|\n|$)'
-            matches = re.findall(search_pattern, clean_data)
-            if matches:
-                # 取最后一个匹配的命令
-                self.actual_command = matches[-1].strip()
-                logger.debug(f"从历史搜索中获取到完整命令: {self.actual_command}")
-                return
-        
-        # 检查是否是方向键历史命令
-        elif '\x1b[A' in data or '\x1b[B' in data:  # 上下方向键
-            lines = clean_data.splitlines()
-            for line in lines:
-                if line.strip():
-                    # 清理命令中的示符
-                    clean_line = re.sub(r'^\[.*?\]#\s*', '', line.strip())
-                    if clean_line:
-                        self.actual_command = clean_line
-                        logger.debug(f"从方向键历史中获取到完整命令: {self.actual_command}")
-                    break
-
-        # 处理自动补全的情况
-        elif self.last_input_char and ord(self.last_input_char) == 9:  # Tab 键
-            # 只保留可打印字符
-            printable_data = ''.join(filter(lambda x: x.isprintable(), clean_data))
-            self.command_buffer += printable_data
+    def mark_connect_phase(self, phase):
+        """
+        记录连接阶段耗时(毫秒)，从上一阶段结束开始计时
 
-    async def send_text_data(self, message):
+        Args:
+            phase: 阶段名称
         """
-        辅助函数，用于向 WebSocket 发送消息。
+        now = time.perf_counter()
+        self.connect_timings[phase] = round((now - self._phase_started) * 1000, 2)
+        self._phase_started = now
+
+    def pause_output(self, reason):
         """
-        await self.send(text_data=message)
-        logger.debug('发送到 WebSocket 的消息: %s', message.strip())
+        暂停读取 SSH 通道输出
 
-    async def check_timeout(self):
+        Args:
+            reason: 暂停原因(背压或限速)
         """
-        定期检查连接是否超时
+        if self.flow_control.pause(reason) and self.output_readable is not None:
+            asyncio.get_running_loop().remove_reader(self.ssh_channel_fd)
+            logger.debug(f"暂停读取 SSH 输出: 原因={reason}, 主机={self.host.name}")
+
+    def resume_output(self, reason):
         """
-        try:
-            while True:
-                await asyncio.sleep(30)  # 每30秒检查一次
-                
-                if self.last_activity is None:
-                    continue
-                    
-                elapsed = datetime.datetime.now() - self.last_activity
-                if elapsed.total_seconds() > self.TIMEOUT_SECONDS:
-                    logger.info(f"SSH 连接超时 ({self.TIMEOUT_SECONDS}秒无活动)")
-                    # 发送超时消息给客户端
-                    await self.send(text_data=json.dumps({
-                        'type': 'timeout',
-                        'message': f'连接已超时 ({self.TIMEOUT_SECONDS//60}分钟无活动)'
-                    }))
-                    # 关闭连接
-                    await self.close(code=4000)  # 使用自定义关闭代码4000表示超时
-                    break
-                    
-        except asyncio.CancelledError:
-            # 任务被取消时正常退出
-            pass
-        except Exception as e:
-            logger.error(f"超时检查任务出错: {str(e)}")
+        恢复读取 SSH 通道输出
 
-class CommandHandler:
-    """
-    命令处理器类
-    1. 清理命令文本
-    2. 移除ANSI转义序列
-    3. 移除shell提示符
-    """
-    
-    def __init__(self):
-        # Shell提示符正则表达式
-        self.shell_prompt_regex = re.compile(r'[^@]+@[^:]+:[^\$#]*[#$]\s?$')
+        Args:
+            reason: 解除的暂停原因
+        """
+        if self.flow_control.resume(reason) and self.output_readable is not None:
+            asyncio.get_running_loop().add_reader(self.ssh_channel_fd, self.output_readable.set)
+            self.output_readable.set()
+            logger.debug(f"恢复读取 SSH 输出: 原因={reason}, 主机={self.host.name}")
 
-    def clean_command(self, command):
+    async def send_output(self, frame):
         """
-        清理命令文本
-        1. 移除ANSI转义序列
-        2. 移除各种shell提示符
-        3. 移除前后空白字符
-        
-        Args:
-            command: 原始命令文本
-            
-        Returns:
-            清理后的命令文本
+        向 WebSocket 发送一帧终端输出，由输出合并器调用。
+        二进制模式下以二进制帧发送原始字节。
+        输出同时写入环形缓冲区以便断线恢复时补发，有观看者时发布给观看者。
         """
-        # 移除ANSI转义序列
-        ansi_escape = re.compile(r'\x1B\[[0-?]*[ -/]*[@-~]')
-        clean_cmd = ansi_escape.sub('', command)
-        
-        # 移除shell提示符
-        clean_cmd = re.sub(r'^\[.*?\]#\s*', '', clean_cmd)                # 移除方括号类型提示符
-        clean_cmd = re.sub(r'^.*\(reverse-i-search\).*?: ', '', clean_cmd) # 移除历史搜索提示符
-        clean_cmd = re.sub(r'^.*?[@:].*?[#$]\s*', '', clean_cmd)          # 移除常见的shell提示符格式
-        
-        # 移除前后空白字符
-        clean_cmd = clean_cmd.strip()
-        
-        return clean_cmd
+        data = frame.encode('utf-8') if isinstance(frame, str) else frame
+        if self.scrollback is not None:
+            self.scrollback.append(data)
+            if self.shadow:
+                self.shadow.publish(data, self.scrollback.total)
+        if self.client is None:
+            return
 
-class ShellPromptDetector:
-    """
-    Shell提示符检测器类
-    1. 检测shell提示符
-    2. 管理检测缓冲区
-    """
-    
-    def __init__(self):
-        # Shell提示符匹配模式
-        self.prompt_pattern = re.compile(r'[^@]+@[^:]+:[^\$#]*[#$]\s?$')
-        self.buffer = ''  # 检测缓冲区
+        if self.binary_output:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+
+        # 未确认数据超过高水位时暂停读取，文本模式下同样按 UTF-8 编码后的字节数计算
+        if self.flow_control.on_sent(len(data)):
+            self.pause_output(OutputFlowControl.BACKPRESSURE)
 
-    def detect_prompt(self, data):
+    def get_session_stats(self):
         """
-        检测shell提示符
-        
-        Args:
-            data: 要检测的文本数据
-            
+        获取会话统计信息
+
         Returns:
-            bool: 是否检测到提示符
+            dict: channel_name、username、host、connected_at 会话信息，output_mode/input_mode 数据格式，
+                  input_pending 待写入 SSH 的输入字节数，detached 是否已断线等待恢复，scrollback_bytes 输出缓冲区字节数，
+                  idle_timeout 空闲超时(秒)，connect_timings 建立连接各阶段耗时；
+                  另外合并输出帧、流量控制、录像、观看和命令检查的统计，见各自的 get_stats
         """
-        # 更新缓冲区
-        self.buffer += data
-        # 保持缓冲区大小在合理范围
-        if len(self.buffer) > 4096:
-            self.buffer = self.buffer[-4096:]
-        
-        # 检查是否匹配提示符模式
-        return bool(self.prompt_pattern.search(self.buffer))
+        stats = {
+            'channel_name': self.channel_name,
+            'username': getattr(self, 'username', None),
+            'host': self.host.name if hasattr(self, 'host') else None,
+            'connected_at': self.connected_at.strftime('%Y-%m-%d %H:%M:%S') if self.connected_at else None,
+            'output_mode': 'binary' if self.binary_output else 'text',
+            'input_mode': 'binary' if self.binary_input else 'text',
+            'input_pending': len(self.input_pending),
+            'detached': self.client is None,
+            'scrollback_bytes': len(self.scrollback) if self.scrollback is not None else 0,
+            'idle_timeout': self.idle_timeout,
+            'connect_timings': self.connect_timings,
+        }
+        stats.update(self.output_batcher.get_stats())
+        if self.flow_control:
+            stats.update(self.flow_control.get_stats())
+        if self.recorder:
+            stats.update(self.recorder.get_stats())
+        if self.shadow:
+            stats.update(self.shadow.get_stats())
+        if self.command_guard:
+            stats.update(self.command_guard.get_stats())
+        return stats
+
+    async def send_text_data(self, message):
+        """
+        辅助函数，用于向 WebSocket 发送消息。
+        """
+        await self.send(text_data=message)
+        logger.debug('发送到 WebSocket 的消息: %s', message.strip())
 
-    def reset(self):
-        """重置检测缓冲区"""
-        self.buffer = ''
+    async def on_idle_timeout(self):
+        """
+        空闲超时回调，由空闲超时回收器调用
+        """
+        logger.info(f"SSH 连接超时 ({self.idle_timeout}秒无活动)")
+        # 发送超时消息给客户端
+        await self.send(text_data=json.dumps({
+            'type': 'timeout',
+            'message': f'连接已超时 ({self.idle_timeout//60}分钟无活动)'
+        }))
+        # 关闭连接
+        await self.close(code=4000)  # 使用自定义关闭代码4000表示超时
@@ -3,7 +3,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Count
+from django.db.models import Count, Sum
 from django.db.models.functions import TruncDate
 from collections import defaultdict
 from django.db import models
@@ -35,7 +35,7 @@ def dashboard_statistics(request):
         statistics = {
             'hostCount': Host.objects.count(),
             'userCount': User.objects.count(),
-            'alertCount': AlertHistoryLog.objects.count(),
+            'alertCount': AlertHistoryLog.objects.aggregate(total=Sum('count'))['total'] or 0,  # 聚合的告警按触发次数计
             'lockedUserCount': UserLock.objects.filter(lock_count__gt=0).count(),
             'onlineSessionCount': online_sessions,
             'failedLoginCount': LoginLog.objects.filter(login_status=False).count(),
@@ -1,5 +1,3 @@
-import paramiko
-import io
 import logging
 import json
 import stat
@@ -19,6 +17,7 @@ from asgiref.sync import async_to_sync
 from django.conf import settings
 from concurrent.futures import ThreadPoolExecutor
 from apps.utils import CustomTokenAuthentication, IsAuthenticated
+from apps.ssh_utils.ssh_connector import transport_pool
 import time
 
 # 获取日志记录器实例
@@ -40,35 +39,15 @@ class FileListView(APIView):
             path = request.GET.get('path', '/')
             show_hidden = request.GET.get('show_hidden', 'false').lower() == 'true'
 
-            # 建立 SSH 和 SFTP 连接
-            ssh_client = paramiko.SSHClient()
-            ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
             # 设置更长的超时时间和更大的窗口大小
             transport_timeout = settings.FILE_TRANSFER.get('TIMEOUT', 3600)
 
-            if credential.type == '密码':
-                ssh_client.connect(
-                    host.network,
-                    port=host.port,
-                    username=credential.account,
-                    password=credential.password,
-                    timeout=transport_timeout
-                )
-            elif credential.type == '密钥':
-                key_file = io.StringIO(credential.key)
-                pkey = paramiko.RSAKey.from_private_key(
-                    key_file, password=credential.key_password)
-                ssh_client.connect(
-                    host.network,
-                    port=host.port,
-                    username=credential.account,
-                    pkey=pkey,
-                    timeout=transport_timeout
-                )
-            else:
+            if credential.type not in ('密码', '密钥'):
                 return Response({'error': '不支持的凭据类型'}, status=status.HTTP_400_BAD_REQUEST)
 
+            # 从连接池获取 SSH 连接，已打开终端时直接复用，无需重新握手
+            ssh_client = transport_pool.acquire(host, credential)
+
             # 打开 SFTP 客户端并设置参数
             sftp_client = ssh_client.open_sftp()
             sftp_client.get_channel().settimeout(transport_timeout)
@@ -250,40 +229,11 @@ class FileUploadView(APIView):
         sftp_client = None
 
         try:
-            # 建立SSH连接
-            ssh_client = paramiko.SSHClient()
-            ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            # 从连接池获取SSH连接
+            ssh_client = transport_pool.acquire(host, credential)
 
             # 设置更长的超时时间
             transport_timeout = settings.FILE_TRANSFER.get('TIMEOUT', 3600)
-            banner_timeout = 60
-            auth_timeout = 60
-
-            if credential.type == '密码':
-                ssh_client.connect(
-                    host.network,
-                    port=host.port,
-                    username=credential.account,
-                    password=credential.password,
-                    timeout=transport_timeout,
-                    banner_timeout=banner_timeout,
-                    auth_timeout=auth_timeout
-                )
-            else:
-                key_file = io.StringIO(credential.key)
-                pkey = paramiko.RSAKey.from_private_key(
-                    key_file,
-                    password=credential.key_password
-                )
-                ssh_client.connect(
-                    host.network,
-                    port=host.port,
-                    username=credential.account,
-                    pkey=pkey,
-                    timeout=transport_timeout,
-                    banner_timeout=banner_timeout,
-                    auth_timeout=auth_timeout
-                )
 
             # 设置SFTP客户端
             sftp_client = ssh_client.open_sftp()
@@ -473,39 +423,10 @@ class FileDownloadView(APIView):
         sftp_client = None
 
         try:
-            # 建立SSH连接
-            ssh_client = paramiko.SSHClient()
-            ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            # 从连接池获取SSH连接
+            ssh_client = transport_pool.acquire(host, credential)
 
             transport_timeout = settings.FILE_TRANSFER.get('TIMEOUT', 3600)
-            banner_timeout = 60
-            auth_timeout = 60
-
-            if credential.type == '密码':
-                ssh_client.connect(
-                    host.network,
-                    port=host.port,
-                    username=credential.account,
-                    password=credential.password,
-                    timeout=transport_timeout,
-                    banner_timeout=banner_timeout,
-                    auth_timeout=auth_timeout
-                )
-            else:
-                key_file = io.StringIO(credential.key)
-                pkey = paramiko.RSAKey.from_private_key(
-                    key_file,
-                    password=credential.key_password
-                )
-                ssh_client.connect(
-                    host.network,
-                    port=host.port,
-                    username=credential.account,
-                    pkey=pkey,
-                    timeout=transport_timeout,
-                    banner_timeout=banner_timeout,
-                    auth_timeout=auth_timeout
-                )
 
             # 设置SFTP客户端
             sftp_client = ssh_client.open_sftp()
@@ -3,9 +3,10 @@ from django.shortcuts import get_object_or_404
 from django.forms.models import model_to_dict
 from rest_framework import serializers
 import json
+import re
 import paramiko
-import io
 import uuid
+from apps.ssh_utils.key_cache import load_private_key
 
 # 节点序列化器，用于验证和序列化 Node 模型的数据
 class NodeSerializer(serializers.ModelSerializer):
@@ -20,6 +21,25 @@ class HostSerializer(serializers.ModelSerializer):
         model = Host
         fields = '__all__'
 
+    def validate_prompt_pattern(self, value):
+        """
+        校验自定义提示符正则表达式
+        """
+        if value:
+            try:
+                re.compile(value)
+            except re.error as e:
+                raise serializers.ValidationError(f'无效的正则表达式: {str(e)}')
+        return value
+
+    def validate_terminal_idle_timeout(self, value):
+        """
+        校验终端空闲超时，为空时使用系统默认
+        """
+        if value is not None and value < 1:
+            raise serializers.ValidationError('终端空闲超时至少为1分钟')
+        return value
+
 class HostView(APIView):
     """
     HostView 类处理 Host 模型的 CRUD 操作，
@@ -50,6 +70,8 @@ class HostView(APIView):
                     'port': host.port,
                     'account_type': host.account_type.name if host.account_type else None,
                     'remarks': host.remarks,
+                    'prompt_pattern': host.prompt_pattern,
+                    'terminal_idle_timeout': host.terminal_idle_timeout,
                     'create_time': host.create_time.strftime('%Y-%m-%d %H:%M:%S'),
                 }
                 return Response(data, status=status.HTTP_200_OK)
@@ -104,6 +126,8 @@ class HostView(APIView):
                     'port': host.port,
                     'account_type': host.account_type.name if host.account_type else None,  # 关联凭据的名称
                     'remarks': host.remarks,
+                    'prompt_pattern': host.prompt_pattern,
+                    'terminal_idle_timeout': host.terminal_idle_timeout,
                     'create_time': host.create_time.strftime('%Y-%m-%d %H:%M:%S'),
                 })
 
@@ -260,7 +284,7 @@ class TestConnectionView(APIView):
         if credential.type == '密码':
             result, error = self.test_ssh_connection(ip_address, port, credential.account, credential.password)
         elif credential.type == '密钥':
-            result, error = self.test_ssh_key_connection(ip_address, port, credential.account, credential.key, credential.key_password)
+            result, error = self.test_ssh_key_connection(ip_address, port, credential.account, credential.key, credential.key_password, credential.id)
         else:
             return Response({'status': 1, 'error': '不支持的凭据类型'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -291,15 +315,13 @@ class TestConnectionView(APIView):
         except Exception as e:
             return False, f"Unexpected error: {str(e)}"
 
-    def test_ssh_key_connection(self, ip, port, username, key, key_password=None):
+    def test_ssh_key_connection(self, ip, port, username, key, key_password=None, credential_id=None):
             """
             使用密钥测试SSH连接
             """
             try:
-                # 使用StringIO将字符串键转换为类似文件的对象
-                key_file = io.StringIO(key)
-                # 加载私钥，处理可能提供或不提供密钥密码的情况
-                pkey = paramiko.RSAKey.from_private_key(key_file, password=key_password)
+                # 加载私钥，自动识别 RSA、ECDSA 和 Ed25519，已解析的私钥按凭据缓存
+                pkey = load_private_key(key, key_password, credential_id)
                 
                 ssh = paramiko.SSHClient()
                 ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -1,8 +1,8 @@
 import paramiko
-import io
 from django.conf import settings
 import logging
 from ..models import Host, Credential
+from apps.ssh_utils.key_cache import load_private_key
 
 logger = logging.getLogger('log')
 
@@ -26,13 +26,12 @@ class HostMonitorTask:
             return False
 
     @staticmethod
-    def test_ssh_key_connection(ip, port, username, key, key_password=None):
+    def test_ssh_key_connection(ip, port, username, key, key_password=None, credential_id=None):
         """
-        测试SSH密钥连接
+        测试SSH密钥连接，支持 RSA、ECDSA 和 Ed25519 私钥
         """
         try:
-            key_file = io.StringIO(key)
-            pkey = paramiko.RSAKey.from_private_key(key_file, password=key_password)
+            pkey = load_private_key(key, key_password, credential_id)
             
             ssh = paramiko.SSHClient()
             ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -76,7 +75,8 @@ class HostMonitorTask:
                             host.port,
                             credential.account,
                             credential.key,
-                            credential.key_password
+                            credential.key_password,
+                            credential.id
                         )
                 elif host.protocol == 'RDP':
                     # 这里可以添加RDP连接测试逻辑
@@ -0,0 +1,94 @@
+import os
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.shortcuts import get_object_or_404
+from apps.utils import APIView, Response, status, CustomTokenAuthentication, IsAuthenticated, user_is_admin
+from apps.models import SessionRecording
+from apps.ssh_utils.session_recorder import read_recording
+
+
+class SessionRecordingView(APIView):
+    """
+    SessionRecordingView 类返回终端会话录像列表，支持按用户名和主机名筛选，
+    管理员可以查看所有用户的录像，其他用户只能查看自己的录像
+    """
+    authentication_classes = [CustomTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # 获取查询参数
+        page = int(request.GET.get('page', 1))
+        page_size = int(request.GET.get('page_size', 10))
+        username = request.GET.get('username', '')
+        hostname = request.GET.get('hostname', '')
+
+        # 构建查询条件
+        query = Q()
+        if not user_is_admin(request.user):
+            query &= Q(username=request.user.username)
+        if username:
+            query &= Q(username__icontains=username)
+        if hostname:
+            query &= Q(hosts__icontains=hostname)
+
+        recordings = SessionRecording.objects.filter(query).order_by('-start_time')
+
+        # 分页
+        paginator = Paginator(recordings, page_size)
+        current_page = paginator.get_page(page)
+
+        data = [{
+            'id': str(recording.id),
+            'username': recording.username,
+            'hosts': recording.hosts,
+            'network': recording.network,
+            'duration': recording.duration,
+            'size': recording.size,
+            'start_time': recording.start_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'end_time': recording.end_time.strftime('%Y-%m-%d %H:%M:%S') if recording.end_time else None,
+        } for recording in current_page]
+
+        return Response({
+            'code': 200,
+            'message': '获取会话录像成功',
+            'data': {
+                'items': data,
+                'total': paginator.count,
+                'page': page,
+                'page_size': page_size
+            }
+        })
+
+
+class SessionRecordingPlaybackView(APIView):
+    """
+    SessionRecordingPlaybackView 类按时间段返回录像内容，
+    通过时间索引定位分段，从任意时间点开始回放都无需解压整个录像，
+    只有管理员和录像所属用户可以回放
+    """
+    authentication_classes = [CustomTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        """
+        处理GET请求，参数 start 为开始时间(秒)，duration 为读取时长(秒)
+        """
+        recording = get_object_or_404(SessionRecording, pk=pk)
+        if recording.username != request.user.username and not user_is_admin(request.user):
+            return Response({'error': '没有权限查看该录像'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            start = max(0.0, float(request.GET.get('start', 0)))
+            duration = float(request.GET.get('duration', 60))
+        except ValueError:
+            return Response({'error': '无效的时间参数'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not os.path.exists(recording.file_path):
+            return Response({'error': '录像文件不存在'}, status=status.HTTP_404_NOT_FOUND)
+
+        data = read_recording(recording.file_path, start, duration if duration > 0 else None)
+        return Response({
+            'code': 200,
+            'message': '获取录像内容成功',
+            'data': data
+        })
@@ -0,0 +1,125 @@
+import json
+import asyncio
+import urllib.parse
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+from apps.models import Token
+from apps.utils import user_is_admin
+from apps.ssh_utils.session_shadow import control_group, watch_group
+import logging
+
+logger = logging.getLogger('log')
+
+# 等待会话返回快照的时间(秒)，超时说明会话不存在或已结束
+SNAPSHOT_TIMEOUT = 5
+
+
+class SessionShadowConsumer(AsyncWebsocketConsumer):
+    """
+    终端会话观看消费者
+
+    只读观看其他用户正在进行的终端会话：
+    1. 只有管理员和会话所属用户可以观看，会话收到加入请求时检查，无权限时拒绝
+    2. 加入会话的观看组，并请求会话发送当前输出的快照
+    3. 之后按累计字节偏移接收实时输出，与快照无缝衔接
+    4. 忽略观看者的所有输入
+    """
+
+    async def connect(self):
+        self.shadow_id = self.scope['url_route']['kwargs']['shadow_id']
+        self.offset = None  # 已发送给观看者的累计字节偏移，收到快照前为空
+        self.size = None    # 会话终端的列数和行数
+        self.snapshot_timer = None
+
+        query_string = self.scope['query_string'].decode('utf-8')
+        query_params = urllib.parse.parse_qs(query_string)
+        token = query_params.get('token', [None])[0]
+
+        if not token:
+            await self.close()
+            return
+
+        try:
+            token_obj = await database_sync_to_async(Token.objects.select_related('user').get)(token=token)
+            self.user = token_obj.user
+        except Token.DoesNotExist:
+            await self.close()
+            return
+
+        self.is_admin = await database_sync_to_async(user_is_admin)(self.user)
+        await self.accept()
+
+        await self.channel_layer.group_add(watch_group(self.shadow_id), self.channel_name)
+        await self.channel_layer.group_send(control_group(self.shadow_id), {
+            'type': 'shadow.join',
+            'watcher': self.channel_name,
+            'username': self.user.username,
+            'admin': self.is_admin,
+        })
+        self.snapshot_timer = asyncio.get_running_loop().call_later(
+            SNAPSHOT_TIMEOUT, lambda: asyncio.ensure_future(self.session_not_found()))
+        logger.info(f"用户 {self.user.username} 开始观看终端会话 {self.shadow_id}")
+
+    async def disconnect(self, close_code):
+        if self.snapshot_timer:
+            self.snapshot_timer.cancel()
+        if not hasattr(self, 'user'):
+            return
+        await self.channel_layer.group_discard(watch_group(self.shadow_id), self.channel_name)
+        await self.channel_layer.group_send(control_group(self.shadow_id), {
+            'type': 'shadow.leave',
+            'watcher': self.channel_name,
+        })
+        logger.info(f"用户 {self.user.username} 停止观看终端会话 {self.shadow_id}")
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # 只读观看，忽略输入
+        pass
+
+    async def shadow_snapshot(self, event):
+        """发送会话信息和当前输出快照"""
+        self.snapshot_timer.cancel()
+        self.offset = event['offset']
+        self.size = (event['cols'], event['rows'])
+        await self.send(text_data=json.dumps({
+            'type': 'session',
+            'username': event['username'],
+            'host': event['host'],
+            'cols': event['cols'],
+            'rows': event['rows'],
+        }))
+        if event['data']:
+            await self.send(bytes_data=event['data'])
+
+    async def shadow_output(self, event):
+        """发送实时输出，跳过快照中已包含的部分"""
+        if self.offset is None:
+            return
+        size = (event['cols'], event['rows'])
+        if size != self.size:
+            self.size = size
+            await self.send(text_data=json.dumps({'type': 'resize', 'cols': size[0], 'rows': size[1]}))
+
+        data, end = event['data'], event['end']
+        skip = self.offset - (end - len(data))
+        if skip < len(data):
+            await self.send(bytes_data=data[max(skip, 0):])
+            self.offset = end
+
+    async def shadow_denied(self, event):
+        """会话拒绝观看"""
+        self.snapshot_timer.cancel()
+        await self.channel_layer.group_discard(watch_group(self.shadow_id), self.channel_name)
+        await self.send(text_data=json.dumps({'type': 'error', 'message': '没有权限观看该会话'}))
+        await self.close()
+        logger.warning(f"用户 {self.user.username} 无权观看终端会话 {self.shadow_id}")
+
+    async def session_not_found(self):
+        """会话未返回快照"""
+        await self.send(text_data=json.dumps({'type': 'error', 'message': '会话不存在或已结束'}))
+        await self.close()
+
+    async def shadow_end(self, event):
+        """会话已结束"""
+        await self.send(text_data=json.dumps({'type': 'end'}))
+        await self.close()
@@ -1,9 +1,13 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import status, serializers
 from apps.models import SystemSettings, User
 from django.db.models import Q
 
+# 系统设置序列化器，用于验证需要校验取值的设置项
+class SystemSettingsSerializer(serializers.Serializer):
+    terminal_output_rate_limit = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+
 class SystemSettingsView(APIView):
     def get(self, request):
         settings = SystemSettings.objects.first()
@@ -35,9 +39,15 @@ class SystemSettingsView(APIView):
             'mfa_enabled': mfa_status,
             'disabled_mfa_users': disabled_mfa_users,
             'multi_login_accounts': settings.multi_login_account.split(',') if settings.multi_login_account else [],
+            'terminal_output_rate_limit': settings.terminal_output_rate_limit,
         })
     
     def post(self, request):
+        serializer = SystemSettingsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        validated_data = serializer.validated_data
+
         settings = SystemSettings.objects.first()
         if not settings:
             settings = SystemSettings.objects.create()
@@ -53,6 +63,8 @@ class SystemSettingsView(APIView):
         settings.ip_whitelist = request.data.get('ip_whitelist', settings.ip_whitelist)
         settings.ip_blacklist = request.data.get('ip_blacklist', settings.ip_blacklist)
         settings.multi_login_account = ','.join(request.data.get('multi_login_accounts', []))
+        if 'terminal_output_rate_limit' in validated_data:
+            settings.terminal_output_rate_limit = validated_data['terminal_output_rate_limit'] or 0
         settings.save()
         
         return Response({'message': '设置已更新'}, status=status.HTTP_200_OK) 
\ No newline at end of file
@@ -0,0 +1,42 @@
+from apps.utils import APIView, Response, status, CustomTokenAuthentication, IsAuthenticated, user_is_admin
+from apps.ssh_utils.session_registry import session_registry
+from apps.ssh_utils.ssh_connector import transport_pool
+from apps.ssh_utils.command_log_writer import command_log_writer
+from apps.ssh_utils.idle_reaper import idle_reaper
+from apps.ssh_utils.session_bootstrap import get_cache_stats
+from apps.ssh_utils.session_resume import resumable_sessions
+from apps.ssh_utils.key_cache import pkey_cache
+from apps.alert_utils.alert_rule_cache import alert_rule_cache
+from apps.alert_utils.alert_dispatcher import alert_dispatcher
+
+class TerminalSessionStatsView(APIView):
+    """
+    TerminalSessionStatsView 类返回当前进程内终端会话及相关组件的统计信息，
+    各项的含义见对应组件的 get_stats；非管理员只能看到自己的会话，不返回全局统计
+    """
+    authentication_classes = [CustomTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        处理GET请求，返回会话统计列表
+        """
+        sessions = session_registry.snapshot()
+        if not user_is_admin(request.user):
+            sessions = [session for session in sessions if session.get('username') == request.user.username]
+            return Response({
+                'count': len(sessions),
+                'results': sessions,
+            }, status=status.HTTP_200_OK)
+        return Response({
+            'count': len(sessions),
+            'idle_tracked': idle_reaper.count(),
+            'detached': resumable_sessions.detached_count(),
+            'results': sessions,
+            'transport_pool': transport_pool.get_stats(),
+            'command_log_writer': command_log_writer.get_stats(),
+            'bootstrap_cache': get_cache_stats(),
+            'pkey_cache': {'hits': pkey_cache.hits, 'misses': pkey_cache.misses},
+            'alert_rule_cache': alert_rule_cache.get_stats(),
+            'alert_dispatcher': alert_dispatcher.get_stats()
+        }, status=status.HTTP_200_OK)
@@ -18,6 +18,7 @@ class UserCreateSerializer(serializers.Serializer):
     )
     status = serializers.BooleanField()
     mfa_level = serializers.IntegerField(default=0)
+    terminal_idle_timeout = serializers.IntegerField(required=False, allow_null=True, min_value=1)
 
     def validate_status(self, value):
         # 将 True 转换为 0，将 False 转换为 1
@@ -41,6 +42,7 @@ class UserUpdateSerializer(serializers.Serializer):
     
     status = serializers.BooleanField(required=False)  # 设置为可选字段
     mfa_level = serializers.IntegerField(default=0)
+    terminal_idle_timeout = serializers.IntegerField(required=False, allow_null=True, min_value=1)
 
     def validate_status(self, value):
         # 将 True 转换为 0，将 False 转换为 1
@@ -129,6 +131,7 @@ class UserListView(APIView):
                 'status': user.status,
                 'create_time': user.create_time,
                 'mfa_level': user.mfa_level,
+                'terminal_idle_timeout': user.terminal_idle_timeout,
             })
 
         # 返回分页后的响应数据
@@ -174,6 +177,7 @@ class UserDetailView(APIView):
                 'status': user.status,
                 'create_time': user.create_time,
                 'mfa_level': user.mfa_level,
+                'terminal_idle_timeout': user.terminal_idle_timeout,
                 'last_login': user.login_time,  # 添加最后登录时间
             }
             return Response(user_data, status=status.HTTP_200_OK)
@@ -303,7 +307,8 @@ class CreateUserView(APIView):
                     password=make_password(validated_data['password']),
                     email=validated_data['email'],
                     status=validated_data['status'],
-                    mfa_level=validated_data['mfa_level']  # 只设置 mfa_level
+                    mfa_level=validated_data['mfa_level'],  # 只设置 mfa_level
+                    terminal_idle_timeout=validated_data.get('terminal_idle_timeout')
                 )
                 
                 # 分配角色和权限
@@ -337,6 +342,8 @@ class UserUpdateView(APIView):
                 user.mobile = validated_data['mobile']
                 user.email = validated_data['email']
                 user.mfa_level = validated_data['mfa_level']  
+                if 'terminal_idle_timeout' in validated_data:
+                    user.terminal_idle_timeout = validated_data['terminal_idle_timeout']
 
                 # 如果MFA等级设置为0（关闭），清空otp_secret_key
                 if validated_data['mfa_level'] == 0:
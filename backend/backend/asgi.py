@@ -9,6 +9,10 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 django_application = get_asgi_application()
 
+# 启动告警分发线程，处理上次退出时未发送完的告警
+from apps.alert_utils.alert_dispatcher import alert_dispatcher
+alert_dispatcher.start()
+
 application = ProtocolTypeRouter({
     "http": django_application,
     "websocket": AuthMiddlewareStack(
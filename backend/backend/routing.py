@@ -7,8 +7,14 @@ from apps.views.consumers import SSHConsumer
 
 from apps.views.file_transfer_consumer import FileTransferConsumer
 
+from apps.views.session_shadow_consumer import SessionShadowConsumer
+
+from apps.views.batch_command_consumer import BatchCommandConsumer
+
 websocket_urlpatterns = [
     path('ws/ssh/<str:host_id>/', SSHConsumer.as_asgi()),  # SSH 连接的 WebSocket 路由
     # path('ws/guacamole/<str:host_id>/', GuacamoleConsumer.as_asgi()),
     path('ws/file_transfer/<str:transfer_id>/', FileTransferConsumer.as_asgi()),
+    path('ws/shadow/<str:shadow_id>/', SessionShadowConsumer.as_asgi()),  # 只读观看终端会话
+    path('ws/batch_command/', BatchCommandConsumer.as_asgi()),  # 批量命令执行
 ]
\ No newline at end of file
@@ -175,6 +175,36 @@ if not os.path.exists(log_path):
 COMMAND_ALERT = {
     'ENABLED': True,
     'LOG_LEVEL': 'WARNING',
+    'RULE_CHANNEL': 'command_alert_rules',  # 告警规则变更通知的 Redis 频道，各进程收到后重新加载规则
+    'RULE_REFRESH_INTERVAL': 300,  # 告警规则定期重新加载的间隔(秒)，Redis 通知丢失时兜底
+    'PATTERN_TIMEOUT': 0.05,  # 模糊匹配正则每次执行的时间预算(秒)，超时的正则结果为无法确定
+    'PATTERN_DEGRADE_SECONDS': 600,  # 超时的正则降级的时间(秒)，期间不再执行，结果为无法确定
+    'BLOCK_ECHO_TIMEOUT': 0.5,  # 回车前的输入尚未回显时，检查阻断规则前最多等待回显的时间(秒)
+}
+
+# 告警分发队列配置，告警通知通过 Redis 流由后台线程发送，终端会话只负责入队
+ALERT_DISPATCH = {
+    'STREAM': 'alert_dispatch:stream',  # 待处理任务的 Redis 流
+    'GROUP': 'alert_dispatch',  # 分发线程的消费组
+    'RETRY_KEY': 'alert_dispatch:retry',  # 等待重试的任务
+    'DEAD_LETTER_STREAM': 'alert_dispatch:dead',  # 最终失败的任务
+    'WORKERS': 4,  # 每个进程的分发线程数
+    'MAX_ATTEMPTS': 5,  # 单条通知最多尝试次数，之后写入死信
+    'BACKOFF_BASE': 5,  # 第一次重试的等待时间(秒)，之后每次翻倍
+    'BACKOFF_MAX': 300,  # 重试等待时间上限(秒)
+    'CLAIM_IDLE': 60,  # 未确认任务空闲超过该时间(秒)后由其他分发线程接管，需大于 TIMEOUT
+    'STREAM_MAXLEN': 100000,  # 告警流最大长度
+    'DEAD_LETTER_MAXLEN': 10000,  # 死信流最大长度
+    'TIMEOUT': 10,  # 单次 Webhook 请求超时(秒)
+    'LOCAL_MAX': 10000,  # Redis 不可用时进程内最多保留的任务数
+    'POOL_CONNECTIONS': 10,  # Webhook 连接池缓存的域名数
+    'POOL_MAXSIZE': 8,  # 每个域名保持的连接数，不小于 WORKERS
+    'BREAKER_THRESHOLD': 5,  # Webhook 连续失败该次数后熔断
+    'BREAKER_COOLDOWN': 60,  # 熔断后的冷却时间(秒)，之后放行一个探测请求
+    'AGGREGATE_PREFIX': 'alert_dispatch:aggregate',  # 告警聚合窗口计数的 Redis 键前缀
+    'AGGREGATE_SAMPLES': 5,  # 聚合窗口内保留的重复命令示例数
+    'JOB_STATE_PREFIX': 'alert_dispatch:job',  # 告警任务已记录的告警历史ID的 Redis 键前缀，任务重试时复用
+    'JOB_STATE_TTL': 86400,  # 告警任务执行状态的保留时间(秒)，需大于任务所有重试的总等待时间
 }
 
 LOGGING = {
@@ -259,3 +289,60 @@ FILE_TRANSFER = {
     'PROGRESS_UPDATE_INTERVAL': 2,  # 每2%更新一次进度
     'TIMEOUT': SESSION_TIMEOUT_MINUTES * 60,  # 使用会话超时时间作为传输超时时间(秒)
 }
+
+# Web 终端相关配置
+SSH_TERMINAL = {
+    'OUTPUT_FLUSH_INTERVAL': 0.005,  # 输出合并窗口(秒)，窗口内的连续输出合并为一帧发送
+    'OUTPUT_FLUSH_BYTES': 64 * 1024,  # 单帧最大合并字节数，达到后立即发送
+    'OUTPUT_HIGH_WATER_MARK': 1024 * 1024,  # 客户端未确认输出超过该值时暂停读取 SSH 通道
+    'OUTPUT_LOW_WATER_MARK': 256 * 1024,  # 客户端未确认输出低于该值时恢复读取
+    'CONNECT_WORKERS': 32,  # SSH 握手线程池大小，握手不在事件循环中执行
+    'IDLE_TIMEOUT': SESSION_TIMEOUT_MINUTES * 60,  # 默认空闲超时(秒)，用户或主机可单独配置
+    'BOOTSTRAP_CACHE_TTL': 10,  # 建立终端时用户、主机和凭据查询结果的缓存时间(秒)，0 表示不缓存
+    'PKEY_CACHE_TTL': 600,  # 已解析私钥的缓存时间(秒)，加密私钥每次解析约需 100ms CPU，0 表示不缓存
+    'INPUT_CHUNK_SIZE': 32 * 1024,  # 单次写入 SSH 通道的最大输入字节数
+    'INPUT_BUFFER_LIMIT': 4 * 1024 * 1024,  # SSH 窗口已满时最多暂存的输入字节数，超出的输入丢弃
+    'RESUME_GRACE_PERIOD': 120,  # WebSocket 异常断开后保留 SSH 会话等待恢复的时间(秒)，0 表示不保留
+    'SCROLLBACK_BYTES': 512 * 1024,  # 每个会话保留的最近输出字节数，用于断线恢复补发和观看者的快照
+    'SHADOW_MAX_PENDING': 1024 * 1024,  # 发给观看者的输出最多积压的字节数，超出的丢弃
+}
+
+# SSH 连接池配置，终端和文件管理共享已认证的连接
+SSH_TRANSPORT_POOL = {
+    'IDLE_TIMEOUT': 300,  # 空闲连接保留时间(秒)
+    'MAX_CHANNELS_PER_TRANSPORT': 4,  # 单条连接最多同时借出的客户端数（OpenSSH 默认 MaxSessions 为 10）
+    'MAX_CHANNELS_PER_HOST': 32,  # 单台主机最多同时借出的客户端数
+    'HEALTH_CHECK_INTERVAL': 30,  # 复用空闲超过该时间(秒)的连接前先做存活探测
+}
+
+# 批量命令执行配置，同一条命令并发在多台主机上执行，结果按主机完成顺序推送
+BATCH_COMMAND = {
+    'WORKERS': 64,  # 批量执行线程池大小，进程内所有批量任务共享
+    'DEFAULT_CONCURRENCY': 20,  # 单个批量任务默认同时执行的主机数
+    'MAX_CONCURRENCY': 50,  # 单个批量任务最多同时执行的主机数
+    'DEFAULT_TIMEOUT': 60,  # 单台主机默认超时时间(秒)，包括连接和执行
+    'MAX_TIMEOUT': 600,  # 单台主机最大超时时间(秒)
+    'MAX_OUTPUT_BYTES': 64 * 1024,  # 单台主机 stdout 和 stderr 各自保留的最大字节数
+    'MAX_HOSTS': 1000,  # 单个批量任务最多的主机数
+}
+
+# 命令日志批量写入配置，终端会话的命令日志先入队，再批量写入数据库
+COMMAND_LOG_WRITER = {
+    'BATCH_SIZE': 200,  # 单次批量写入的最大条数
+    'FLUSH_INTERVAL': 1.0,  # 日志入队后最长等待时间(秒)
+    'MAX_QUEUE': 10000,  # 队列最大长度，写入跟不上时丢弃新日志并计数，不阻塞会话
+    'MAX_RETRIES': 3,  # 批量写入连续失败多少次后改为逐条写入，逐条写入失败的日志丢弃
+}
+
+# 终端会话录像配置，录像为 asciicast v2 格式的分段压缩文件
+SESSION_RECORDING = {
+    'ENABLED': True,  # 是否录制终端会话
+    'DIR': str(BASE_DIR / 'recordings'),  # 录像存储目录，按日期分子目录
+    'SEGMENT_SECONDS': 30,  # 分段最长时间(秒)，同时也是回放定位的最大粒度
+    'SEGMENT_BYTES': 1024 * 1024,  # 分段最大未压缩字节数
+    'COMPRESS_LEVEL': 6,  # gzip 压缩级别
+    'WRITER_WORKERS': 4,  # 录像写入线程池大小
+    'MAX_AGE_DAYS': 180,  # 录像保留天数，0 表示不按时间清理
+    'MAX_TOTAL_BYTES': 50 * 1024 ** 3,  # 录像文件总大小上限，超出时从最早的录像开始删除，0 表示不限制
+    'CLEANUP_INTERVAL': 3600,  # 每个进程自动清理录像的最小间隔(秒)，由新会话开始录像时触发
+}
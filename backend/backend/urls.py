@@ -1,5 +1,5 @@
 from django.urls import path
-from apps.views import LoginView, MFABindView, UserListView, RolesPermissionsView, CreateUserView, UserUpdateView, LoginLogView, UserDetailView, OperationLogView, LockRecordView, CredentialView, DomainMonitorView, HostView, CredentialSelectionView, TestConnectionView, NodeSelectionView, get_tree_structure,FileListView, FileUploadView, FileDownloadView, CommandLogView, AlertContactView, CommandAlertView, AlertContactList, HostListView, AssetNodesView, dashboard_statistics, login_statistics, LogoutView, FileDownloadContentView, AlertHistoryLogView
+from apps.views import LoginView, MFABindView, UserListView, RolesPermissionsView, CreateUserView, UserUpdateView, LoginLogView, UserDetailView, OperationLogView, LockRecordView, CredentialView, DomainMonitorView, HostView, CredentialSelectionView, TestConnectionView, NodeSelectionView, get_tree_structure,FileListView, FileUploadView, FileDownloadView, CommandLogView, AlertContactView, CommandAlertView, AlertContactList, HostListView, AssetNodesView, dashboard_statistics, login_statistics, LogoutView, FileDownloadContentView, AlertHistoryLogView, TerminalSessionStatsView, SessionRecordingView, SessionRecordingPlaybackView
 from apps.views.system_settings import SystemSettingsView
 
 urlpatterns = [
@@ -39,6 +39,9 @@ urlpatterns = [
     path('api/terminal/files/<str:host_id>/', FileListView.as_view()),
     path('api/terminal/upload/<str:host_id>/', FileUploadView.as_view()),
     path('api/terminal/download/<str:host_id>/', FileDownloadView.as_view()),
+    path('api/terminal/sessions/stats/', TerminalSessionStatsView.as_view(), name='terminal-session-stats'),
+    path('api/terminal/recordings/', SessionRecordingView.as_view(), name='session-recording-list'),
+    path('api/terminal/recordings/<uuid:pk>/playback/', SessionRecordingPlaybackView.as_view(), name='session-recording-playback'),
     path('api/command_logs/', CommandLogView.as_view(), name='command_logs'),
     path('api/alert_contacts/', AlertContactView.as_view(), name='alert_contacts-list'),
     path('api/alert_contacts/create/', AlertContactView.as_view(), name='alert_contacts-create'),